@@ -1,6 +1,10 @@
 from app.src.app import create_app, db
 from app.src.models import User, Course
-import json
+from app.src.utils.quizSubmit import import_responses
+from app.src.utils.pointsLedger import openPointsLedger, rebuildPointsTotals
+from app.src.utils.pointsRollup import rollupPoints
+from app.src.utils.calculateRankings import getLeaderboardRegistry
+import click
 
 # To run the app, type "flask --app run_app.py run" into the terminal
 app = create_app()
@@ -10,21 +14,39 @@ def clear_db_command():
     if input("The database will be fully cleared. Are you sure? (y/n): ").lower() == "y":
         db.drop_all()
         db.create_all()
-
-        try:
-            # Pulling json data from "responses.json"
-            with open("../json/responses.json", "w") as f:
-                json.dump({}, f)
-
-        except IOError:
-            print("responses.json file not found, creating new response.json")
-            with open("../json/responses.json", "x") as f:
-                json.dump({}, f)
                 
         print("Database cleared.")
     else:
         print("Canceled command.")
 
+# Moves the quiz submissions saved in the old responses.json file into the database; type "flask --app run_app.py import-submissions" to run it
+@app.cli.command("import-submissions")
+@click.argument("path", default="../json/responses.json")
+def import_submissions_command(path):
+    print(f"Imported {import_responses(path)} quiz submissions.")
+
+# Recomputes every user's points from the points ledger; type "flask --app run_app.py rebuild-points" to run it
+# (databases that had points before the ledger was added need "flask --app run_app.py open-points-ledger" to be run once first)
+@app.cli.command("rebuild-points")
+def rebuild_points_command():
+    print(f"Rebuilt the points of {rebuildPointsTotals()} users.")
+
+@app.cli.command("open-points-ledger")
+def open_points_ledger_command():
+    print(f"Added opening balances for {openPointsLedger()} users.")
+
+# Rolls the points ledger up into the weekly and monthly leaderboard totals right away, instead of waiting for the background rollup
+@app.cli.command("rollup-points")
+def rollup_points_command():
+    print(f"Rolled up {rollupPoints()} points ledger entries.")
+
+# Saves a snapshot of the leaderboard for workers to start from (to LEADERBOARD_SNAPSHOT_PATH, unless another path is given); running this every so often
+# (e.g. from cron) keeps the catch-up from the points ledger short when a worker restarts
+@app.cli.command("save-leaderboard-snapshot")
+@click.argument("path", required=False)
+def save_leaderboard_snapshot_command(path):
+    print(f"Saved a {getLeaderboardRegistry().saveSnapshot(path)} byte leaderboard snapshot.")
+
 @app.shell_context_processor
 def make_shell_context():
     return {'db': db, 'User': User, 'Course': Course}
@@ -8,6 +8,10 @@ from .main import main as main_blueprint
 from .routes import routes as routes_blueprint
 from .lesson_api import api as api_blueprint
 from .utils.quizSubmit import quiz_api as quiz_blueprint
+from .utils.identityCache import loadAccount
+from .utils.pointsRollup import initPointsRollup
+from .utils.calculateRankings import initSharedLeaderboard
+from .utils.passwordHashing import getPasswordHasher, PasswordHasherBusyError
 from dotenv import load_dotenv
 from sqlalchemy import desc
 import os
@@ -50,22 +54,27 @@ def create_app(test_config=None):
     def index():          
         return redirect(url_for('home'))
     
+    # Sign-ins and registrations that arrive while the password hashing pool is full are turned away at once (see utils/passwordHashing.py)
+    @app.errorhandler(PasswordHasherBusyError)
+    def password_hasher_busy(error):
+        app.logger.warning("Password hashing pool is full (%s)", getPasswordHasher().stats())
+        return "503: Too many sign-ins at once, please try again in a moment", 503, {"Retry-After": "1"}
+
     @login_manager.user_loader
     def load_user(user_id):
-        # Check both User and Teacher tables for the user_id
-        user = User.query.get(int(user_id))
-        teacher = Teacher.query.get(int(user_id))
-        # Return the user or teacher, depending on the login type from session
-        if session["login_type"] == "teacher":
-            return teacher
-        elif session["login_type"] == "student":
-            return user
-        else:
-            return None
+        # Only the table of the login type from session is checked (User for students, Teacher for teachers), and recently
+        # loaded accounts are served from the identity cache without a query
+        return loadAccount(session.get("login_type"), int(user_id))
 
 
     with app.app_context():
         db.create_all()
         load_database()
 
+    # Keeps the weekly and monthly leaderboard totals rolled up from the points ledger in the background
+    initPointsRollup(app)
+
+    # Has one worker publish the global leaderboard to shared memory for every worker to read, if LEADERBOARD_SHARED_PATH is set
+    initSharedLeaderboard(app)
+
     return app
\ No newline at end of file
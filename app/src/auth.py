@@ -3,6 +3,8 @@ from .models import User, db, GradeEnum, UserProgress, Points, Teacher
 from flask_login import login_user, current_user
 from .utils.passwordStrength import check_password_strength
 from .utils.calculateAge import calculate_age
+from .utils.identityCache import getCurrentRole
+from .utils.passwordHashing import getPasswordHasher, PasswordHasherBusyError
 import re
 
 # Create authentication blueprint for handling relevant routes (signup, login, logout, etc.)
@@ -18,10 +20,7 @@ def login():
         session['login_type'] = None
 
     if current_user.is_authenticated:  # already logged in
-        studentCheck = User.query.filter_by(email=current_user.email).first()
-        teacherCheck = Teacher.query.filter_by(email=current_user.email).first()
-        
-        if teacherCheck and not studentCheck:
+        if getCurrentRole() == "teacher":
             return redirect(url_for('main.teacher_page'))
         else:
             return redirect(url_for('main.dashboard_page'))
@@ -70,6 +69,14 @@ def login_post():
     if account.failed_signin_attempts <= 5:
         login_user(account, remember=remember)
         account.failed_signin_attempts = 0
+
+        # Hashes made with an old bcrypt cost are upgraded while the password is at hand; if the hashing pool is busy, it's left for the next login
+        if getPasswordHasher().needsRehash(account.hashed_password):
+            try:
+                account.set_password(password)
+            except PasswordHasherBusyError:
+                pass
+
         db.session.commit()
         flash('Successfully logged in! Redirecting to dashboard...', 'login_success')
         if isinstance(account, User):
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, abort
 from .models import Lesson, db
+from .utils.contentCache import getContentCache
 
 # Create a Blueprint for the API
 api = Blueprint("api", __name__)
@@ -7,23 +8,27 @@ api = Blueprint("api", __name__)
 # Define an API endpoint for retrieving lesson information
 @api.route("/api/lesson/<int:lesson_id>", methods=["GET"])
 def get_lesson(lesson_id):
-    # Attempt to retrieve the lesson with the given ID
-    lesson = Lesson.query.get(lesson_id)
+    # Lesson payloads are served from the content cache until course content changes
+    lesson_data = getContentCache().get("lesson", lesson_id, lambda: build_lesson_data(lesson_id))
 
     # Check if the lesson was found
-    if lesson:
-        # If the lesson exists, create a dictionary with relevant information
-        lesson_data = {
-            "id": lesson.id,
-            "level": lesson.level,
-            "active": lesson.active,
-            "summary": lesson.summary,
-            "learning_objective": lesson.learning_objective,
-            "content": lesson.lesson_content
-        }
+    if lesson_data:
         # Return the lesson data as a JSON response
         return jsonify(lesson_data)
     else:
         # If the lesson was not found, return a 404 error with a description
         abort(404, description="Not found")
 
+# Creates a dictionary with the relevant information of a lesson, or None if no lesson exists with the given ID
+def build_lesson_data(lesson_id):
+    lesson = db.session.get(Lesson, lesson_id)
+
+    if lesson is None:
+        return None
+
+    return {
+        "id": lesson.id,
+        "title": lesson.title,
+        "learning_objective": lesson.learning_objective,
+        "content": lesson.lesson_content
+    }
@@ -2,25 +2,29 @@ from flask import Blueprint, session, render_template, url_for, redirect, reques
 from flask_login import login_required, current_user, logout_user
 from functools import reduce
 from .models import *
+from .utils.calculateRankings import getLeaderboard, UserDoesNotExistError
+from .utils.identityCache import getCurrentRole
+from .utils.contentCache import getContentCache, snapshot
+from .utils.dashboardSnapshot import getDashboardSnapshot
+from .routes import encode_leaderboard_cursor, course_leaderboard_error
 from sqlalchemy import or_
 
 main = Blueprint('main', __name__)
 
 # Call this function to get a dict of common user data that should always be sent to the front-end
 def returnLoggedInData() -> dict:
-    # Assuming that registration is implemented correctly and user should only be one of two roles, we check for
-    # which role table they exist within
-    studentCheck = User.query.filter_by(email=current_user.email).first()
-    teacherCheck = Teacher.query.filter_by(email=current_user.email).first()
+    # The user loader only loads accounts from the table of the logged-in role, so the role comes straight from
+    # current_user (remembered for the rest of the request) instead of checking which role table the email exists within
+    isTeacher = getCurrentRole() == "teacher"
     
     output = {
         "name": current_user.name, 
         "age": current_user.age,
         "username": current_user.username,
         "email": current_user.email,
-        "grade": None if teacherCheck and not studentCheck else current_user.grade.value,
+        "grade": None if isTeacher else current_user.grade.value,
         "current_user": current_user, 
-        "role": "Teacher" if teacherCheck and not studentCheck else "Student",
+        "role": "Teacher" if isTeacher else "Student",
         "logged_in": True
     }
 
@@ -38,32 +42,51 @@ def profile():
         **loggedInUser    # Unpack all dict key-value pairs here
     )
     
+# Loads a course's modules, the topics of each module (keyed by module ID) and the lessons of each topic (keyed by topic ID), in one query per level
+# of the course tree no matter how many modules and topics the course has
+def load_course_outline(course_id):
+    modules = Module.query.filter_by(course_id=course_id).order_by(Module.id).all()
+    topics = {module.id: [] for module in modules}
+    lessons = {}
+
+    if topics:
+        for topic in Topic.query.filter(Topic.module_id.in_(list(topics))).order_by(Topic.id):
+            topics[topic.module_id].append(topic)
+            lessons[topic.id] = []
+
+    if lessons:
+        for lesson in Lesson.query.filter(Lesson.topic_id.in_(list(lessons))).order_by(Lesson.id):
+            lessons[lesson.topic_id].append(lesson)
+
+    return modules, topics, lessons
+
+# Builds the template variables of a course's lesson page, as plain dicts so that they can be kept in the content cache
+def build_course_outline(course_id):
+    modules, topics, lessons = load_course_outline(course_id)
+
+    return {
+        "course": snapshot(db.session.get(Course, course_id)),
+        "modules": [snapshot(module) for module in modules],
+        "topics": {module_id: [snapshot(topic) for topic in module_topics] for module_id, module_topics in topics.items()},
+        "lessons": {topic_id: [snapshot(lesson) for lesson in topic_lessons] for topic_id, topic_lessons in lessons.items()},
+        # Send in number of topics for a course to display on lessons page, easier to compute here than accessing dict values with Jinja2
+        "number_topics": sum(len(module_topics) for module_topics in topics.values())
+    }
+
 @main.route('/lesson/<int:course_id>')
 @login_required
 def lesson_page(course_id):
     loggedInUser: dict = returnLoggedInData()
-    course = Course.query.get(course_id)
 
     # TODO: set up a conditional (like below in quiz_page) and an algorithm that parses 
     #       through course structure + lesson content and sends two dictionaries in a particular 
     #       format over to front-end, where it can be processed to generate an appropriate tab 
     #       structure and panel contents.
 
-    modules = Module.query.filter_by(course_id=course_id).all()
-
-    topics = {}
-    for module in modules:
-        topics[module.id] = Topic.query.filter_by(module_id=module.id).all()
+    # The outline only changes when course content does, so it's served from the content cache (no database queries) until then
+    outline = getContentCache().get("course_outline", course_id, lambda: build_course_outline(course_id))
 
-    # Send in number of topics for a course to display on lessons page, easier to compute here than accessing dict values with Jinja2
-    number_topics = sum(len(module_topics) for module_topics in topics.values())
-
-    lessons = {}
-    for module_topics in topics.values():
-        for topic in module_topics:
-            lessons[topic.id] = Lesson.query.filter_by(topic_id=topic.id).all()
-
-    return render_template('lesson.html', show_footer=True, course=course, modules=modules, topics=topics, number_topics=number_topics, lessons=lessons, **loggedInUser)
+    return render_template('lesson.html', show_footer=True, **outline, **loggedInUser)
 
 @main.route('/quiz/<int:quiz_id>', methods=['GET'])
 @login_required
@@ -238,21 +261,27 @@ def dashboard_page():
     if loggedInUser["role"] == "Teacher":
         return redirect(url_for("main.teacher_page"))
 
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['PER_PAGE']
+    # Points, streak and level progress come from the user's cached snapshot (rebuilt with one query after they change)
+    dashboard = getDashboardSnapshot(current_user.id)
 
-    user_progress = current_user.progress 
-    user_points = current_user.points 
-    leaderboard_data = Points.get_leaderboard()
-    leaderboard_page = User.query.join(Points).order_by(Points.points.desc()).paginate(page=page, per_page=per_page,
-                            error_out=False)
+    # The top of the leaderboard and the users around the current user come from the in-memory leaderboard, instead of loading and sorting the Points table
+    leaderboard = getLeaderboard()
+
+    with leaderboard.lock:
+        leaderboard_data = leaderboard.getUsersByPosition(1, 5)
+
+        try:
+            user_standing = leaderboard.getStandingByUser(current_user.username)
+            leaderboard_neighbours = leaderboard.getNeighboursByUser(current_user.username, 2)
+        except UserDoesNotExistError:
+            user_standing, leaderboard_neighbours = None, []
 
     return render_template(
         'dashboard.html', 
-        user_progress=user_progress, 
-        # leaderboard_data=leaderboard_data,
-        leaderboard_data=leaderboard_page.items,
-        enumerate=enumerate,     # pass Python's enumerate() function to be used within Jinja2
+        dashboard=dashboard, 
+        leaderboard_data=leaderboard_data,
+        user_standing=user_standing,
+        leaderboard_neighbours=leaderboard_neighbours,
         **loggedInUser
     )
 
@@ -267,30 +296,36 @@ def test_dashboard():
 def leaderboard_page():
     loggedInUser = returnLoggedInData()
 
-    page = request.args.get('page', 1, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
     per_page = current_app.config['PER_PAGE']
-    leaderboard_page = User.query.join(Points).order_by(Points.points.desc()).paginate(page=page, per_page=per_page,
-                            error_out=False)
-    leaderboard_data=leaderboard_page.items
+    course_id = request.args.get('course_id', type=int)
+
+    error = course_leaderboard_error(course_id)
+    if error:
+        return error
+
+    # Page slices and the current user's ranking are answered from the in-memory leaderboard (of a single course, if course_id is given) instead of sorting the Points table
+    leaderboard = getLeaderboard(course_id)
+    leaderboard_data = leaderboard.getUsersByPosition((page - 1) * per_page + 1, per_page)
+    has_next = page * per_page < leaderboard.getUserCount()
 
-    user_ranking = None
-    user_points = Points.query.filter_by(user_id=current_user.id).first()
+    # leaderboard.js scrolls on from the last user of this page with keyset cursors (see /api/leaderboard)
+    next_cursor = encode_leaderboard_cursor(leaderboard.getKeyByPosition(page * per_page)) if has_next else None
 
-    if user_points:
-        user_ids = User.query.with_entities(User.id)
-        user_ranking = Points.query.filter(Points.points > user_points.points).count() + Points.query.filter(Points.points == user_points.points).filter(Points.user_id < current_user.id, Points.user_id.in_(user_ids)).count() + 1
+    try:
+        user_ranking = leaderboard.getPositionByUser(current_user.username)
+    except UserDoesNotExistError:
+        user_ranking = None     # Teachers and users without points aren't ranked
 
-        print(current_user.id)
     # Add dummy spots to fill up the leaderboard, if there's less than 6 users and only one page
-    if not leaderboard_page.has_next and page == 1 and len(leaderboard_data) < 7:
+    if not has_next and page == 1 and len(leaderboard_data) < 7:
         prev_length = len(leaderboard_data)
 
         for i in range(7 - prev_length):
             leaderboard_data.append({
+                "rank": prev_length + i + 1,
                 "username": "---", 
-                "points": {
-                    "points": "---"
-                }
+                "points": "---"
             })
 
     return render_template(
@@ -298,8 +333,10 @@ def leaderboard_page():
         leaderboard_data=leaderboard_data, 
         user_ranking=user_ranking,
         current_page=page,
-        has_next=leaderboard_page.has_next,
-        next_page=page + 1 if leaderboard_page.has_next else None,
+        has_next=has_next,
+        next_page=page + 1 if has_next else None,
+        next_cursor=next_cursor,
+        course_id=course_id,
         **loggedInUser
     )
 
@@ -0,0 +1,38 @@
+"""add indexes for the leaderboard, course outline and quiz queries
+
+Revision ID: 5c3e9a7d2b41
+Revises: 0919b4726e38
+Create Date: 2026-10-18 11:02:37.512094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c3e9a7d2b41'
+down_revision = '0919b4726e38'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns); databases built with db.create_all() since these were added to models.py already have them, hence if_not_exists
+INDEXES = [
+    ('ix_points_user_points', 'points', ['user_id', 'points']),
+    ('ix_points_points_user', 'points', [sa.text('points DESC'), 'user_id']),
+    ('ix_user_course_course_user', 'user_course', ['course_id', 'user_id']),
+    ('ix_module_course_id', 'module', ['course_id']),
+    ('ix_topic_module_id', 'topic', ['module_id']),
+    ('ix_lesson_topic_id', 'lesson', ['topic_id']),
+    ('ix_quiz_question_quiz_id', 'quiz_question', ['quiz_id']),
+    ('ix_quiz_answer_quiz_question', 'quiz_answer', ['quiz_id', 'quiz_question_id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,34 @@
+"""one Points row per user, so that points awards can upsert on user_id
+
+Revision ID: 8d4b6f2a1c93
+Revises: 5c3e9a7d2b41
+Create Date: 2026-10-18 16:20:41.208315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b6f2a1c93'
+down_revision = '5c3e9a7d2b41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Users that already have several rows get them merged into their first one (the row awards have been read from and added to), holding the sum of
+    # their points, so that no points are lost; the subqueries go through derived tables, since MySQL can't otherwise read the table being changed
+    op.execute(sa.text(
+        'UPDATE points SET points = (SELECT total FROM (SELECT user_id, SUM(COALESCE(points, 0)) AS total FROM points GROUP BY user_id) AS totals '
+        'WHERE totals.user_id = points.user_id) '
+        'WHERE id IN (SELECT id FROM (SELECT MIN(id) AS id FROM points GROUP BY user_id HAVING COUNT(*) > 1) AS merged)'
+    ))
+    op.execute(sa.text(
+        'DELETE FROM points WHERE id NOT IN (SELECT id FROM (SELECT MIN(id) AS id FROM points GROUP BY user_id) AS kept)'
+    ))
+    op.create_index('uq_points_user_id', 'points', ['user_id'], unique=True, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('uq_points_user_id', table_name='points', if_exists=True)
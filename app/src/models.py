@@ -5,6 +5,7 @@ from sqlalchemy import CheckConstraint, func, ForeignKey
 from datetime import datetime, timezone, timedelta
 from flask_bcrypt import Bcrypt
 from flask_login import UserMixin
+from .utils.passwordHashing import hashPassword, checkPassword
 
 bcrypt = Bcrypt()
 db = SQLAlchemy()
@@ -56,7 +57,9 @@ of user-specific interactions at the topic level.
 user_course = db.Table(
     'user_course',
     db.Column('user_id', db.Integer, ForeignKey('user.id'), primary_key=True),
-    db.Column('course_id', db.Integer, ForeignKey('course.id'), primary_key=True)
+    db.Column('course_id', db.Integer, ForeignKey('course.id'), primary_key=True),
+    # The primary key only serves lookups by user; course leaderboards look users up by course
+    db.Index('ix_user_course_course_user', 'course_id', 'user_id')
 )
 
 user_module = db.Table(
@@ -124,12 +127,12 @@ class Teacher(UserMixin, db.Model):
     courses = db.relationship('Course', secondary=teacher_course, backref='teachers')
     modules = db.relationship('Module', secondary=teacher_module, backref='teachers')
     topics = db.relationship('Topic', secondary=teacher_topic, backref='teachers')
-        # Set teacher password
+        # Set teacher password (hashed on the password hashing pool, see utils/passwordHashing.py)
     def set_password(self, password):
-        self.hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.hashed_password = hashPassword(password)
     # Check if entered password is correct
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.hashed_password, password)
+        return checkPassword(self.hashed_password, password)
     def get_role(self):
         return "teacher" # new method to check type of user
 
@@ -155,13 +158,13 @@ class User(UserMixin, db.Model):
     topics = db.relationship('Topic', secondary=user_topic, backref='users')
     # ^^^ Added new relationships between user and courses/modules/topics
     
-    # Set user password
+    # Set user password (hashed on the password hashing pool, see utils/passwordHashing.py)
     def set_password(self, password):
-        self.hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.hashed_password = hashPassword(password)
     
     # Check if entered password is correct
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.hashed_password, password)
+        return checkPassword(self.hashed_password, password)
 
     def get_role(self):
         return "student" # new method to check type of user
@@ -171,13 +174,59 @@ class Points(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     # establish relationship between 'points' and 'user' model, indicates the points are associated w/ a specific user 
     user_id = db.Column(db.Integer, ForeignKey('user.id'), nullable=False)
-    points = db.Column(db.Integer, default=0) # add index=True into points attribute to speed up points retrieval for queries?
+    points = db.Column(db.Integer, default=0)
     # user = db.relationship('User', uselist=False, backref='user_points') 
+
+    # One row per user (awards upsert on it, see utils/pointsLedger.py); (user_id, points) finds a user's points and covers the leaderboard's join of 
+    # User and Points; (points DESC, user_id) lists users in leaderboard order (ties broken by user) without sorting
+    __table_args__ = (
+        db.Index('uq_points_user_id', 'user_id', unique=True),
+        db.Index('ix_points_user_points', 'user_id', 'points'),
+        db.Index('ix_points_points_user', points.desc(), 'user_id'),
+    )
     
     @classmethod
     def get_leaderboard(cls):
         return cls.query.order_by(cls.points.desc()).all()
 
+# Points Ledger (append-only; one row per points award, so that the totals in Points can always be rebuilt from it)
+class PointsEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, ForeignKey('user.id'), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)          # may be negative
+    reason = db.Column(db.String(50), nullable=False)       # e.g. "quiz", "manual", "opening_balance"
+    source_id = db.Column(db.Integer, nullable=True)        # what the points were awarded for, e.g. the QuizSubmission ID for "quiz"
+    created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        db.Index('ix_points_event_user_created', 'user_id', 'created_at'),
+    )
+
+# Points of each user within one leaderboard window (a calendar week starting on Monday, or a calendar month), rolled up from PointsEvent
+# in the background by utils/pointsRollup.py
+class PointsWindowTotal(db.Model):
+    window = db.Column(db.String(10), primary_key=True)     # "week" or "month"
+    window_start = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, ForeignKey('user.id'), primary_key=True)
+    points = db.Column(db.Integer, nullable=False, default=0)
+
+# How far through the ledger the rollup has got (a single row); every PointsEvent up to last_event_id is counted in PointsWindowTotal
+class PointsRollupState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    rolled_up_at = db.Column(db.DateTime, nullable=True)
+
+# Ledger entries counted by the rollup among the last ROLLUP_OVERLAP IDs up to last_event_id (see utils/pointsRollup.py); entries in that range that 
+# aren't listed here committed after higher IDs had been rolled up, and are counted by the next run
+class PointsRollupEvent(db.Model):
+    event_id = db.Column(db.Integer, primary_key=True)
+
+# Counts the changes to the global leaderboard that don't leave a points ledger entry (users added, renamed or removed, totals edited or rebuilt), so that 
+# the worker publishing the shared leaderboard can tell it has to re-sync (a single row; see utils/calculateRankings.py)
+class LeaderboardState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
 # Helper table to join User and Badges into many-to-many relationship
 user_badge = db.Table(
     'user_badge',
@@ -300,7 +349,7 @@ class Course(db.Model):
 class Module(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    course_id = db.Column(db.Integer, ForeignKey('course.id'), nullable=False)
+    course_id = db.Column(db.Integer, ForeignKey('course.id'), nullable=False, index=True)
     topics = db.relationship('Topic', backref='module', lazy='dynamic')
     # users = db.relationship('User', secondary=user_module, backref='modules', lazy='dynamic')
     # teacher = db.relationship('Teacher', secondary=teacher_module, backref='modules', lazy='dynamic')
@@ -309,7 +358,7 @@ class Module(db.Model):
 class Topic(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    module_id = db.Column(db.Integer, ForeignKey('module.id'), nullable=False)
+    module_id = db.Column(db.Integer, ForeignKey('module.id'), nullable=False, index=True)
     quiz_id = db.Column(db.Integer, ForeignKey('quiz.id'), nullable=True)
     lesson_id = db.Column(db.Integer, ForeignKey('lesson.id'), nullable=True)
     # users = db.relationship('User', secondary=user_topic, backref='topics', lazy='dynamic')
@@ -369,7 +418,7 @@ class Lesson(Activity):
     practice_content = db.Column(db.Text)
     users = db.relationship('User', secondary=user_lesson, backref='lessons')
     teacher = db.relationship('Teacher', secondary=teacher_lesson, backref='lessons')
-    topic_id = db.Column(db.Integer, ForeignKey('topic.id'), nullable=True)
+    topic_id = db.Column(db.Integer, ForeignKey('topic.id'), nullable=True, index=True)
     # ^ Establish relationship where each unique lesson is a part of a single topic.
 
     __mapper_args__ = {
@@ -394,7 +443,7 @@ class Quiz(Activity):
 # Quiz Questions
 class QuizQuestion(db.Model):
     id = db.Column(db.Integer, primary_key=True) # id for identify quiz question
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False) # identify which quiz the question belongs to
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False, index=True) # identify which quiz the question belongs to
     question_content = db.Column(db.Text, nullable=False)
 
 # Quiz Answers
@@ -405,6 +454,41 @@ class QuizAnswer(db.Model):
     correct = db.Column(db.Boolean, nullable=False)
     answer_content = db.Column(db.Text, nullable=False)
 
+    # Answers are looked up by quiz, or by quiz and question
+    __table_args__ = (
+        db.Index('ix_quiz_answer_quiz_question', 'quiz_id', 'quiz_question_id'),
+    )
+
+# Quiz Submissions (one row per attempt at a quiz, written once when the attempt is submitted; replaces the old ../json/responses.json file)
+class QuizSubmission(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, ForeignKey('user.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, ForeignKey('quiz.id'), nullable=True)   # None for quizzes from questions.json, which are identified by module/topic number instead
+    module_number = db.Column(db.Integer, nullable=True)
+    topic_number = db.Column(db.Integer, nullable=True)
+    submitted_at = db.Column(db.DateTime, nullable=False, default=func.now())
+    score = db.Column(db.Integer, nullable=False)           # number of questions answered correctly
+    num_questions = db.Column(db.Integer, nullable=False)
+    points_awarded = db.Column(db.Integer, nullable=False, default=0)
+    answers = db.relationship('QuizSubmissionAnswer', backref='submission', cascade='all, delete-orphan', order_by='QuizSubmissionAnswer.question_number')
+
+    # A user's submissions (optionally for a single quiz) are looked up in order of submission time, as are all submissions of a quiz (e.g. for exports)
+    __table_args__ = (
+        db.Index('ix_quiz_submission_user_quiz_submitted', 'user_id', 'quiz_id', 'submitted_at'),
+        db.Index('ix_quiz_submission_quiz_submitted', 'quiz_id', 'submitted_at'),
+    )
+
+# The user's answer to each question of a quiz submission
+class QuizSubmissionAnswer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    submission_id = db.Column(db.Integer, ForeignKey('quiz_submission.id'), nullable=False, index=True)
+    question_number = db.Column(db.Integer, nullable=False)
+    quiz_question_id = db.Column(db.Integer, ForeignKey('quiz_question.id'), nullable=True)  # Only set for quizzes stored in the database
+    quiz_answer_id = db.Column(db.Integer, ForeignKey('quiz_answer.id'), nullable=True)      # The selected answer (None if the question was left unanswered)
+    question_content = db.Column(db.Text, nullable=False)
+    user_answer = db.Column(db.Text, nullable=True)
+    correct = db.Column(db.Boolean, nullable=False)
+
 # User Progress to display on dashboard 
 # Redundant because of points model?? FIX AFTER!!
 class UserProgress(db.Model):
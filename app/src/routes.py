@@ -1,5 +1,12 @@
+import binascii
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 from flask import Blueprint, jsonify, request, current_app
 from .models import * 
+from .utils.calculateRankings import getLeaderboard, UserDoesNotExistError
+from .utils.pointsRollup import getWindowLeaderboard, WINDOWS
+from .utils.pointsLedger import awardPoints, awardPointsBatch
+from .utils.identityCache import getCurrentRole
+from .utils.dashboardSnapshot import getDashboardSnapshot
 from flask_login import login_required, current_user
 from sqlalchemy import or_, and_
 
@@ -155,45 +162,60 @@ def change_user_points():
     # This is for the POST request; not necessary to include for the GET request
     points : int = request.form.get("num_points", default=0)
 
+    # Teachers don't have points, and their IDs come from another table (awarding by their ID would credit the student with the same ID)
+    if getCurrentRole() != "student":
+        return "404: User not found", 404
+
     match (request.method):
         case "POST":
             points_to_add: int = request.form.get("num_points", type=int, default=100)
-            points_obj = current_user.points
-
-            if points_obj is None:
-                # Create a new Points object if one doesn't exist
-                points_obj = Points(points=points_to_add, user=current_user)
-                db.session.add(points_obj)
-            else:
-                # Add to the existing points if the Points object exists
-                points_obj.points += points_to_add
 
+            # Added by the database itself (creating a new Points object if one doesn't exist), so that concurrent awards are never lost
+            total_points: int = awardPoints(current_user.id, points_to_add, "manual")
             db.session.commit()
 
             return jsonify({
                 "message": "Successfully updated current user's points!",
-                "total_points": points_obj.points
+                "total_points": total_points
             }), 200
 
         case "GET":
-            # Functionality for receiving a user's points info
-            points = current_user.points
-            user = current_user
-            
-            if user.points:
-                user_points = user.points.points
-            else:
-                user_points = 0
+            # Functionality for receiving a user's points info (polled by the dashboard and leaderboard pages, so it's served from the user's cached dashboard snapshot)
+            dashboard = getDashboardSnapshot(current_user.id)
     
             return jsonify({
-                'streak': user.streak,
-                'points': user_points
+                'streak': dashboard.streak,
+                'points': dashboard.points
             }), 200
 
         
         case _:
             return "400: Bad request", 400
         
+# Route for awarding points to many users at once (teachers only), e.g. {"awards": [{"user_id": 1, "points": 50, "reason": "badge"}, ...]}
+@routes.route("/points/batch", methods=["POST"])
+@login_required
+def award_points_batch():
+    if getCurrentRole() != "teacher":
+        return "403: Forbidden", 403
+
+    try:
+        awards = [
+            (int(award["user_id"]), int(award["points"]), str(award.get("reason", "teacher"))[:50], None) for award in request.get_json()["awards"]
+        ]
+    except (TypeError, KeyError, ValueError):
+        return "400: Bad request", 400
+
+    user_ids = {user_id for user_id, _, _, _ in awards}
+    if db.session.query(User.id).filter(User.id.in_(user_ids)).count() != len(user_ids):
+        return "404: User not found", 404
+
+    # All of the awards are applied with a single UPDATE statement
+    totals = awardPointsBatch(awards)
+    db.session.commit()
+
+    return jsonify({"totals": {str(user_id): total for user_id, total in totals.items()}}), 200
+
 # Route related to a collection of quizzes        
 @routes.route("/quizzes", methods=["GET"])   
 @login_required
@@ -233,26 +255,26 @@ def get_quizzes():
     else:
         quiz_list = Quiz.query.all()
 
+    quiz_ids = [quiz.id for quiz in quiz_list]
+    questions_by_quiz = {quiz_id: [] for quiz_id in quiz_ids}
+    answers_by_question = {}
+
+    # Fetch the questions and answers of every selected quiz in two queries (instead of two per quiz), grouping them by id in one pass each
+    if quiz_ids:
+        for answer in QuizAnswer.query.filter(QuizAnswer.quiz_id.in_(quiz_ids)).order_by(QuizAnswer.id):
+            answers_by_question.setdefault(answer.quiz_question_id, []).append({"answer_id" : answer.id, 
+                                                                              "answer_content" : answer.answer_content, 
+                                                                              "answer_correct" : answer.correct})
+
+        for question in QuizQuestion.query.filter(QuizQuestion.quiz_id.in_(quiz_ids)).order_by(QuizQuestion.id):
+            questions_by_quiz[question.quiz_id].append({"question_id" : question.id, 
+                                                        "question_content" : question.question_content,
+                                                        "question_answers" : answers_by_question.get(question.id, [])})
+
     output_list = []
 
     # Compile all quizzes into JSON format specified above within a list
     for quiz in quiz_list:
-        # quiz = Quiz.query.filter(and_(Quiz.users.any(User.id == current_user.id), Quiz.id == quiz_ID)).first_or_404()
-        
-        quiz_questions = QuizQuestion.query.filter_by(quiz_id=quiz.id).all()
-        quiz_answers = QuizAnswer.query.filter_by(quiz_id=quiz.id).all()
-        
-        quiz_q_output = [{ "question_id" : question.id, 
-                        "question_content" : question.question_content} for question in quiz_questions]
-        
-        for question in quiz_q_output:
-            related_answers = [answer for answer in quiz_answers if (answer.quiz_question_id == question["question_id"])]
-            quiz_a_output = [{"answer_id" : answer.id, 
-                            "answer_content" : answer.answer_content, 
-                            "answer_correct" : answer.correct} for answer in related_answers]
-            
-            question["question_answers"] = quiz_a_output
-
         outputQuiz = {
             "id" : quiz.id,        
             "title" : quiz.title,
@@ -262,7 +284,7 @@ def get_quizzes():
             "is_active" : quiz.active,
             "level" : quiz.level,
             "score" : quiz.score,
-            "questions" : quiz_q_output
+            "questions" : questions_by_quiz[quiz.id]
         }
 
         output_list.append(outputQuiz)
@@ -375,31 +397,127 @@ def modify_user_lesson():
         case _:
             return "400: Bad request", 400
         
+# Course leaderboards are only shown for courses that exist, to the students enrolled in them and to teachers; returns the error response to send
+# otherwise (None if the leaderboard can be shown, including the global one, when course_id is None)
+def course_leaderboard_error(course_id):
+    if course_id is None:
+        return None
+
+    if db.session.get(Course, course_id) is None:
+        return "404: Course not found", 404
+
+    if getCurrentRole() != "teacher" and db.session.query(user_course).filter_by(user_id=current_user.id, course_id=course_id).first() is None:
+        return "403: Forbidden", 403
+
+    return None
+
 @routes.route('/api/leaderboard', methods=['GET'])
 @login_required
 def leaderboard_api():
     # Return JSON response to dynamically view more users on leaderboard page
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['PER_PAGE']
+    course_id = request.args.get('course_id', type=int)
+    window = request.args.get('window', 'all')
+
+    if window not in ('all',) + WINDOWS:
+        return "400: Bad request", 400
+
+    error = course_leaderboard_error(course_id)
+    if error:
+        return error
+
+    # retrieve the next users from the in-memory leaderboard (of a single course, if course_id is given; of this week or month only, if window is given,
+    # which is built from the rolled up window totals); an out-of-range page just returns an empty list instead of a 404 error
+    leaderboard = getWindowLeaderboard(window, course_id)
+
+    # With a cursor (an empty one for the first page), pages are fetched by seeking to the (points, user ID) of the last user on the previous page, so
+    # infinite scrolling costs the same at any depth and doesn't repeat or skip users whose points change in between
+    if 'cursor' in request.args:
+        try:
+            key = decode_leaderboard_cursor(request.args['cursor'])
+        except ValueError:
+            return "400: Bad request", 400
+
+        with leaderboard.lock:
+            entries, last_key = leaderboard.getUsersAfterKey(key, per_page)
+            total_users = leaderboard.getUserCount()
 
-    # retrieve the next users from leaderboard, set error_out to False so that the application does not return a 404 error when there are no remaining users
-    leaderboard_page = User.query.join(Points).order_by(Points.points.desc()).paginate(page=page, per_page=per_page,
-                            error_out=False)
+        has_next = bool(entries) and entries[-1]['rank'] < total_users
+
+        return jsonify({
+            'leaderboard': [serialize_leaderboard_entry(entry) for entry in entries],
+            'has_next': has_next,
+            'next_cursor': encode_leaderboard_cursor(last_key) if has_next else None,
+            'total_users': total_users
+        })
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    total_users = leaderboard.getUserCount()
+    has_next = page * per_page < total_users
 
     response = {
-        'leaderboard': [
-            {
-                'rank': (page - 1) * per_page + i + 1,
-                'username': user.username,
-                'points': user.points
-            } for i, user in enumerate(leaderboard_page.items)
-        ],
+        'leaderboard': [serialize_leaderboard_entry(entry) for entry in leaderboard.getUsersByPosition((page - 1) * per_page + 1, per_page)],
         # check if there is another page of users when sending the JSON response
-        'has_next': leaderboard_page.has_next,
-        'next_page': page + 1 if leaderboard_page.has_next else None,
-        'has_prev': leaderboard_page.has_prev,
-        'prev_page': page + 1 if leaderboard_page.has_prev else None,
-        'total_users': leaderboard_page.total
+        'has_next': has_next,
+        'next_page': page + 1 if has_next else None,
+        'has_prev': page > 1,
+        'prev_page': page - 1 if page > 1 else None,
+        'total_users': total_users
     }
 
-    return jsonify(response)
\ No newline at end of file
+    return jsonify(response)
+
+def serialize_leaderboard_entry(entry):
+    return {
+        'rank': entry['rank'],
+        'username': entry['username'],
+        'points': entry['points']
+    }
+
+# Leaderboard cursors hold the (points, user ID) key of the last user on a page, as "<points>,<user ID>"
+def encode_leaderboard_cursor(key):
+    return urlsafe_b64encode(f"{key[0]},{key[1]}".encode()).decode()
+
+def decode_leaderboard_cursor(cursor):
+    if not cursor:
+        return None
+
+    try:
+        points, _, user_id = urlsafe_b64decode(cursor.encode()).decode().partition(",")
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Malformed cursor")
+
+    return int(points), int(user_id)
+
+# The most users that /api/leaderboard/me returns on either side of the current user
+MAX_LEADERBOARD_NEIGHBOURS = 25
+
+@routes.route('/api/leaderboard/me', methods=['GET'])
+@login_required
+def leaderboard_standing_api():
+    # Return the current user's rank, position and percentile, plus the k users right above and below them (e.g. for the dashboard)
+    k = min(max(request.args.get('k', 2, type=int), 0), MAX_LEADERBOARD_NEIGHBOURS)
+    course_id = request.args.get('course_id', type=int)
+    window = request.args.get('window', 'all')
+
+    if window not in ('all',) + WINDOWS:
+        return "400: Bad request", 400
+
+    error = course_leaderboard_error(course_id)
+    if error:
+        return error
+
+    leaderboard = getWindowLeaderboard(window, course_id)
+
+    try:
+        with leaderboard.lock:      # Both answers come from the same state of the leaderboard
+            standing = leaderboard.getStandingByUser(current_user.username)
+            neighbours = leaderboard.getNeighboursByUser(current_user.username, k)
+    except UserDoesNotExistError:
+        # Teachers and users without points aren't ranked
+        return jsonify({'standing': None, 'neighbours': []})
+
+    return jsonify({
+        'standing': standing,
+        'neighbours': [serialize_leaderboard_entry(entry) for entry in neighbours]
+    })
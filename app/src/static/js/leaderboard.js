@@ -1,35 +1,67 @@
-let currentPage = 1;
-const pageSize = 8;
+// Infinite scrolling for the leaderboard table: the first page is rendered by the server, and every following page is fetched from /api/leaderboard
+// with the cursor of the last user shown, so each fetch costs the same however far down the leaderboard it is.
+const tableBody = document.getElementById('table-body');
+let nextCursor = tableBody.dataset.nextCursor;
+let loading = false;
 
-function fetchLeaderBoard(page) {
-    fetch('/leaderboard')
+function fetchNextPage() {
+    if (!nextCursor || loading) {
+        return;
+    }
+
+    loading = true;
+    const params = new URLSearchParams({ cursor: nextCursor });
+
+    if (tableBody.dataset.courseId) {
+        params.set('course_id', tableBody.dataset.courseId);
+    }
+
+    fetch(`/api/leaderboard?${params}`)
         .then(response => {
             return response.json();
         })
         .then(data => {
-            renderLeaderboard(data);
+            renderLeaderboard(data.leaderboard);
+            nextCursor = data.next_cursor;
+
+            if (!nextCursor) {
+                observer.disconnect();
+            }
         })
-        .catch(error => console.log(error));
+        .catch(error => console.log(error))
+        .finally(() => {
+            loading = false;
+        });
 }
 
-function renderLeaderboard(data) {
-    const tableBody = document.getElementById('table-body');
-    tableBody.innerHTML = '';
-
-    data.slice(0,8).forEach((entry, index) => {
-        const tableRow = `
-            <tr class="table-entry" id="rank-${(currentPage - 1) * pageSize + index + 1}">
-                <td class="entry-ranking">${(currentPage - 1) * pageSize + index + 1}</td>
-                <td class="entry-username">${entry.username}</td>
-                <td class="entry-points">${entry.points}</td>
-            </tr>`;
-        tableBody.innerHTML += tableRow;
+function renderLeaderboard(entries) {
+    entries.forEach(entry => {
+        const tableRow = document.createElement('tr');
+        tableRow.className = 'table-entry';
+        tableRow.id = `rank-${entry.rank}`;
+
+        [`#${entry.rank}`, entry.username, entry.points].forEach((value, index) => {
+            const cell = document.createElement('td');
+            cell.className = ['entry-ranking', 'entry-username', 'entry-points'][index];
+            cell.textContent = value;
+            tableRow.appendChild(cell);
+        });
+
+        tableBody.appendChild(tableRow);
     });
 }
 
-function loadNextPage() {
-    currentPage++;
-    fetchLeaderBoard(currentPage);
-}
+// Fetch the next page whenever the end of the table scrolls into view
+const sentinel = document.createElement('div');
+sentinel.id = 'leaderboard-end';
+document.getElementById('leaderboard-table-div').appendChild(sentinel);
 
-fetchLeaderBoard(currentPage);
\ No newline at end of file
+const observer = new IntersectionObserver(observedEntries => {
+    if (observedEntries.some(entry => entry.isIntersecting)) {
+        fetchNextPage();
+    }
+}, { rootMargin: '200px' });
+
+if (nextCursor) {
+    observer.observe(sentinel);
+}
@@ -1,5 +1,5 @@
 # calculateRankings.py - uses certain algorithms and data structures to sort and organize member points in the order to be displayed on the leaderboard
-# None of this ever ended up getting used... rip :(
+# The process-wide instances returned by getLeaderboard() back /leaderboard and /api/leaderboard
 
 """
 Plan:
@@ -20,7 +20,8 @@ Usage of the main Leaderboard class (export just this class from the file):
         Updates the given leaderboard object with a new query of all database users, or a new one with all users within a specific course (if the leaderboard was created
         with a course ID integer). Users added to the database will be added to the rankings, while users deleted from the database will be removed from the rankings with
         the rankings adjusted accordingly. Users whose points data is changed (e.g. `userA` points rise from 57 -> 83; `userB` points fall from 69 -> 42) will also be 
-        altered accordingly within the leaderboard.
+        altered accordingly within the leaderboard. The differences are found with one query and applied as PointsDelta objects (see applyDeltas() below), so only
+        users that actually changed touch the rankings. Day-to-day changes don't need this at all, as they are pushed in as they're committed.
 
         (...One possible oversight in this update function is if the user's name is somehow changed, since the queries only filter by username and points; therefore, 
         the leaderboard won't contain updated information on that specific user's name. Support should be added within the query comparisons if such a feature is added
@@ -59,174 +60,344 @@ Usage of the main Leaderboard class (export just this class from the file):
     - Leaderboard.getUsersByRankRange(topRank: int, bottomRank: int) -> dict:
         Returns a dictionary in the same format above from Leaderboard.getAllUsers(), but instead limited to users from topRank up to bottomRank (inclusive).
         Note that the arguments must be passed such that topRank is smaller than bottomRank, topRank & bottomRank are at least 1, and topRank & bottomRank are less than
-        or equal to the rank of the user with the least amount of points (to check, use Leaderboard.getBottomRankNum() to get this rank number).
+        or equal to the rank of the user with the least amount of points (to check, use Leaderboard.getBottomRankNum() to get this rank number). The rankings are 
+        walked once from topRank, so this runs in O(log n + k) for k ranks.
+
+    - Leaderboard.iterUsersByRankRange(topRank: int = 1, bottomRank: int = None, chunkSize: int = 500):
+        Generator variant of getUsersByRankRange() for exports, yielding (rank, list[dict]) pairs from topRank down to bottomRank (or the bottom of the leaderboard).
+        Ranks are fetched <chunkSize> at a time, so the leaderboard is only locked while each chunk is read and memory use doesn't grow with the export size.
+
+    - Leaderboard.getUserCount() -> int:
+        Returns the number of users currently stored in the leaderboard.
+
+    - Leaderboard.getPositionByUser(username: str) -> int:
+        Unlike getRankByUser(), returns the position of the user in the listing shown on the leaderboard page, where users with the same points are ordered by user ID
+        (so every user has a unique position). Runs in O(log n). If no user exists with the given username, a UserDoesNotExistError exception is thrown.
+
+    - Leaderboard.getStandingByUser(username: str) -> dict:
+        Returns {"rank", "position", "points", "percentile", "total_users"} for a user, where the percentile is the percentage of users with fewer points (users
+        with the same points count as half below). Runs in O(log n), from the user and tie counts kept in the rankings' nodes.
+
+    - Leaderboard.getNeighboursByUser(username: str, k: int) -> list[dict]:
+        Returns the user together with up to <k> users right above and below them in the leaderboard listing, in the same format as getUsersByPosition(). 
+        Runs in O(log n + k).
+
+    - Leaderboard.getUsersByPosition(start: int, count: int) -> list[dict]:
+        Returns up to <count> users from the leaderboard listing, starting at position <start> (1-indexed). Each entry also contains the user's "rank" (position), which 
+        is what the leaderboard pages display. Runs in O(log n + count).
+
+    - Leaderboard.getUsersAfterKey(key: tuple, count: int) -> tuple[list[dict], tuple]:
+        Keyset variant of getUsersByPosition(): returns up to <count> users that come after the (points, user ID) key (from the top, if key is None), along with 
+        the key of the last one, to pass in for the next page. Runs in O(log n + count) however deep the page is, and pages don't repeat or skip users when
+        points change in between. Leaderboard.getKeyByPosition(position) returns the key of the user at a position.
+
+    - Leaderboard.updateUser(userID: int, name: str, username: str, points: int):
+        Inserts a user into the leaderboard, or moves an existing user to their new points total (one delete + insert on the rankings).
+
+    - Leaderboard.removeUser(username: str):
+        Removes a user from both the hash table and the rankings. If no user exists with the given username, a UserDoesNotExistError exception is thrown.
+
+    - Leaderboard.applyDeltas(deltas: list[PointsDelta]):
+        Applies a list of points changes, each recording (user, old points, new points), in order. A delta with no old points adds the user, and a delta with no new
+        points removes the user. The cost is proportional to the number of deltas, not the number of users in the leaderboard.
+
+Usage of the process-wide leaderboards (getLeaderboard() and LeaderboardRegistry):
+    - getLeaderboard(courseID: optional int) -> Leaderboard:
+        Returns the leaderboard of all users for the current Flask app (or of the users enrolled in the given course), building it from the database on first use. 
+        The instances are kept by a LeaderboardRegistry in app.extensions and live for the lifetime of the process, so page views never have to sort the Points table.
+
+    - getLeaderboardRegistry() -> LeaderboardRegistry:
+        Returns the registry itself. Course leaderboards ("shards") are built lazily, and LeaderboardRegistry.loadShards(courseIDs) builds the shards of several
+        courses from one query grouped by course. Shards are kept in least-recently-used order, and once their estimated size goes over 
+        app.config["LEADERBOARD_SHARD_MEMORY_BUDGET"] bytes (64 MiB by default), the idle ones are dropped and rebuilt the next time they're asked for.
+        LeaderboardRegistry.getRankByUser(username, courseID) and LeaderboardRegistry.getPositionByUser(username, courseID) answer from the course's shard.
+
+    - Warm restarts: with app.config["LEADERBOARD_SNAPSHOT_PATH"] set, the global leaderboard is loaded from a binary snapshot of its users (read through a
+      memory map, see leaderboardSnapshot.py), then caught up with Leaderboard.catchUp() from the points ledger entries written since the snapshot's
+      high-water mark. A snapshot is saved whenever the leaderboard has to be built from the database instead, and 
+      LeaderboardRegistry.saveSnapshot() (or "flask --app run_app.py save-leaderboard-snapshot") saves a fresh one, keeping the catch-up short.
+
+    - Sharing between worker processes: with app.config["LEADERBOARD_SHARED_PATH"] set, one worker (whichever holds the lock file next to that path) 
+      publishes the global leaderboard to a memory-mapped file whenever it changes (see sharedRankings.py and initSharedLeaderboard()), and 
+      getLeaderboard() returns a SharedLeaderboard reading that file in every worker, instead of each worker keeping its own copy. Every worker then 
+      answers with the same ranks, lagging behind committed changes by up to LEADERBOARD_SHARED_INTERVAL seconds. Course shards stay per-process.
+
+    - Rank engines: each leaderboard keeps its rankings in a RankEngine, either a PointsTree (red-black tree) or a FenwickRankEngine (Fenwick trees over
+      points buckets), picked when it's built by chooseRankEngine() from its number of users and range of points. app.config["LEADERBOARD_RANK_ENGINE"]
+      ("auto" by default, "tree" or "fenwick") overrides the choice for every leaderboard; "python -m benchmarks.bench_rankings" compares them.
+
+    - Every write to Points.points made through db.session (the /user_points route, quiz submissions, registration, etc.) is recorded as a PointsDelta when the 
+      session flushes, and the deltas are applied to the process-wide leaderboards once the transaction commits (or dropped if it rolls back). Course shards take
+      the deltas of the users they hold, and shards of courses whose enrollments changed are dropped so that they are rebuilt. Nothing needs to be called by the 
+      routes themselves.
 
 """
 
 ### Imports ###
+import gc, fcntl
+from abc import ABC, abstractmethod
 from math import ceil
-from enum import Enum
-from app.src.models import User, user_course, Course, Points, db, Subject
-
-### Custom Errors and Enum Classes ###
+from operator import itemgetter
+from itertools import groupby
+from array import array
+from collections import OrderedDict
+from bisect import insort, bisect_left, bisect_right
+from threading import RLock, Event, Thread
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, update, func, distinct, or_
+from app.src.models import User, user_course, Course, Points, PointsEvent, LeaderboardState, db, Subject
+from .leaderboardSnapshot import LeaderboardSnapshot, readLeaderboardSnapshot, writeLeaderboardSnapshot
+from .sharedRankings import SharedRankingStore, SharedRankingsSlot
+
+### Custom Errors and Node Colours ###
 class UserDBError(Exception):
     pass
 
 class UserDoesNotExistError(Exception):
     pass
 
-class RBTreeColour(Enum):
-    BLACK = "black"
-    RED = "red"
+# Node colours for the rankings R-B tree; plain bools instead of an Enum, since colours are checked on every rotation
+RED: bool = True
+BLACK: bool = False
 
 ### Auxiliary/minor classes used in main leaderboard ###
-# A node part of a linked list, to be stored inside UserHashTable's list
+# A single change to a user's points; oldPoints is None for a user that was just added, and newPoints is None for a user that was removed. Changes made
+# through the points ledger carry the ID of the user's newest ledger entry as their version, since transactions can reach the leaderboard (in their
+# after_commit hooks) in another order than they committed in
+class PointsDelta:
+    def __init__(self, userID, name, username, oldPoints, newPoints, version=None):
+        self.userID: int = userID
+        self.name: str = name
+        self.username: str = username
+        self.oldPoints: int = oldPoints
+        self.newPoints: int = newPoints
+        self.version: int = version
+
+    def __repr__(self) -> str:
+        return f"PointsDelta({self.username}: {self.oldPoints} -> {self.newPoints}, version {self.version})"
+
+# A user's entry on the leaderboard, stored inside UserHashTable and referenced by the rankings
 class UserEntryNode:
-    def __init__(self, name, username, points):
+    # Compact nodes (no per-instance __dict__), since there is one of these for every user on the leaderboard
+    __slots__ = ("name", "username", "points", "userID", "version", "nodeRef")
+
+    def __init__(self, name, username, points, userID=None, version=None):
         self.name: str = name
         self.username: str = username  # Note: based on model, these are unique
         self.points: int = points
+        self.userID: int = userID      # Used to order users with the same points on the leaderboard page
+        self.version: int = version    # Version of the newest PointsDelta applied to the user, if it had one
         self.nodeRef: PointsNode = None
 
-        # Node attributes
-        self.next: UserEntryNode = None
-
     def setPointsTree(self, pointsNode) -> None:
         self.nodeRef = pointsNode
 
 
-# Hash table storing user info, using separate chaining
+_DELETED: object = object()    # Marks a UserHashTable slot whose user was deleted, so that probing carries on past it
+
+# Hash table storing user info, using open addressing (linear probing) over two parallel lists of slots: the usernames, and the UserEntryNodes themselves. 
+# The entries stored are the ones passed in, never copies, so the rankings' references to them stay valid for as long as the users are in the table.
+#
+# Growing doesn't rehash every entry at once: a table of double the capacity is set up, new users go into it, and every later insert or delete moves
+# REHASH_STEP slots of the old table over to it, so no single operation pauses for longer than that. Until the old table is emptied, lookups check both.
 class UserHashTable:
+    REHASH_STEP: int = 16
+    MAX_LOAD: float = 2 / 3    # Used slots (users + deleted markers) / capacity; past it, the table is rehashed
+
     def __init__(self, numElems: int, courseID: int = None):
         self.courseID: int = None  # Optional for if you have leaderboards within classes, remove if not needed
         self.size = 0  # Num of elems current stored within the hash table
-        self.loadFactor = 3  # Average of two elements per self.items entry; load factor here considered as (<# items> / <capacity>) instead of (# of used slots / capacity)
-        self.capacity = ceil(
-            numElems * 1.2
-        )  # Current size of the hash table (1.2 * the size of initially expected elem, for room for more elem; ^ capacity once table filled with average of <loadFactor> items per items entry)
-        self.items = [None] * self.capacity
+        self.usedSlots = 0  # Num of slots of the current table holding a user or a deleted marker
+        self.capacity = self.__getCapacity(numElems)  # Always a power of two, so the hash can be masked into range
+        self.keys: list = [None] * self.capacity
+        self.entries: list = [None] * self.capacity
+
+        # Old table still being moved over (None once it's empty), and the index of its next slot to move
+        self.oldKeys: list = None
+        self.oldEntries: list = None
+        self.rehashIndex: int = 0
+
+    # Smallest power of two that holds <numElems> entries at no more than half load, leaving room for more users
+    def __getCapacity(self, numElems: int) -> int:
+        return 1 << max(3, (2 * numElems).bit_length())
+
+    # Index of a username's slot in the given table, or of the empty slot it would go in; depends on Python's built-in siphash for strings
+    def __findSlot(self, keys: list, username: str) -> int:
+        mask: int = len(keys) - 1
+        index: int = hash(username) & mask
+
+        while True:
+            key = keys[index]
+
+            if key is None or key == username:
+                return index
+
+            index = (index + 1) & mask
+
+    # Returns the lists holding a username's entry and its index in them, or (None, -1) if it isn't in the table
+    def __locate(self, username: str) -> tuple:
+        index: int = self.__findSlot(self.keys, username)
+
+        if self.keys[index] is not None:
+            return self.entries, index
+
+        # Slots of the old table before rehashIndex were moved over already; their usernames are left behind so that probing still follows the same path
+        if self.oldKeys is not None:
+            index = self.__findSlot(self.oldKeys, username)
 
-    # Actual hashing function used; depends on Python's built-in siphash for strings, then modulo's the number to within the range of the data list's capacity
-    def __hashingFunc(self, hashStrKey: str) -> int:
-        return hash(hashStrKey) % self.capacity
+            if self.oldKeys[index] is not None and index >= self.rehashIndex:
+                return self.oldEntries, index
+
+        return None, -1
+
+    # Puts a user known not to be in the table into its empty slot (or the first deleted marker on the way to it) in the current table
+    def __place(self, userEntry: UserEntryNode) -> None:
+        keys: list = self.keys
+        mask: int = self.capacity - 1
+        index: int = hash(userEntry.username) & mask
+
+        while keys[index] is not None and keys[index] is not _DELETED:
+            index = (index + 1) & mask
+
+        if keys[index] is None:
+            self.usedSlots += 1
+
+        keys[index] = userEntry.username
+        self.entries[index] = userEntry
 
     # Insert a new user into the leaderboard OR update a current user's info on the leaderboard (given the same username), returns None if inserting new user or old points (int) if updating current user's points
     def insertUser(self, userEntry: UserEntryNode) -> int:
-        hashKey: str = userEntry.username
-        hashIndex: int = self.__hashingFunc(hashKey)
+        entries, index = self.__locate(userEntry.username)
 
-        # No entry in hash table @ hashIndex yet...
-        if self.items[hashIndex] is None:
-            self.items[hashIndex] = userEntry
-            self.size += 1
+        # Searching for an identical username entry already within the table, if user is already in the leaderboard...
+        if entries is not None:
+            currentNode: UserEntryNode = entries[index]
+            oldPoints = currentNode.points
+            currentNode.name = userEntry.name
+            currentNode.points = userEntry.points
 
-            self.__checkTableLoad()
-        else:  # If there are other nodes within this hashIndex already:
-            currentNode: UserEntryNode = self.items[hashIndex]
+            if currentNode.points != oldPoints:
+                return oldPoints  # Return previous points in order to search through RB tree, delete previous entry, and recalculate rankings
 
-            # Searching for an identical username entry already within this linked list, if user is already in the leaderboard...
-            while currentNode is not None:
-                if currentNode.username == userEntry.username:
-                    oldPoints = currentNode.points
-                    currentNode.name = userEntry.name
-                    currentNode.points = userEntry.points
+            return None  # No change in points; return None
 
-                    if currentNode.points != oldPoints:
-                        return oldPoints  # Return previous points in order to search through RB tree, delete previous entry, and recalculate rankings
+        # User is not in the leaderboard; add them to the current table
+        self.__place(userEntry)
+        self.size += 1
+        self.__checkTableLoad()
 
-                    return None  # No change in points; return None
+        return None
 
-                currentNode = currentNode.next
+    # Fills an empty hash table with user entries whose usernames are known to be unique (e.g. a whole query's worth, when a leaderboard is built), skipping
+    # the search for an existing entry that insertUser() does
+    def buildFromEntries(self, userEntries: list[UserEntryNode]) -> None:
+        # Sized for every user up front, so that the table isn't rehashed part way through
+        if self.usedSlots + len(userEntries) > self.capacity // 2 or self.oldKeys is not None:
+            currentEntries: list[UserEntryNode] = list(self.getAllEntries())
+            self.capacity = self.__getCapacity(self.size + len(userEntries))
+            self.keys, self.entries, self.usedSlots = [None] * self.capacity, [None] * self.capacity, 0
+            self.oldKeys = self.oldEntries = None
 
-            # User is not in the leaderboard; add in new linked list entry in the hash table at specified hash index
-            userEntry.next = self.items[hashIndex]
-            self.items[hashIndex] = userEntry
-            self.size += 1
+            for userEntry in currentEntries:
+                self.__place(userEntry)
 
-            self.__checkTableLoad()
+        keys: list = self.keys
+        entries: list = self.entries
+        mask: int = self.capacity - 1
 
-            return None
+        for userEntry in userEntries:
+            index: int = hash(userEntry.username) & mask
 
-    def deleteUser(self, username: str) -> None:
-        hashIndex: int = self.__hashingFunc(username)
+            while keys[index] is not None:
+                index = (index + 1) & mask
 
-        currentNode: UserEntryNode = self.items[hashIndex]
-        prevNode: UserEntryNode = None
+            keys[index] = userEntry.username
+            entries[index] = userEntry
 
-        while currentNode is not None:
-            if currentNode.username == username:
-                if prevNode is not None:
-                    prevNode.next = currentNode.next
-                else:
-                    self.items[hashIndex] = currentNode.next
+        self.size += len(userEntries)
+        self.usedSlots += len(userEntries)
 
-                self.size -= 1
-                return
+    def deleteUser(self, username: str) -> None:
+        entries, index = self.__locate(username)
 
-            prevNode = currentNode
-            currentNode = currentNode.next
+        if entries is None:
+            raise UserDoesNotExistError(
+                "Cannot delete a user that doesn't exist with this username!"
+            )
 
-        raise UserDoesNotExistError(
-            "Cannot delete a user that doesn't exist with this username!"
-        )
+        # The slot keeps a deleted marker, since users further along its probe sequence are only found by probing through it
+        (self.keys if entries is self.entries else self.oldKeys)[index] = _DELETED
+        entries[index] = None
+        self.size -= 1
+        self.__rehashStep()
 
     def getUser(self, username: str) -> UserEntryNode:
-        hashIndex = self.__hashingFunc(username)
-        currentNode: UserEntryNode = self.items[hashIndex]
+        entries, index = self.__locate(username)
 
-        while currentNode is not None:
-            if currentNode.username == username:
-                return currentNode
+        if entries is None:
+            raise UserDoesNotExistError("The user you're trying to get doesn't exist!")
 
-            currentNode = currentNode.next
+        return entries[index]
 
-        raise UserDoesNotExistError("The user you're trying to get doesn't exist!")
+    # Yields every user entry currently stored in the hash table
+    def getAllEntries(self):
+        for entries in [self.entries, self.oldEntries]:
+            if entries is not None:
+                yield from [userEntry for userEntry in entries if userEntry is not None]
 
-    # Checks if current load factor is still smaller than set upper load factor limit
+    # Starts a rehash once the current table's used slots go over the load limit, or else carries on with the one in progress
     def __checkTableLoad(self) -> None:
-        if (self.size / self.capacity) > self.loadFactor:
+        if self.oldKeys is None and self.usedSlots > self.capacity * self.MAX_LOAD:
             self.__resizeTable()
+        else:
+            self.__rehashStep()
 
-    # Resizes internal list to double the size of the previous list/number of elements in previous list
-    # Note: using a new prime number here for the new size would be ideal, but methods for obtaining it would have less than ideal time complexities and/or space 
-    # complexities in practice alongside the O(n) resizing... (e.g. Sieve of Eratosthenes = O(n * log(log n))) time, and O(sqrt(N)) space for getting prime number N)
+    # Sets up a new table sized for the current number of users (so it doubles as the table fills, and only clears out deleted markers if users were 
+    # mostly deleted), and leaves the current one to be moved over by __rehashStep(). The new table is less than half full once every user is moved over,
+    # and never less than half the old one's size, so the inserts made while the old table's slots are moved (one for every REHASH_STEP slots) can't fill it.
     def __resizeTable(self) -> None:
-        # print("~UserHashTable Debug - resizing table")
-        self.capacity = self.size * 2
+        self.oldKeys, self.oldEntries, self.rehashIndex = self.keys, self.entries, 0
+        self.capacity = max(self.__getCapacity(self.size), len(self.oldKeys) // 2)
+        self.keys, self.entries, self.usedSlots = [None] * self.capacity, [None] * self.capacity, 0
+        self.__rehashStep()
+
+    # Moves the next REHASH_STEP slots' entries of the old table (if there is one) over to the current table. Entries are moved as they are; they aren't copied.
+    def __rehashStep(self) -> None:
+        if self.oldKeys is None:
+            return
 
-        oldItems = self.items.copy()
-        self.items = [None] * self.capacity
+        oldEntries: list = self.oldEntries
+        stop: int = min(self.rehashIndex + self.REHASH_STEP, len(oldEntries))
 
-        for index, linkedList in enumerate(oldItems):
-            if linkedList is None:
-                continue
+        for index in range(self.rehashIndex, stop):
+            userEntry: UserEntryNode = oldEntries[index]
 
-            userEntry: UserEntryNode = linkedList
-            # print(f"linkedlist #{index}")
+            if userEntry is not None:
+                self.__place(userEntry)
+                oldEntries[index] = None
 
-            while userEntry is not None:
-                # print("Inserting ", userEntry.username, "...")
-                nodeCopy = UserEntryNode(userEntry.name, userEntry.username, userEntry.points)
-                self.insertUser(nodeCopy)
-                userEntry = userEntry.next
+        self.rehashIndex = stop
+
+        if stop == len(oldEntries):
+            self.oldKeys = self.oldEntries = None
 
     # For debug... remove in the future once leaderboard is fully integrated with other stuff
     def printContents(self) -> None:
         print("~~ UserHashTable Contents: ~~")
-        for index, linkedList in enumerate(self.items):
-            if linkedList is None:
-                continue
-
-            userEntry: UserEntryNode = linkedList
-            print(f"{index}: [", end="")
+        for index, userEntry in enumerate(self.entries):
+            if userEntry is not None:
+                print(f"{index}: {userEntry.username}")
 
-            while userEntry is not None:
-                print(f"{userEntry.username}, ", end="")
-                userEntry = userEntry.next
-            
-            print("]")
+        if self.oldEntries is not None:
+            print(f"~~ Being rehashed (from slot {self.rehashIndex}): ~~")
+            for index, userEntry in enumerate(self.oldEntries):
+                if userEntry is not None:
+                    print(f"{index}: {userEntry.username}")
 
 class PointsNode:
+    # Compact nodes (no per-instance __dict__), since there is one of these for every distinct points value on the leaderboard
+    __slots__ = ("points", "userEntryRefs", "left", "right", "parent", "numNodes", "numUsers", "colour")
+
     def __init__(self, points, userEntryRef):
         # -- General attributes for binary trees (renamed in the context of the leaderboard) --
         # Node key; if tree is init with length 0, then this is just None
@@ -236,133 +407,258 @@ class PointsNode:
         # -- Red-black tree attributes --
         self.left: PointsNode = None
         self.right: PointsNode = None
-        self.parent: PointsNode = None  # Added in later, mostly used for only deletion
+        self.parent: PointsNode = None
         self.numNodes: int = 1          # Number of nodes within current tree; use this to determine index/ranking of users in nodes
-        self.colour: RBTreeColour = RBTreeColour.RED
+        self.numUsers: int = 1          # Number of users within current tree; use this to determine the position of users on the leaderboard page
+        self.colour: bool = RED
 
-    def addUserEntry(self, userEntry: UserEntryNode) -> None:
+    # Users sharing the same points are kept sorted by user ID, which is the tie-break used for positions on the leaderboard page
+    def addUserEntry(self, userEntry: UserEntryNode) -> bool:
         usernamesRef = [entry.username for entry in self.userEntryRefs]
 
         if userEntry.username in usernamesRef:
             index = usernamesRef.index(userEntry.username)
             self.userEntryRefs[index] = userEntry
-        else:
-            self.userEntryRefs.append(userEntry)
+            return False
+
+        insort(self.userEntryRefs, userEntry, key=_tieBreakKey)
+        return True
+
+    def removeUserEntry(self, username: str) -> None:
+        usernamesRef = [entry.username for entry in self.userEntryRefs]
+        self.userEntryRefs.pop(usernamesRef.index(username))
+
+def _tieBreakKey(userEntry: UserEntryNode):
+    return (userEntry.userID is None, userEntry.userID or 0)
+
+class RankEngine(ABC):
+    """
+    Interface of the structures a Leaderboard keeps its rankings in (Leaderboard.rankings). An engine orders UserEntryNodes by points (most points first) and
+    then by user ID, and answers rank and position queries on them; the users themselves stay in the Leaderboard's UserHashTable. Implementations:
+        - PointsTree: a red-black tree with one node per distinct points value; O(log d) for d distinct values, whatever the values are.
+        - FenwickRankEngine: Fenwick trees over an array of points buckets; O(log S) for a range of S points values, with far smaller constant factors, but 
+          memory proportional to S. Suited to leaderboards whose points are packed into a small range (see chooseRankEngine()).
+
+    Ranks are "dense" (users with the same points share a rank, and the next points value down has the next rank), while positions are the 1-indexed places
+    on the leaderboard page, where every user has their own.
+    """
+    # Adds a user (whose points are in userEntry.points) to the rankings
+    @abstractmethod
+    def insertUser(self, userEntry: UserEntryNode) -> None:
+        ...
+
+    # Removes a user, who must still have the points they were inserted with
+    @abstractmethod
+    def deleteUser(self, userEntry: UserEntryNode) -> None:
+        ...
+
+    # Replaces the rankings' contents with user entries sorted by (points, user ID), in O(n) (plus the engine's own size)
+    @abstractmethod
+    def buildFromSorted(self, userEntries: list[UserEntryNode]) -> None:
+        ...
 
-# Represents a left-leaning red black tree; acts sort of like an "outer shell" of the tree only pointing to the root node of the tree 
-# (successive nodes are accessed through other nodes)
-class PointsTree:
+    @abstractmethod
+    def getUserCount(self) -> int:
+        ...
+
+    # Number of distinct points values, i.e. the rank of the lowest-scoring users
+    @abstractmethod
+    def getDistinctPointsCount(self) -> int:
+        ...
+
+    @abstractmethod
+    def getTopUsers(self) -> list[UserEntryNode]:
+        ...
+
+    @abstractmethod
+    def getBottomUsers(self) -> list[UserEntryNode]:
+        ...
+
+    # Rank of a points value some user has (UserDBError if nobody has it); 0 if the rankings are empty
+    @abstractmethod
+    def getRankByPoints(self, points: int) -> int:
+        ...
+
+    @abstractmethod
+    def getUsersByRank(self, rank: int) -> list[UserEntryNode]:
+        ...
+
+    # Yields (rank, users) for each rank from topRank down to bottomRank (inclusive)
+    @abstractmethod
+    def iterUsersByRankRange(self, topRank: int, bottomRank: int):
+        ...
+
+    # Position on the leaderboard page; engines only need to implement getStandingByUser()
+    def getPositionByUser(self, userEntry: UserEntryNode) -> int:
+        return self.getStandingByUser(userEntry)[0]
+
+    # Returns (position, number of users with more points, number of users with the same points including the user)
+    @abstractmethod
+    def getStandingByUser(self, userEntry: UserEntryNode) -> tuple[int, int, int]:
+        ...
+
+    # Number of users at or before the (points, user ID) key in page order; the key needn't belong to a user in the rankings
+    @abstractmethod
+    def getUsersThroughKey(self, points: int, userID: int) -> int:
+        ...
+
+    # Up to <count> users in page order, starting at position <start>
+    @abstractmethod
+    def getUsersByPosition(self, start: int, count: int) -> list[UserEntryNode]:
+        ...
+
+    # {rank: [{"name", "username", "points"}]} for every rank
+    @abstractmethod
+    def getAllUsers(self) -> dict:
+        ...
+
+# Represents a red-black tree (with parent pointers, so every operation below is iterative and never recurses); acts sort of like an "outer shell" of the tree 
+# only pointing to the root node of the tree (successive nodes are accessed through other nodes)
+class PointsTree(RankEngine):
     def __init__(self):
         self.root: PointsNode = None
 
+    def getUserCount(self) -> int:
+        return self.__userCount(self.root)
+
+    def getDistinctPointsCount(self) -> int:
+        return self.__treeSize(self.root)
+
+    def getTopUsers(self) -> list[UserEntryNode]:
+        return self.getMaxUsers().userEntryRefs
+
+    def getBottomUsers(self) -> list[UserEntryNode]:
+        return self.getMinUsers().userEntryRefs
+
     def __treeSize(self, node: PointsNode) -> int:
         if node is None:
             return 0
 
         return node.numNodes
 
-    def isNodeRed(self, node: PointsNode) -> bool:
+    def __userCount(self, node: PointsNode) -> int:
         if node is None:
-            return False
+            return 0
+
+        return node.numUsers
+
+    def isNodeRed(self, node: PointsNode) -> bool:
+        return node is not None and node.colour
+
+    # Recalculate the subtree counts of a node from its children
+    def __updateCounts(self, node: PointsNode) -> None:
+        left, right = node.left, node.right
+        node.numNodes = (left.numNodes if left else 0) + (right.numNodes if right else 0) + 1
+        node.numUsers = (left.numUsers if left else 0) + (right.numUsers if right else 0) + len(node.userEntryRefs)
+
+    # Replaces the subtree rooted at oldNode with the one rooted at newNode, within oldNode's parent
+    def __replaceChild(self, oldNode: PointsNode, newNode: PointsNode) -> None:
+        parent: PointsNode = oldNode.parent
 
-        return node.colour == RBTreeColour.RED
+        if parent is None:
+            self.root = newNode
+        elif oldNode is parent.left:
+            parent.left = newNode
+        else:
+            parent.right = newNode
+
+        if newNode is not None:
+            newNode.parent = parent
 
-    # Auxiliary functions for maintaining the R-B tree structure of the data
-    def __insertRotateLeft(self, node: PointsNode) -> PointsNode:
+    # Auxiliary functions for maintaining the R-B tree structure of the data; the rotated subtree keeps the same counts, so only the two rotated nodes change
+    def __rotateLeft(self, node: PointsNode) -> None:
         rightNode: PointsNode = node.right
 
         node.right = rightNode.left
         if node.right is not None:
             node.right.parent = node
+
+        self.__replaceChild(node, rightNode)
         rightNode.left = node
-        rightNode.parent = node.parent
         node.parent = rightNode
 
-        rightNode.colour = node.colour
-        node.colour = RBTreeColour.RED
-        node.numNodes = rightNode.numNodes
-        rightNode.numNodes = (
-            self.__treeSize(rightNode.left) + self.__treeSize(rightNode.right) + 1
-        )
+        rightNode.numNodes, rightNode.numUsers = node.numNodes, node.numUsers
+        self.__updateCounts(node)
 
-        return rightNode
-
-    def __insertRotateRight(self, node: PointsNode) -> PointsNode:
+    def __rotateRight(self, node: PointsNode) -> None:
         leftNode: PointsNode = node.left
 
         node.left = leftNode.right
         if node.left is not None:
             node.left.parent = node
+
+        self.__replaceChild(node, leftNode)
         leftNode.right = node
-        leftNode.parent = node.parent
         node.parent = leftNode
 
-        leftNode.colour = node.colour
-        node.colour = RBTreeColour.RED
-        leftNode.numNodes = node.numNodes
-        node.numNodes = self.__treeSize(node.left) + self.__treeSize(node.right) + 1
-
-        return leftNode
+        leftNode.numNodes, leftNode.numUsers = node.numNodes, node.numUsers
+        self.__updateCounts(node)
 
-    def __insertFlipColours(self, node: PointsNode) -> None:
-        node.colour = RBTreeColour.RED
-        node.left.colour = RBTreeColour.BLACK
-        node.right.colour = RBTreeColour.BLACK
-
-    # Given a points key, get list of all users stored in the node with that key
-    def getUsersByPoints(self, points: int) -> list:
-        return self.__getUsersByPointsAux(self.root, points)
+    # Finds the node storing the given points key, or None if no user has that many points
+    def __findNode(self, points: int) -> PointsNode:
+        node: PointsNode = self.root
 
-    def __getUsersByPointsAux(self, node: PointsNode, points: int) -> list:
-        if node is None:
-            return None
+        while node is not None and node.points != points:
+            node = node.right if points > node.points else node.left
 
-        if points > node.points:
-            return self.__getUsersByPointsAux(node.right, points)
+        return node
 
-        if points < node.points:
-            return self.__getUsersByPointsAux(node.left, points)
+    # Adds numNodesDiff/numUsersDiff to the subtree counts of the given node and every node above it
+    def __adjustCountsToRoot(self, node: PointsNode, numNodesDiff: int, numUsersDiff: int) -> None:
+        while node is not None:
+            node.numNodes += numNodesDiff
+            node.numUsers += numUsersDiff
+            node = node.parent
 
-        return node.userEntryRefs
+    # Given a points key, get list of all users stored in the node with that key
+    def getUsersByPoints(self, points: int) -> list:
+        node = self.__findNode(points)
+        return None if node is None else node.userEntryRefs
 
-    # Returns a tuple of the highest-scoring users currently in DB, along with their point count (points, users)
+    # Returns the node of the highest-scoring users currently in DB (use .points and .userEntryRefs to get their point count and users)
     def getMaxUsers(self, subTreeRoot=None) -> PointsNode:
-        if subTreeRoot is None:
-            subTreeRoot = self.root
+        node: PointsNode = self.root if subTreeRoot is None else subTreeRoot
 
-        return self.__getMaxUsersAux(subTreeRoot)
-
-    def __getMaxUsersAux(self, node: PointsNode) -> PointsNode:
         if node is None:
             raise UserDBError(
                 "There are no users stored within the database yet! Register a user first."
             )
 
-        if node.right is None:
-            return node
+        while node.right is not None:
+            node = node.right
 
-        return self.__getMaxUsersAux(node.right)
+        return node
     
-    # Returns a tuple of the lowest-scoring users currently in DB, along with their point count (points, users)
+    # Returns the node of the lowest-scoring users currently in DB (use .points and .userEntryRefs to get their point count and users)
     def getMinUsers(self, subTreeRoot=None) -> PointsNode:
-        if subTreeRoot is None:
-            subTreeRoot = self.root
-        
-        return self.__getMinUsersAux(subTreeRoot)
+        node: PointsNode = self.root if subTreeRoot is None else subTreeRoot
 
-    def __getMinUsersAux(self, node: PointsNode) -> PointsNode:
         if node is None:
             raise UserDBError(
                 "There are no users stored within the database yet! Register a user first."
             )
 
-        if node.left is None:
-            return node
+        while node.left is not None:
+            node = node.left
 
-        return self.__getMinUsersAux(node.left)    
+        return node
 
     # Given a rank (correlated to the position of a node in the tree), find all users within the node whose position corresponds to that rank.
     def getUsersByRank(self, rank: int) -> list[UserEntryNode]:
+        return self.__getNodeByRank(rank).userEntryRefs
+
+    # Walks the rankings once, yielding (rank, users) for each rank from topRank down to bottomRank (inclusive); O(log n) to find topRank, then O(1) amortized per rank
+    def iterUsersByRankRange(self, topRank: int, bottomRank: int):
+        node: PointsNode = self.__getNodeByRank(topRank)
+
+        for rank in range(topRank, bottomRank + 1):
+            if node is None:
+                return
+
+            yield rank, node.userEntryRefs
+            node = self.__nextNodeDown(node)
+
+    def __getNodeByRank(self, rank: int) -> PointsNode:
         if self.root is None or self.__treeSize(self.root) < rank or rank <= 0:
             raise UserDBError(
                 f"The rank <{rank}> is out of range from the number of users currently stored in the leaderboard (<{self.__treeSize(self.root)}>)!"
@@ -382,7 +678,7 @@ class PointsTree:
                 currentNode = currentNode.right
                 tempRank -= self.__treeSize(currentNode.left) + 1
             else:
-                return currentNode.userEntryRefs
+                return currentNode
 
         raise UserDBError(
             "There's an issue with the given rank number or the tree structure (currentNode = None when it wasn't supposed to); further debugging is probably needed."
@@ -415,273 +711,613 @@ class PointsTree:
 
     # Adding a new user entry into rankings red-black tree
     def insertUser(self, userEntry: UserEntryNode) -> None:
-        self.root = self.__insertUserAux(self.root, userEntry)
-        self.root.colour = RBTreeColour.BLACK
+        points: int = userEntry.points
+        parent: PointsNode = None
+        node: PointsNode = self.root
 
-    def __insertUserAux(self, node: PointsNode, userEntry: UserEntryNode) -> PointsNode:
-        # Adding in / modifying values in R-B tree
-        if node is None:
-            newNode = PointsNode(userEntry.points, userEntry)
-            userEntry.setPointsTree(newNode)
-            return newNode
+        # Search for the node with the same points, or the spot the new node should be attached to
+        while node is not None:
+            if points == node.points:
+                if node.addUserEntry(userEntry):
+                    self.__adjustCountsToRoot(node, 0, 1)
 
-        if userEntry.points < node.points:
-            node.left = self.__insertUserAux(node.left, userEntry)
-            node.left.parent = node
+                userEntry.setPointsTree(node)
+                return
 
-        elif userEntry.points > node.points:
-            node.right = self.__insertUserAux(node.right, userEntry)
-            node.right.parent = node
+            parent = node
+            node = node.left if points < node.points else node.right
+
+        newNode = PointsNode(points, userEntry)
+        userEntry.setPointsTree(newNode)
+        newNode.parent = parent
 
+        if parent is None:
+            self.root = newNode
+        elif points < parent.points:
+            parent.left = newNode
         else:
-            node.addUserEntry(userEntry)
+            parent.right = newNode
+
+        self.__adjustCountsToRoot(parent, 1, 1)
+        self.__insertFix(newNode)
+
+    # Replaces the tree's contents with the given user entries, which must be sorted by (points, user ID) and have unique usernames. Users with the same points
+    # are grouped into one node, and the nodes are linked into a perfectly balanced tree in O(n), instead of n separate inserts with their rotations. Every
+    # node is black, except for those on the deepest level when it isn't full, which are red so that every path holds the same number of black nodes.
+    def buildFromSorted(self, userEntries: list[UserEntryNode]) -> None:
+        nodes: list[PointsNode] = []
+        usersBefore: list[int] = [0]    # usersBefore[i] = number of users in nodes[:i], for the subtree user counts
+
+        for userEntry in userEntries:
+            if nodes and nodes[-1].points == userEntry.points:
+                nodes[-1].userEntryRefs.append(userEntry)
+                usersBefore[-1] += 1
+            else:
+                nodes.append(PointsNode(userEntry.points, userEntry))
+                usersBefore.append(usersBefore[-1] + 1)
 
-        # Maintaining R-B tree properties
-        # Case 1: Current node has a right red-linked child -- left rotate
-        if self.isNodeRed(node.right) and not self.isNodeRed(node.left):
-            node = self.__insertRotateLeft(node)
+            userEntry.setPointsTree(nodes[-1])
 
-        # Case 2: Current node and its left child both have left red-linked children -- right rotate
-        if node.left is not None and all([self.isNodeRed(child) for child in [node.left, node.left.left]]):
-            node = self.__insertRotateRight(node)
+        self.root = None
+        if not nodes:
+            return
 
-        # Case 3: Current node has both left and right children as red-linked -- colour-flip
-        if all([self.isNodeRed(child) for child in [node.left, node.right]]):
-            self.__insertFlipColours(node)
+        deepestLevel: int = len(nodes).bit_length() - 1
+        isLevelFull: bool = len(nodes) == (1 << (deepestLevel + 1)) - 1
 
-        # Recalculate numNodes
-        node.numNodes = self.__treeSize(node.left) + self.__treeSize(node.right) + 1
-        return node
+        # Each pending subtree is (first node index, last node index, parent, whether it's the parent's left child, depth)
+        pending: list[tuple] = [(0, len(nodes) - 1, None, False, 0)]
+
+        while pending:
+            first, last, parent, isLeftChild, depth = pending.pop()
+            middle: int = (first + last) // 2
+            node: PointsNode = nodes[middle]
+
+            node.parent = parent
+            node.numNodes = last - first + 1
+            node.numUsers = usersBefore[last + 1] - usersBefore[first]
+            node.colour = RED if depth == deepestLevel and depth > 0 and not isLevelFull else BLACK
+
+            if parent is None:
+                self.root = node
+            elif isLeftChild:
+                parent.left = node
+            else:
+                parent.right = node
+
+            if first < middle:
+                pending.append((first, middle - 1, node, True, depth + 1))
+            if middle < last:
+                pending.append((middle + 1, last, node, False, depth + 1))
+
+    # Aux function for insertUser(); walks up from the new (red) node, fixing any red node with a red parent
+    def __insertFix(self, node: PointsNode) -> None:
+        while node.parent is not None and node.parent.colour:
+            parent: PointsNode = node.parent
+            grandparent: PointsNode = parent.parent
+
+            if parent is grandparent.left:
+                uncle: PointsNode = grandparent.right
+
+                # Case 1: uncle is red -- colour-flip and continue from the grandparent
+                if uncle is not None and uncle.colour:
+                    parent.colour = uncle.colour = BLACK
+                    grandparent.colour = RED
+                    node = grandparent
+                    continue
+
+                # Case 2: node is an inner child -- rotate it to the outside first
+                if node is parent.right:
+                    self.__rotateLeft(parent)
+                    node, parent = parent, node
+
+                # Case 3: node is an outer child -- rotate the grandparent
+                parent.colour = BLACK
+                grandparent.colour = RED
+                self.__rotateRight(grandparent)
+
+            # Same as above, but left <-> right
+            else:
+                uncle = grandparent.left
+
+                if uncle is not None and uncle.colour:
+                    parent.colour = uncle.colour = BLACK
+                    grandparent.colour = RED
+                    node = grandparent
+                    continue
+
+                if node is parent.left:
+                    self.__rotateRight(parent)
+                    node, parent = parent, node
+
+                parent.colour = BLACK
+                grandparent.colour = RED
+                self.__rotateLeft(grandparent)
+
+        self.root.colour = BLACK
 
     # Node deletion from the rankings red-black tree
-    def deleteUser(self, userEntry: UserEntryNode):
-        self.deleteUserAux(self.root, userEntry)
-
-    # -- DELETE HELPER FUNCTIONS BASED OFF FROM HERE: https://www.programiz.com/dsa/deletion-from-a-red-black-tree --
-    # Aux function for deleteUser(); fixes RB tree after deleting original node and replacing with another suitable node within the tree
-    def deleteRBTreeFix(self, node):
-        # Keeps on looping and fixing until node reaches the root of the entire tree (and is black)
-        while node != self.root and node.colour == RBTreeColour.BLACK:
+    def deleteUser(self, userEntry: UserEntryNode) -> None:
+        nodeToDelete: PointsNode = self.__findNode(userEntry.points)
+
+        # If user entry doesn't exist anywhere, raise an error
+        if nodeToDelete is None or (userEntry.username not in [user.username for user in nodeToDelete.userEntryRefs]):
+            raise UserDBError(
+                "There are no users to delete, or the user does not exist! Insert a user first."
+            )
+
+        # If to-be-deleted user shares points with another user, just delete the former and update the user counts of the nodes above it
+        if len(nodeToDelete.userEntryRefs) > 1:
+            nodeToDelete.removeUserEntry(userEntry.username)
+            self.__adjustCountsToRoot(nodeToDelete, 0, -1)
+            return
+
+        # If to-be-deleted user has its own node, unlink the node (moving its successor into its place if it has two children). nodeToFix is the node that 
+        # takes the place of whichever node was actually removed from its spot (possibly None), and fixParent is its parent.
+        removedColour: bool = nodeToDelete.colour
+
+        if nodeToDelete.left is None or nodeToDelete.right is None:
+            nodeToFix = nodeToDelete.left if nodeToDelete.left is not None else nodeToDelete.right
+            fixParent = nodeToDelete.parent
+            self.__replaceChild(nodeToDelete, nodeToFix)
+        else:
+            successor: PointsNode = self.getMinUsers(nodeToDelete.right)
+            removedColour = successor.colour
+            nodeToFix = successor.right
+
+            if successor.parent is nodeToDelete:
+                fixParent = successor
+            else:
+                fixParent = successor.parent
+                self.__replaceChild(successor, successor.right)
+                successor.right = nodeToDelete.right
+                successor.right.parent = successor
+
+            self.__replaceChild(nodeToDelete, successor)
+            successor.left = nodeToDelete.left
+            successor.left.parent = successor
+            successor.colour = nodeToDelete.colour
+
+        # Every node whose subtree changed lies on the path from fixParent up to the root
+        node: PointsNode = fixParent
+        while node is not None:
+            self.__updateCounts(node)
+            node = node.parent
+
+        # Removing a black node leaves one path short a black node, so fix the R-B tree
+        if removedColour == BLACK:
+            self.__deleteFix(nodeToFix, fixParent)
+
+    # Aux function for deleteUser(); based off of the deletion fix-up in Cormen et al.'s "Introduction to Algorithms" (with None standing in for black leaves)
+    def __deleteFix(self, node: PointsNode, parent: PointsNode) -> None:
+        while node is not self.root and not self.isNodeRed(node):
             # Case 1: node is left child of parent node
-            if node == node.parent.left:
-                siblingNode: PointsNode = node.parent.right
-
-                # Case 1A: sibling node is red
-                if siblingNode.colour == RBTreeColour.RED:
-                    # Swap colours of sibling and parent
-                    siblingNode.colour = RBTreeColour.BLACK
-                    node.parent.colour = RBTreeColour.RED
-
-                    # Left rotate parent
-                    self.__insertRotateLeft(node.parent)
-                    siblingNode = node.parent.right  # ...probably not needed
-
-                # Case 1B: sibling has child nodes and both are black
-                if (
-                    all([child is not None for child in [siblingNode.left, siblingNode.right]])
-                    and siblingNode.left.colour == RBTreeColour.BLACK
-                    and siblingNode.right.colour == RBTreeColour.BLACK
-                ):
-                    # Set sibling to red and move node pointer to node's parent
-                    siblingNode.colour = RBTreeColour.RED
-                    node = node.parent
-
-                # Case 1C and 1D
+            if node is parent.left:
+                siblingNode: PointsNode = parent.right
+
+                # Case 1A: sibling node is red -- swap colours of sibling and parent, then left rotate parent
+                if siblingNode.colour:
+                    siblingNode.colour = BLACK
+                    parent.colour = RED
+                    self.__rotateLeft(parent)
+                    siblingNode = parent.right
+
+                # Case 1B: both of the sibling's children are black -- set sibling to red and move up to the parent
+                if not self.isNodeRed(siblingNode.left) and not self.isNodeRed(siblingNode.right):
+                    siblingNode.colour = RED
+                    node, parent = parent, parent.parent
                 else:
-                    # Case 1C: sibling right child is black, but sibling left child is red
-                    if siblingNode.right is not None and siblingNode.right.colour == RBTreeColour.BLACK:
-                        # Swap colours of sibling and its left child to red and black, respectively
-                        siblingNode.left.colour = RBTreeColour.BLACK
-                        siblingNode.colour = RBTreeColour.RED
-
-                        # Rotate sibling node (so former left child becomes new root) and assign new root of subtree as sibling node
-                        siblingNode = self.__insertRotateRight(siblingNode)
-                        # Note: After Case 1C, ends up in the configuration for 1D; we therefore run that case directly afterwards
-
-                    # Case 1D (default/last case): sibling right child is red, sibling left child is black
-                    siblingNode.colour = node.parent.colour  # Set sibling colour to parents colour
-                    
-                    # Set parent and right child of sibling to black
-                    node.parent.colour = RBTreeColour.BLACK
-                    siblingNode.right.colour = RBTreeColour.BLACK
-
-                    # Left rotate node's parent, and RB fixing is finished; set node to root of tree to end while loop
-                    self.__insertRotateLeft(node.parent)
+                    # Case 1C: sibling right child is black, but sibling left child is red -- rotate the red child up into the sibling's spot
+                    if not self.isNodeRed(siblingNode.right):
+                        siblingNode.left.colour = BLACK
+                        siblingNode.colour = RED
+                        self.__rotateRight(siblingNode)
+                        siblingNode = parent.right
+
+                    # Case 1D: sibling right child is red -- left rotate parent, and RB fixing is finished
+                    siblingNode.colour = parent.colour
+                    parent.colour = BLACK
+                    siblingNode.right.colour = BLACK
+                    self.__rotateLeft(parent)
                     node = self.root
 
             # Case 2: node is right child of parent node (same as case 1, but left <-> right)
             else:
-                siblingNode = node.parent.left
-
-                # Case 2A: sibling node is red
-                if siblingNode.colour == RBTreeColour.RED:
-                    # Swap colours of sibling and parent
-                    siblingNode.colour = RBTreeColour.BLACK
-                    node.parent.colour = RBTreeColour.RED
-
-                    # Right rotate parent
-                    self.__insertRotateRight(node.parent)
-                    siblingNode = node.parent.left  # ...probably not needed
-
-                # Case 2B: sibling has child nodes and both are black
-                if (
-                    all([child is not None for child in [siblingNode.left, siblingNode.right]])
-                    and siblingNode.right.colour == RBTreeColour.BLACK
-                    and siblingNode.left.colour == RBTreeColour.BLACK
-                ):
-                    # Set sibling to red and move node pointer to node's parent
-                    siblingNode.colour = RBTreeColour.RED
-                    node = node.parent
-
-                # Case 2C and 2D:
+                siblingNode = parent.left
+
+                if siblingNode.colour:
+                    siblingNode.colour = BLACK
+                    parent.colour = RED
+                    self.__rotateRight(parent)
+                    siblingNode = parent.left
+
+                if not self.isNodeRed(siblingNode.left) and not self.isNodeRed(siblingNode.right):
+                    siblingNode.colour = RED
+                    node, parent = parent, parent.parent
                 else:
-                    # Case 1C: sibling left child is black, but sibling right child is red
-                    if siblingNode.left is not None and siblingNode.left.colour == RBTreeColour.BLACK:
-                        # Swap colours of sibling and its right child to red and black, respectively
-                        siblingNode.right.colour = RBTreeColour.BLACK
-                        siblingNode.colour = RBTreeColour.RED
-
-                        # Rotate sibling node (so former right child becomes new root) and assign new root of subtree as sibling node
-                        self.__insertRotateLeft(siblingNode)
-                        siblingNode = node.parent.left
-                        # Note: After Case 1C, ends up in the configuration for 1D; we therefore run that case directly afterwards
-
-
-                    # Case 1D (default/last case): sibling right child is red, sibling left child is black
-                    siblingNode.colour = node.parent.colour  # Set sibling colour to parents colour
-                    
-                    # Set parent and left child of sibling to black
-                    node.parent.colour = RBTreeColour.BLACK
-                    siblingNode.left.colour = RBTreeColour.BLACK                    
-
-                    # Left rotate node's parent, and RB fixing is finished; set node to root of tree to end while loop
-                    self.__insertRotateRight(node.parent)
+                    if not self.isNodeRed(siblingNode.left):
+                        siblingNode.right.colour = BLACK
+                        siblingNode.colour = RED
+                        self.__rotateLeft(siblingNode)
+                        siblingNode = parent.left
+
+                    siblingNode.colour = parent.colour
+                    parent.colour = BLACK
+                    siblingNode.left.colour = BLACK
+                    self.__rotateRight(parent)
                     node = self.root
 
-        node.colour = RBTreeColour.BLACK
+        if node is not None:
+            node.colour = BLACK
 
-    # Aux function to deleteUser(); overwrites original to-be-deleted node with new suitable node within the tree
-    def __RBOverwriteNode(self, oldNode: PointsNode, newNode: PointsNode):
-        if oldNode.parent is None:
-            self.root = newNode
+    # Returns the node with the next-smallest amount of points (i.e. the next rank down), or None if given the lowest-scoring node
+    def __nextNodeDown(self, node: PointsNode) -> PointsNode:
+        if node.left is not None:
+            node = node.left
 
-        elif oldNode == oldNode.parent.left:
-            oldNode.parent.left = newNode
+            while node.right is not None:
+                node = node.right
 
-        else:
-            oldNode.parent.right = newNode
+            return node
 
-        # If to-be-deleted oldNode has children (newNode), then swap parents; if not, forgo this step
-        if newNode is not None:
-            newNode.parent = oldNode.parent
+        while node.parent is not None and node is node.parent.left:
+            node = node.parent
 
-    # Aux function to deleteUser(); handles actual overwriting of old node and identifies new node to replace old node with
-    def deleteUserAux(self, node: PointsNode, userEntry: UserEntryNode):
-        tempNode: PointsNode = None
+        return node.parent
 
-        # Search for the node in question using points keys (binary search)
-        while node is not None:
-            if node.points < userEntry.points:
-                node = node.right
+    # Given a user in the tree, returns (their position on the leaderboard page, the number of users with more points, the number of users with the same points
+    # including them) with a single descent of the tree, i.e. in O(log n)
+    def getStandingByUser(self, userEntry: UserEntryNode) -> tuple[int, int, int]:
+        currentNode: PointsNode = self.root
+        usersAhead: int = 0
 
-            elif node.points > userEntry.points:
-                node = node.left
-            
+        while currentNode is not None:
+            if userEntry.points < currentNode.points:
+                usersAhead += self.__userCount(currentNode.right) + len(currentNode.userEntryRefs)
+                currentNode = currentNode.left
+
+            elif userEntry.points > currentNode.points:
+                currentNode = currentNode.right
             else:
-                tempNode = node
-                break
+                usersAhead += self.__userCount(currentNode.right)
+                tiedUsers: list[UserEntryNode] = currentNode.userEntryRefs
 
-        # If user entry doesn't exist anywhere, raise an error
-        if tempNode is None or (userEntry.username not in [user.username for user in tempNode.userEntryRefs]):
-            raise UserDBError(
-                "There are no users to delete, or the user does not exist! Insert a user first."
-            )
+                # Tied users are sorted by user ID, so they can be binary searched; users without an ID all share the same key, and are looked for one by one
+                tieIndex: int = bisect_left(tiedUsers, _tieBreakKey(userEntry), key=_tieBreakKey)
+                if tieIndex >= len(tiedUsers) or tiedUsers[tieIndex].username != userEntry.username:
+                    tieIndex = [user.username for user in tiedUsers].index(userEntry.username)
 
-        # If to-be-deleted user shares points with another user, just delete the former and exit
-        if len(tempNode.userEntryRefs) > 1:
-            indexDelete = [user.username for user in tempNode.userEntryRefs].index(userEntry.username)
-            tempNode.userEntryRefs.pop(indexDelete)
-            return
+                return usersAhead + tieIndex + 1, usersAhead, len(tiedUsers)
 
-        # If to-be-deleted user has its own node, delete it and replace it with the next appropriate node from the tree, then fix the RB Tree structure (if to-be-deleted node was originally black)
-        nodeToDelete : PointsNode = tempNode
-        nodeToDeleteColour : RBTreeColour = nodeToDelete.colour
+        raise UserDBError(
+            "No user is currently stored with the given amount of points!"
+        )
 
-        if tempNode.left is None:
-            nodeToFix = tempNode.right
-            self.__RBOverwriteNode(tempNode, tempNode.right)
-        elif tempNode.right is None:
-            nodeToFix = tempNode.left
-            self.__RBOverwriteNode(tempNode, tempNode.left)
-        else:
-            # print(f"Min Users: {tempNode.right.points}")
-            nodeToDelete = self.getMinUsers(tempNode.right)
-            print(nodeToDelete.points)
-            nodeToDeleteColour = nodeToDelete.colour
-            nodeToFix = nodeToDelete.right
-
-            if nodeToDelete.parent == tempNode and nodeToFix is not None:
-                nodeToFix.parent = nodeToDelete
+    # Returns the number of users at or before the (points, user ID) key in leaderboard page order, in O(log n); the key doesn't have to belong to a user
+    # that's still in the tree (e.g. a user whose points changed since the key was handed out), it's placed where such a user would be
+    def getUsersThroughKey(self, points: int, userID: int) -> int:
+        currentNode: PointsNode = self.root
+        usersAhead: int = 0
+
+        while currentNode is not None:
+            if points < currentNode.points:
+                usersAhead += self.__userCount(currentNode.right) + len(currentNode.userEntryRefs)
+                currentNode = currentNode.left
+
+            elif points > currentNode.points:
+                currentNode = currentNode.right
             else:
-                self.__RBOverwriteNode(nodeToDelete, nodeToDelete.right)
+                return usersAhead + self.__userCount(currentNode.right) + bisect_right(currentNode.userEntryRefs, (False, userID), key=_tieBreakKey)
 
-                if tempNode.right is not None:
-                    nodeToDelete.right = tempNode.right
-                    nodeToDelete.right.parent = nodeToDelete
+        return usersAhead
 
-            self.__RBOverwriteNode(tempNode, nodeToDelete)
+    # Returns up to <count> users in leaderboard page order, starting from position <start>
+    def getUsersByPosition(self, start: int, count: int) -> list[UserEntryNode]:
+        output: list[UserEntryNode] = []
+        numSkip: int = max(start, 1) - 1
+        node: PointsNode = self.root
 
-            nodeToDelete.left = tempNode.left
-            nodeToDelete.left.parent = nodeToDelete
-            nodeToDelete.colour = tempNode.colour
-            
-        # If original deleted node's colour was black and there is a replacement node (nodeToFix) to take its spot, then fix the RB tree
-        if nodeToDeleteColour == RBTreeColour.BLACK and nodeToFix is not None:
-            self.deleteRBTreeFix(nodeToFix)
+        # Descend to the node holding the user at the start position, skipping whole subtrees that lie before it (users with more points are in right subtrees)
+        while node is not None:
+            rightUsers: int = self.__userCount(node.right)
 
-    # Returns a dictionary structure for all ranks and their associated user data, using a modified in-order traversal on the R-B tree.
+            if numSkip < rightUsers:
+                node = node.right
+            elif numSkip < rightUsers + len(node.userEntryRefs):
+                numSkip -= rightUsers
+                break
+            else:
+                numSkip -= rightUsers + len(node.userEntryRefs)
+                node = node.left
+
+        # Then walk down the rankings from there until enough users are collected
+        while node is not None and len(output) < count:
+            output.extend(node.userEntryRefs[numSkip:numSkip + count - len(output)])
+            numSkip = 0
+            node = self.__nextNodeDown(node)
+
+        return output
+
+    # Returns a dictionary structure for all ranks and their associated user data, using a reverse in-order traversal on the R-B tree.
     def getAllUsers(self):
         rankingsOutput: dict = {}  # Format of dict is {<rank #>: [{name: <str>, username: <str>, points: <int>}]}
 
-        self.__getAllUsersAux(
-            rankingsOutput, self.root, self.__treeSize(self.root.right) + 1
-        )
+        if self.root is None:
+            return rankingsOutput
+
+        node: PointsNode = self.getMaxUsers()
+        rank: int = 1
+
+        while node is not None:
+            rankingsOutput[rank] = [
+                {
+                    "name": userRef.name,
+                    "username": userRef.username,
+                    "points": userRef.points,
+                } for userRef in node.userEntryRefs
+            ]
+
+            rank += 1
+            node = self.__nextNodeDown(node)
 
         return rankingsOutput
 
-    # Aux function for getAllUsers()
-    def __getAllUsersAux(self, rankingsOutput: dict, node: PointsNode, rank: int = 0):
-        if node is None:
-            return
+# Rank engine over an array of points buckets, one per points value in [bottomPoints, bottomPoints + size), with two Fenwick (binary indexed) trees over them:
+# one counting users per bucket, the other counting non-empty buckets (for ranks). Buckets are indexed from the top (bucket 0 holds topPoints), so a prefix
+# sum up to a bucket counts the users (or distinct points values) at or above it. Users in a bucket are kept in a list sorted by user ID. The trees live in
+# flat int64 arrays, so updates and queries are a few dozen integer operations with no objects allocated, but the arrays take 16 bytes per points value in
+# the range; points outside of the range grow it (rebuilding the trees in O(S + n)).
+FENWICK_PAGE_SCAN: int = 32     # Empty buckets stepped over one at a time when reading a page, before searching for the next non-empty one instead
+
+class FenwickRankEngine(RankEngine):
+    def __init__(self, bottomPoints: int = 0, topPoints: int = 63):
+        self.buckets: dict = {}                 # Bucket index -> list of UserEntryNodes, sorted by user ID; only non-empty buckets are kept
+        self.numUsers: int = 0
+        self.__allocate(bottomPoints, topPoints)
+
+    # Sets up empty trees covering at least [bottomPoints, topPoints], with a power of two buckets (which the searches below rely on)
+    def __allocate(self, bottomPoints: int, topPoints: int) -> None:
+        self.size: int = 1 << max(topPoints - bottomPoints, 1).bit_length()
+        self.topPoints: int = bottomPoints + self.size - 1
+        self.userTree: array = array("q", bytes(8 * (self.size + 1)))        # 1-indexed, like the trees in the literature
+        self.distinctTree: array = array("q", bytes(8 * (self.size + 1)))
+
+    def __getBucket(self, points: int) -> int:
+        return self.topPoints - points
+
+    # Adds <amount> to a bucket's count in one of the trees
+    def __add(self, tree: array, bucket: int, amount: int) -> None:
+        index: int = bucket + 1
+
+        while index <= self.size:
+            tree[index] += amount
+            index += index & -index
+
+    # Sum of the counts of buckets 0 to <bucket> (inclusive; 0 for bucket -1)
+    def __prefixSum(self, tree: array, bucket: int) -> int:
+        total: int = 0
+        index: int = bucket + 1
+
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+
+        return total
+
+    # The first bucket whose prefix sum reaches <target> (>= 1), found by walking down the powers of two instead of binary searching prefix sums
+    def __search(self, tree: array, target: int) -> int:
+        index: int = 0
+        step: int = self.size
+
+        while step:
+            if index + step <= self.size and tree[index + step] < target:
+                index += step
+                target -= tree[index]
+
+            step >>= 1
+
+        return index
+
+    # Fills the trees from the bucket lists in O(S), each node taking its share from the node below it
+    def __buildTrees(self) -> None:
+        userTree, distinctTree = self.userTree, self.distinctTree
+
+        for bucket, bucketUsers in self.buckets.items():
+            userTree[bucket + 1] = len(bucketUsers)
+            distinctTree[bucket + 1] = 1
+
+        for index in range(1, self.size + 1):
+            parent: int = index + (index & -index)
+
+            if parent <= self.size:
+                userTree[parent] += userTree[index]
+                distinctTree[parent] += distinctTree[index]
+
+    # Re-buckets every user into trees covering <points> as well, with the range doubled so that growing stays O(1) amortized per insert
+    def __grow(self, points: int) -> None:
+        userEntries: list[UserEntryNode] = [userEntry for bucketUsers in self.buckets.values() for userEntry in bucketUsers]
+        bottomPoints: int = self.topPoints - self.size + 1
+        span: int = max(self.topPoints, points) - min(bottomPoints, points) + 1
+
+        if points < bottomPoints:
+            self.__allocate(points - span, self.topPoints)
+        else:
+            self.__allocate(bottomPoints, points + span)
 
-        tempList = []
+        self.buckets = {}
+        for userEntry in userEntries:
+            self.buckets.setdefault(self.__getBucket(userEntry.points), []).append(userEntry)
+        for bucketUsers in self.buckets.values():
+            bucketUsers.sort(key=_tieBreakKey)
 
-        # Traverse to right subtree first
-        rightNodeRank = (
-            (rank - self.__treeSize(node.right.left) - 1)
-            if (node.right is not None)
-            else rank
-        )
-        self.__getAllUsersAux(rankingsOutput, node.right, rightNodeRank)
-
-        # "Visit" and register current node
-        for userRef in node.userEntryRefs:
-            tempEntry = {
-                "name": userRef.name,
-                "username": userRef.username,
-                "points": userRef.points,
-            }
-            tempList.append(tempEntry)
+        self.__buildTrees()
 
-        rankingsOutput[rank] = tempList
+    def __getBucketUsers(self, points: int) -> list[UserEntryNode]:
+        bucketUsers: list[UserEntryNode] = self.buckets.get(self.__getBucket(points))
 
-        # Traverse to left subtree last
-        leftNodeRank = (
-            (rank + self.__treeSize(node.left.right) + 1)
-            if (node.left is not None)
-            else rank
-        )
-        self.__getAllUsersAux(rankingsOutput, node.left, leftNodeRank)
+        if bucketUsers is None or not (0 <= self.__getBucket(points) < self.size):
+            raise UserDBError("No user is currently stored with the given amount of points!")
+
+        return bucketUsers
+
+    def insertUser(self, userEntry: UserEntryNode) -> None:
+        if not (0 <= self.__getBucket(userEntry.points) < self.size):
+            self.__grow(userEntry.points)
+
+        bucket: int = self.__getBucket(userEntry.points)
+        bucketUsers: list[UserEntryNode] = self.buckets.get(bucket)
+
+        if bucketUsers is None:
+            bucketUsers = self.buckets[bucket] = []
+            self.__add(self.distinctTree, bucket, 1)
+        else:
+            # A user already in the bucket is replaced, as PointsNode.addUserEntry() does
+            for tieIndex, user in enumerate(bucketUsers):
+                if user.username == userEntry.username:
+                    bucketUsers[tieIndex] = userEntry
+                    return
+
+        insort(bucketUsers, userEntry, key=_tieBreakKey)
+        self.__add(self.userTree, bucket, 1)
+        self.numUsers += 1
+
+    def deleteUser(self, userEntry: UserEntryNode) -> None:
+        bucketUsers: list[UserEntryNode] = self.__getBucketUsers(userEntry.points)
+        bucketUsers.pop(self.__getTieIndex(bucketUsers, userEntry))
+
+        bucket: int = self.__getBucket(userEntry.points)
+        self.__add(self.userTree, bucket, -1)
+        self.numUsers -= 1
+
+        if not bucketUsers:
+            del self.buckets[bucket]
+            self.__add(self.distinctTree, bucket, -1)
+
+    # Index of a user within their bucket's list (binary searched by user ID, like PointsTree does within a node)
+    def __getTieIndex(self, bucketUsers: list[UserEntryNode], userEntry: UserEntryNode) -> int:
+        tieIndex: int = bisect_left(bucketUsers, _tieBreakKey(userEntry), key=_tieBreakKey)
+
+        if tieIndex >= len(bucketUsers) or bucketUsers[tieIndex].username != userEntry.username:
+            tieIndex = [user.username for user in bucketUsers].index(userEntry.username)
+
+        return tieIndex
+
+    def buildFromSorted(self, userEntries: list[UserEntryNode]) -> None:
+        self.buckets = {}
+        self.numUsers = len(userEntries)
+
+        if userEntries:
+            # Leaves headroom above the top score, since points mostly go up
+            self.__allocate(min(userEntries[0].points, 0), userEntries[-1].points + (userEntries[-1].points - userEntries[0].points) // 4 + 64)
+        else:
+            self.__allocate(0, 63)
+
+        for userEntry in userEntries:
+            bucket: int = self.__getBucket(userEntry.points)
+            bucketUsers: list[UserEntryNode] = self.buckets.get(bucket)
+
+            if bucketUsers is None:
+                self.buckets[bucket] = [userEntry]
+            else:
+                bucketUsers.append(userEntry)
+
+        self.__buildTrees()
+
+    def getUserCount(self) -> int:
+        return self.numUsers
+
+    def getDistinctPointsCount(self) -> int:
+        return len(self.buckets)
+
+    def getTopUsers(self) -> list[UserEntryNode]:
+        return self.getUsersByRank(1)
+
+    def getBottomUsers(self) -> list[UserEntryNode]:
+        return self.getUsersByRank(len(self.buckets))
+
+    def getRankByPoints(self, points: int) -> int:
+        if not self.buckets:
+            return 0
+
+        self.__getBucketUsers(points)
+        return self.__prefixSum(self.distinctTree, self.__getBucket(points) - 1) + 1
+
+    def getUsersByRank(self, rank: int) -> list[UserEntryNode]:
+        if rank <= 0 or rank > len(self.buckets):
+            raise UserDBError(f"The rank <{rank}> is out of range from the number of users currently stored in the leaderboard (<{len(self.buckets)}>)!")
+
+        return self.buckets[self.__search(self.distinctTree, rank)]
+
+    def iterUsersByRankRange(self, topRank: int, bottomRank: int):
+        self.getUsersByRank(topRank)    # Raises for an out-of-range topRank, as PointsTree does
+
+        for rank in range(topRank, min(bottomRank, len(self.buckets)) + 1):
+            yield rank, self.getUsersByRank(rank)
+
+    def getStandingByUser(self, userEntry: UserEntryNode) -> tuple[int, int, int]:
+        bucketUsers: list[UserEntryNode] = self.__getBucketUsers(userEntry.points)
+        usersAhead: int = self.__prefixSum(self.userTree, self.__getBucket(userEntry.points) - 1)
+        return usersAhead + self.__getTieIndex(bucketUsers, userEntry) + 1, usersAhead, len(bucketUsers)
+
+    def getUsersThroughKey(self, points: int, userID: int) -> int:
+        bucket: int = self.__getBucket(points)
+
+        if bucket < 0:
+            return 0
+        if bucket >= self.size:
+            return self.numUsers
+
+        return self.__prefixSum(self.userTree, bucket - 1) + bisect_right(self.buckets.get(bucket, []), (False, userID), key=_tieBreakKey)
+
+    def getUsersByPosition(self, start: int, count: int) -> list[UserEntryNode]:
+        output: list[UserEntryNode] = []
+        start = max(start, 1)
+
+        if start > self.numUsers:
+            return output
+
+        # Find the bucket holding the start position, then take the following non-empty buckets one at a time; the next one is usually a few buckets
+        # along, so they're stepped through directly, and only a long run of empty buckets is skipped with a search
+        bucket: int = self.__search(self.userTree, start)
+        numSkip: int = start - self.__prefixSum(self.userTree, bucket - 1) - 1
+        rank: int = self.__prefixSum(self.distinctTree, bucket)
+
+        while len(output) < count:
+            output.extend(self.buckets[bucket][numSkip:numSkip + count - len(output)])
+            numSkip = 0
+            rank += 1
+
+            if rank > len(self.buckets):
+                break
+
+            for bucket in range(bucket + 1, bucket + 1 + FENWICK_PAGE_SCAN):
+                if bucket in self.buckets:
+                    break
+            else:
+                bucket = self.__search(self.distinctTree, rank)
+
+        return output
+
+    def getAllUsers(self) -> dict:
+        return {
+            rank: [{"name": userRef.name, "username": userRef.username, "points": userRef.points} for userRef in self.buckets[bucket]]
+            for rank, bucket in enumerate(sorted(self.buckets), start=1)
+        }
+
+# Rank engine choice, from benchmarks/bench_rankings.py: with no more points values in the range than users, the Fenwick engine builds and answers
+# standings a little faster than a PointsTree in about the same memory. Past that, its arrays grow with the range while its speed stops improving.
+FENWICK_MAX_RANGE_PER_USER: int = 1
+FENWICK_MAX_RANGE: int = 1 << 22
+
+# Picks the rank engine class for a leaderboard of <numUsers> users whose points span <pointsRange> values
+def chooseRankEngine(numUsers: int, pointsRange: int) -> type:
+    if pointsRange <= min(FENWICK_MAX_RANGE, FENWICK_MAX_RANGE_PER_USER * max(numUsers, 64)):
+        return FenwickRankEngine
+
+    return PointsTree
+
+DEFAULT_RANK_ENGINE: str = "auto"
+RANK_ENGINES: dict = {"tree": PointsTree, "fenwick": FenwickRankEngine}
 
 
 """
@@ -699,52 +1335,61 @@ class Leaderboard():
     as a red-black tree (where PointsTree = outer "container" class pointing to root, and PointsNode = individual tree nodes storing user points 
     as a key and 1 or more reference(s) to users/UserEntryNodes with those points). To find a user's ranking, we would need to get their 
     relevant points info using their username, then find its relevant PointsNode in the rankings R-B tree and determine their rank based 
-    on the PointsNode's overall position in the structure.
+    on the PointsNode's overall position in the structure. (When the users' points are packed into a small range, a FenwickRankEngine takes the R-B tree's 
+    place; both implement RankEngine, which is all the Leaderboard relies on.)
 
-    For updating the leaderboard, there is no need to manually append any sort of user to the leaderboard; instead, just
-    change whatever relevant data within the database itself. By running Leaderboard.updateData(), the leaderboard will
-    query the db and make any necessary additions or deletions to its data. Other methods also exist to obtain users or rank numbers in
+    For updating the leaderboard, points changes are pushed in as PointsDelta objects (see applyDeltas()), each costing one delete + insert
+    on the rankings; the process-wide leaderboard receives these automatically whenever a points change is committed to the database. 
+    Leaderboard.updateData() is still available to re-sync with the database in one query, if needed. Other methods also exist to obtain users or rank numbers in
     a variety of ways, such as filtering users by rank number, getting a user's rank given their username, getting top or bottom users in 
     the leaderboard, getting users within a range of ranks, and getting all users with their ranks in the leaderboard.
     """
-    def __init__(self, courseID: int = None):
-        self.rankings: PointsTree = PointsTree()
+    def __init__(self, courseID: int = None, dbEntries: list[tuple] = None, rankEngine: type = None):
+        self.rankings: RankEngine = PointsTree()
+        self.rankEngine: type = rankEngine   # RankEngine class to keep the rankings in; picked from the users' points when None (see __getRankEngine())
         self.userInfo: UserHashTable = None
-        self.userDBQuery = None
         self.courseID: int = courseID
+        self.lock: RLock = RLock()  # Guards the rankings and userInfo when shared between request threads
 
-        self.__setUpLeaderboard()
+        self.__setUpLeaderboard(dbEntries)
 
     # Query from database a custom table containing user name, user's username, and points for when Points.user_id == User.id; users can be filtered from a specific course,
     # or everyone can just be given at once.
     def __queryData(self):
+        query = db.session.query(User.name, User.username, Points.points, User.id).join(Points, Points.user_id == User.id)
+
         if self.courseID is None:
-            return db.session.query(User.name, User.username, Points.points).distinct().filter(                
-                User.id == Points.user_id
-            )
+            return query
         else:
-            return db.session.query(User.name, User.username, Points.points).distinct().filter(
-                User.id == Points.user_id
-            ).filter(
-                user_course.c.course_id == self.courseID
-            )
+            # user_course has to be joined on the user as well, otherwise every user is matched against every enrollment in the course
+            return query.join(user_course, user_course.c.user_id == User.id).filter(user_course.c.course_id == self.courseID)
 
-    # This takes a lot of time to run, due to database queries...
-    def __setUpLeaderboard(self) -> None:
-        self.userDBQuery = self.__queryData().all()
-        dbEntries: list[tuple] = self.userDBQuery
+    # This takes a lot of time to run, due to database queries... (which is why LeaderboardRegistry passes in rows it has already fetched for several courses at once)
+    def __setUpLeaderboard(self, dbEntries: list[tuple] = None) -> None:
+        if dbEntries is None:
+            dbEntries = self.__queryData().order_by(Points.points, User.id).all()
         # print(dbEntries)
 
         if dbEntries is not None:
-            # Create UserHashTable with necessary args and insert all database query entries inside
-            self.userInfo = UserHashTable(len(dbEntries), self.courseID)
-
-            for dbEntry in dbEntries:
-                userEntry = UserEntryNode(dbEntry[0], dbEntry[1], dbEntry[2])
-                self.userInfo.insertUser(userEntry)
-                self.rankings.insertUser(userEntry)
-
-            print_tree(self.rankings)
+            # Users with several Points rows are only kept once (with their last row), then the rows are put in (points, user ID) order; the queries already
+            # return them in that order, in which case the sort only takes one pass
+            dbEntries = sorted({dbEntry[1]: dbEntry for dbEntry in dbEntries}.values(), key=itemgetter(2, 3))
+
+            # Building hundreds of thousands of nodes at once would otherwise set off a garbage collection every few hundred of them, each walking every
+            # node built so far; none of them can be garbage yet, so collections are paused until the leaderboard is built
+            gcWasEnabled: bool = gc.isenabled()
+            gc.disable()
+
+            try:
+                # Create UserHashTable with necessary args and bulk-build it and the rankings from the database query entries
+                userEntries: list[UserEntryNode] = [UserEntryNode(dbEntry[0], dbEntry[1], dbEntry[2], dbEntry[3]) for dbEntry in dbEntries]
+                self.userInfo = UserHashTable(len(userEntries), self.courseID)
+                self.userInfo.buildFromEntries(userEntries)
+                self.rankings = self.__getRankEngine(userEntries)()
+                self.rankings.buildFromSorted(userEntries)
+            finally:
+                if gcWasEnabled:
+                    gc.enable()
 
         else:
             if self.courseID is not None:
@@ -752,53 +1397,40 @@ class Leaderboard():
             
             raise UserDBError("Error creating leaderboard: no users are registered within the database yet!")
 
-    # This takes a lot of time to run, due to database queries...
+    # The rank engine given to the constructor, else the one named by app.config["LEADERBOARD_RANK_ENGINE"] ("tree", "fenwick", or "auto" by default, which
+    # picks one from the number of users and the range of their points)
+    def __getRankEngine(self, userEntries: list[UserEntryNode]) -> type:
+        if self.rankEngine is not None:
+            return self.rankEngine
+
+        engineName: str = current_app.config.get("LEADERBOARD_RANK_ENGINE", DEFAULT_RANK_ENGINE) if has_app_context() else DEFAULT_RANK_ENGINE
+
+        if engineName != "auto":
+            return RANK_ENGINES[engineName]
+        if not userEntries:
+            return PointsTree
+
+        return chooseRankEngine(len(userEntries), userEntries[-1].points - min(userEntries[0].points, 0) + 1)
+
+    # Re-syncs the leaderboard with the database using one query; only users that were added, removed or changed are touched in the rankings
     def updateData(self) -> None:
-        newQuery = self.__queryData()
-        queryDiffAdded = newQuery.filter(~User.username.in_([user[1] for user in self.userDBQuery]))  # Checks if a user was added
-        queryDiffRemoved = [user for user in self.userDBQuery if user not in newQuery.all()]          # Checks if a user was removed
-        queryDiffChanged = newQuery.filter(
-            User.username.in_([user[1] for user in self.userDBQuery])                                 # 1st filter: Get users that appear in both old and new queries
-        ).filter( 
-            ~User.points.has(Points.points.in_([user[2] for user in self.userDBQuery]))               # 2nd filter: Only keep users who have diff. # of points between old & new queries
-        )                                                                                             # End result: Checks if a pre-existing user entry was modified (through points)
-
-        dbEntriesAdded: list[tuple] = queryDiffAdded.all()
-        dbEntriesRemoved: list[tuple] = queryDiffRemoved
-        dbEntriesChanged: list[tuple] = queryDiffChanged.all()
-        # dbEntriesChangedOld: list[tuple] = [oldEntry for oldEntry in self.userDBQuery if oldEntry[1] in [newEntry[1] for newEntry in dbEntriesChangedNew]]
-        # ^^ NOT NECESSARY, ALREADY COUNTED WITHIN REMOVED LIST (for some reason...?) ^^
-
-        # print(f"~calcRankings Debug - Added entries: {dbEntriesAdded}")
-        # print(f"~calcRankings Debug - Removed entries: {dbEntriesRemoved}")
-        # print(f"~calcRankings Debug - Changed entries (new): {dbEntriesChanged}")
-        # print(f"~calcRankings Debug - Changed entries (old): {dbEntriesChangedOld}")
-
-        # Add old versions of changed user data so that old leaderboard entry is erased 
-        # dbEntriesRemoved += dbEntriesChangedOld 
-
-        # Add new versions of changed user data so that new leaderboard entry is added  
-        dbEntriesAdded += dbEntriesChanged     
-
-        # Checks if length of all lists here are 0; if so, then absolutely no change to leaderboard from last update/creation
-        if (len(dbEntriesAdded) + len(dbEntriesRemoved)) == 0:      
-            print("No users in this course were added or removed in the database from the last leaderboard update.")
-        else:            
-            if len(dbEntriesRemoved) > 0:
-                for dbEntry in dbEntriesRemoved:
-                    userEntry = self.userInfo.getUser(dbEntry[1])
-                    self.userInfo.deleteUser(dbEntry[1])
-                    self.rankings.deleteUser(userEntry)
-
-            if len(dbEntriesAdded) > 0:
-                for dbEntry in dbEntriesAdded:
-                    userEntry = UserEntryNode(dbEntry[0], dbEntry[1], dbEntry[2])
-                    self.userInfo.insertUser(userEntry)
-                    self.rankings.insertUser(userEntry)
-
-        # Stores latest query for future use/comparisons
-        self.userDBQuery = newQuery.all()
-        print_tree(self.rankings)
+        dbEntries: dict = {dbEntry[1]: dbEntry for dbEntry in self.__queryData().all()}   # Keyed by username
+        deltas: list[PointsDelta] = []
+
+        with self.lock:
+            for userEntry in self.userInfo.getAllEntries():
+                dbEntry = dbEntries.pop(userEntry.username, None)
+
+                if dbEntry is None:                     # Checks if a user was removed
+                    deltas.append(PointsDelta(userEntry.userID, userEntry.name, userEntry.username, userEntry.points, None))
+                elif dbEntry[2] != userEntry.points or dbEntry[0] != userEntry.name:    # Checks if a pre-existing user entry was modified
+                    deltas.append(PointsDelta(dbEntry[3], dbEntry[0], dbEntry[1], userEntry.points, dbEntry[2]))
+
+            # Whatever is left in the query wasn't in the leaderboard; checks if a user was added
+            for dbEntry in dbEntries.values():
+                deltas.append(PointsDelta(dbEntry[3], dbEntry[0], dbEntry[1], None, dbEntry[2]))
+
+            self.applyDeltas(deltas)
 
     def getUsersByRank(self, rank: int) -> list[dict]:
         output = self.rankings.getUsersByRank(rank)
@@ -809,32 +1441,663 @@ class Leaderboard():
         return self.rankings.getRankByPoints(userEntry.points)
 
     def getTopUsers(self) -> list[dict]:
-        output = self.rankings.getMaxUsers()
+        output = self.rankings.getTopUsers()
         return [{"name": userEntry.name, "username": userEntry.username, "points": userEntry.points} for userEntry in output]
     
     def getBottomUsers(self) -> list[dict]:
-        output = self.rankings.getMinUsers()
+        output = self.rankings.getBottomUsers()
         return [{"name": userEntry.name, "username": userEntry.username, "points": userEntry.points} for userEntry in output]
     
     def getAllUsers(self) -> dict:
         return self.rankings.getAllUsers()
     
     def getUsersByRankRange(self, topRank: int, bottomRank: int) -> dict:
-        output = {}
+        with self.lock:
+            bottomRankNum: int = self.getBottomRankNum()
 
-        if topRank > bottomRank or (topRank <= 0 or bottomRank <= 0) or (topRank > self.getBottomRankNum() or bottomRank > self.getBottomRankNum()):
-            raise UserDBError("The given range of ranks is invalid! Ensure that both arguments are positive integers, topRank is less than or equal to bottomRank, and \
-                              both ranks are less than or equal to the rank of the user with the least points.")
-        
-        for rank in range(topRank, bottomRank + 1):
-            rankUsers = self.getUsersByRank(rank)
-            output[rank] = rankUsers
+            if topRank > bottomRank or (topRank <= 0 or bottomRank <= 0) or (topRank > bottomRankNum or bottomRank > bottomRankNum):
+                raise UserDBError("The given range of ranks is invalid! Ensure that both arguments are positive integers, topRank is less than or equal to bottomRank, and \
+                                  both ranks are less than or equal to the rank of the user with the least points.")
 
-        return output
+            return {
+                rank: [{"name": userEntry.name, "username": userEntry.username, "points": userEntry.points} for userEntry in rankUsers]
+                for rank, rankUsers in self.rankings.iterUsersByRankRange(topRank, bottomRank)
+            }
+
+    def iterUsersByRankRange(self, topRank: int = 1, bottomRank: int = None, chunkSize: int = 500):
+        rank: int = topRank
+
+        while True:
+            # Each chunk is read under the lock, but the lock is released before the chunk is handed to the caller
+            with self.lock:
+                lastRank: int = self.getBottomRankNum() if bottomRank is None else min(bottomRank, self.getBottomRankNum())
+
+                if rank > lastRank:
+                    return
+
+                chunk = self.getUsersByRankRange(rank, min(rank + chunkSize - 1, lastRank))
+
+            yield from chunk.items()
+            rank += len(chunk)
 
+    # Every distinct points value has its own rank, so the bottom rank is just the number of distinct points values in the rankings
     def getBottomRankNum(self) -> int:
-        bottomRankUsers = self.getBottomUsers()
-        return self.getRankByUser(bottomRankUsers[0]["username"])
+        return self.rankings.getDistinctPointsCount()
+
+    def getUserCount(self) -> int:
+        with self.lock:
+            return self.rankings.getUserCount()
+
+    def hasUser(self, username: str) -> bool:
+        try:
+            self.userInfo.getUser(username)
+            return True
+        except UserDoesNotExistError:
+            return False
+
+    def getPositionByUser(self, username: str) -> int:
+        with self.lock:
+            userEntry: UserEntryNode = self.userInfo.getUser(username)
+            return self.rankings.getPositionByUser(userEntry)
+
+    # Returns a user's standing on the leaderboard in O(log n): their rank (users with the same points share a rank), their position on the leaderboard
+    # page, and their percentile rank (the percentage of users with fewer points, counting users with the same points as half below them)
+    def getStandingByUser(self, username: str) -> dict:
+        with self.lock:
+            userEntry: UserEntryNode = self.userInfo.getUser(username)
+            position, usersAhead, tiedUsers = self.rankings.getStandingByUser(userEntry)
+            userCount: int = self.getUserCount()
+
+            return {
+                "rank": self.rankings.getRankByPoints(userEntry.points),
+                "position": position,
+                "points": userEntry.points,
+                "percentile": round(100 * (userCount - usersAhead - tiedUsers + tiedUsers / 2) / userCount, 1),
+                "total_users": userCount
+            }
+
+    # Returns the user along with up to <k> users right above and below them on the leaderboard page, in page order; O(log n + k)
+    def getNeighboursByUser(self, username: str, k: int) -> list[dict]:
+        with self.lock:
+            position: int = self.getPositionByUser(username)
+            start: int = max(position - k, 1)
+            return self.getUsersByPosition(start, position - start + k + 1)
+
+    def getUsersByPosition(self, start: int, count: int) -> list[dict]:
+        with self.lock:
+            output = self.rankings.getUsersByPosition(start, count)
+            return [
+                {"rank": max(start, 1) + index, "name": userEntry.name, "username": userEntry.username, "points": userEntry.points} 
+                for index, userEntry in enumerate(output)
+            ]
+
+    # Returns up to <count> users that come after the given (points, user ID) key in leaderboard page order (from the top, if key is None), along with the key
+    # of the last of them (None if there are none). Unlike positions, keys don't shift when users above them gain or lose points, so pages fetched one after
+    # another with them never repeat or skip a user. Runs in O(log n + count).
+    def getUsersAfterKey(self, key: tuple, count: int) -> tuple[list[dict], tuple]:
+        with self.lock:
+            start: int = 1 if key is None else self.rankings.getUsersThroughKey(*key) + 1
+            output = self.rankings.getUsersByPosition(start, count)
+
+            return [
+                {"rank": start + index, "name": userEntry.name, "username": userEntry.username, "points": userEntry.points} 
+                for index, userEntry in enumerate(output)
+            ], (output[-1].points, output[-1].userID) if output else None
+
+    # Returns the (points, user ID) key of the user at a position of the leaderboard listing, e.g. to continue from a page fetched by position with
+    # getUsersAfterKey(); None if the position is out of range
+    def getKeyByPosition(self, position: int) -> tuple:
+        with self.lock:
+            output = self.rankings.getUsersByPosition(position, 1) if position >= 1 else []
+            return (output[0].points, output[0].userID) if output else None
+
+    # Sets a user's points (adding them if need be); a change with a version older than the newest one applied to the user is stale (its transaction
+    # committed before the one already applied), and is ignored
+    def updateUser(self, userID: int, name: str, username: str, points: int, version: int = None) -> None:
+        with self.lock:
+            try:
+                userEntry: UserEntryNode = self.userInfo.getUser(username)
+            except UserDoesNotExistError:
+                # New user; add them to both the hash table and the rankings
+                userEntry = UserEntryNode(name, username, points, userID, version)
+                self.userInfo.insertUser(userEntry)
+                self.rankings.insertUser(userEntry)
+                return
+
+            if version is not None:
+                if userEntry.version is not None and version < userEntry.version:
+                    return
+
+                userEntry.version = version
+
+            userEntry.name = name
+
+            # Move the user over to the node for their new points (the old points are needed to find their current node)
+            if userEntry.points != points:
+                self.rankings.deleteUser(userEntry)
+                userEntry.points = points
+                self.rankings.insertUser(userEntry)
+
+    def removeUser(self, username: str) -> None:
+        with self.lock:
+            userEntry: UserEntryNode = self.userInfo.getUser(username)
+            self.userInfo.deleteUser(username)
+            self.rankings.deleteUser(userEntry)
+
+    def applyDeltas(self, deltas: list[PointsDelta]) -> None:
+        with self.lock:
+            for delta in deltas:
+                if delta.newPoints is not None:
+                    self.updateUser(delta.userID, delta.name, delta.username, delta.newPoints, delta.version)
+                else:
+                    try:
+                        self.removeUser(delta.username)
+                    except UserDoesNotExistError:
+                        pass    # Never made it into the leaderboard (e.g. added and removed before the leaderboard was built)
+
+    # Returns every user as a (name, username, points, user ID) row, in the (points, user ID) order the leaderboard is built from (see leaderboardSnapshot.py)
+    def getSnapshotRows(self) -> list[tuple]:
+        with self.lock:
+            userEntries: list[UserEntryNode] = self.rankings.getUsersByPosition(1, self.getUserCount())
+            return [(userEntry.name, userEntry.username, userEntry.points, userEntry.userID) for userEntry in reversed(userEntries)]
+
+    # Brings a leaderboard built from a snapshot up to date: users with points ledger entries after <lastEventID>, or registered after <maxUserID>, are
+    # re-read from the database. If users were also removed in the meantime, it falls back to a full re-sync with updateData(). Returns the number of
+    # users re-read.
+    def catchUp(self, lastEventID: int, maxUserID: int) -> int:
+        changedUsers = db.session.query(PointsEvent.user_id).filter(PointsEvent.id > max(lastEventID - SNAPSHOT_CATCH_UP_OVERLAP, 0))
+        dbEntries: list[tuple] = self.__queryData().filter(or_(User.id > maxUserID, User.id.in_(changedUsers))).order_by(Points.points, User.id).all()
+
+        with self.lock:
+            for dbEntry in dbEntries:
+                self.updateUser(dbEntry[3], dbEntry[0], dbEntry[1], dbEntry[2])
+
+            if self.__queryData().with_entities(func.count(distinct(User.id))).scalar() != self.getUserCount():
+                self.updateData()
+
+        return len(dbEntries)
+
+
+class SharedLeaderboard():
+    """
+    Read-only, Leaderboard-compatible view of a global leaderboard published to a SharedRankingStore (see sharedRankings.py), which every worker process
+    maps instead of holding its own copy. Each call reads one consistent version of the store without taking any lock, so calls made by different workers
+    at the same moment agree with each other. Users are found through the store's username index in O(1), and positions and keys by binary search, so 
+    the methods run in the same O(log n + count) as Leaderboard's.
+    """
+    def __init__(self, store: SharedRankingStore):
+        self.store: SharedRankingStore = store
+
+    # Stands in for Leaderboard.lock, so that callers grouping several calls with "with leaderboard.lock:" get answers from one version of the store
+    @property
+    def lock(self):
+        return self.store.pinned()
+
+    @staticmethod
+    def __findUser(slot: SharedRankingsSlot, username: str) -> int:
+        index: int = slot.findUser(username)
+
+        if index < 0:
+            raise UserDoesNotExistError("The user you're trying to get doesn't exist!")
+
+        return index
+
+    @staticmethod
+    def __getEntries(slot: SharedRankingsSlot, firstIndex: int, count: int) -> list[dict]:
+        entries: list[dict] = []
+
+        for index in range(max(firstIndex, 0), min(firstIndex + count, slot.getUserCount())):
+            name, username, points, _, _ = slot.getRow(index)
+            entries.append({"rank": index + 1, "name": name, "username": username, "points": points})
+
+        return entries
+
+    def getUserCount(self) -> int:
+        return self.store.read(lambda slot: slot.getUserCount())
+
+    def getBottomRankNum(self) -> int:
+        return self.store.read(lambda slot: slot.ranks[slot.getUserCount() - 1] if slot.getUserCount() else 0)
+
+    # The ledger high-water mark the published leaderboard reflects
+    def getLastEventID(self) -> int:
+        return self.store.read(lambda slot: slot.getLastEventID())
+
+    def hasUser(self, username: str) -> bool:
+        return self.store.read(lambda slot: slot.findUser(username) >= 0)
+
+    def getRankByUser(self, username: str) -> int:
+        return self.store.read(lambda slot: slot.ranks[self.__findUser(slot, username)])
+
+    def getPositionByUser(self, username: str) -> int:
+        return self.store.read(lambda slot: self.__findUser(slot, username) + 1)
+
+    def getStandingByUser(self, username: str) -> dict:
+        def read(slot: SharedRankingsSlot) -> dict:
+            index: int = self.__findUser(slot, username)
+            points: int = slot.points[index]
+            usersAhead: int = slot.countUsersAbove(points)
+            tiedUsers: int = slot.countUsersAbove(points - 1) - usersAhead
+            userCount: int = slot.getUserCount()
+
+            return {
+                "rank": slot.ranks[index],
+                "position": index + 1,
+                "points": points,
+                "percentile": round(100 * (userCount - usersAhead - tiedUsers + tiedUsers / 2) / userCount, 1),
+                "total_users": userCount
+            }
+
+        return self.store.read(read)
+
+    def getNeighboursByUser(self, username: str, k: int) -> list[dict]:
+        def read(slot: SharedRankingsSlot) -> list[dict]:
+            index: int = self.__findUser(slot, username)
+            firstIndex: int = max(index - k, 0)
+            return self.__getEntries(slot, firstIndex, index - firstIndex + k + 1)
+
+        return self.store.read(read)
+
+    def getUsersByPosition(self, start: int, count: int) -> list[dict]:
+        return self.store.read(lambda slot: self.__getEntries(slot, max(start, 1) - 1, count))
+
+    def getUsersAfterKey(self, key: tuple, count: int) -> tuple[list[dict], tuple]:
+        def read(slot: SharedRankingsSlot) -> tuple[list[dict], tuple]:
+            firstIndex: int = 0 if key is None else slot.countUsersThroughKey(*key)
+            entries: list[dict] = self.__getEntries(slot, firstIndex, count)
+            lastIndex: int = firstIndex + len(entries) - 1
+            return entries, (slot.points[lastIndex], slot.userIDs[lastIndex]) if entries else None
+
+        return self.store.read(read)
+
+    def getKeyByPosition(self, position: int) -> tuple:
+        return self.store.read(lambda slot: (slot.points[position - 1], slot.userIDs[position - 1]) if 1 <= position <= slot.getUserCount() else None)
+
+
+# Points ledger entries before a snapshot's high-water mark that are read again when catching up, in case a transaction with a lower entry ID was still
+# uncommitted when the snapshot was taken (re-reading a user that was already up to date is harmless)
+SNAPSHOT_CATCH_UP_OVERLAP: int = 1000
+
+# Rough memory cost of one user in a course leaderboard (entry + hash table slot + share of a tree node, see benchmarks/bench_rankings.py), and of an empty leaderboard
+SHARD_BYTES_PER_USER: int = 400
+SHARD_BYTES_OVERHEAD: int = 2048
+DEFAULT_SHARD_MEMORY_BUDGET: int = 64 * 1024 * 1024
+DEFAULT_SHARED_INTERVAL: float = 1.0    # Seconds between checks for changes to publish to the shared leaderboard
+
+class LeaderboardRegistry():
+    """
+    Keeps the process-wide leaderboard of all users, plus one Leaderboard ("shard") per course, built the first time each course is asked for.
+
+    Course shards are kept in least-recently-used order; once their estimated size goes over memoryBudget (in bytes), the shards that were
+    used the longest time ago are dropped, and simply rebuilt the next time they're needed. The global leaderboard is never evicted.
+
+    If snapshotPath is set, the global leaderboard is loaded from the snapshot file there (see leaderboardSnapshot.py) and caught up from the points
+    ledger, instead of being built from every user in the database; when there's no usable snapshot, the leaderboard is built from the database and
+    a snapshot of it is saved for the next start.
+    """
+    def __init__(self, memoryBudget: int = DEFAULT_SHARD_MEMORY_BUDGET, snapshotPath: str = None, sharedPath: str = None):
+        self.globalLeaderboard: Leaderboard = None
+        self.snapshotPath: str = snapshotPath
+        self.sharedPath: str = sharedPath
+        self.sharedLeaderboard: SharedLeaderboard = None
+        self.sharedStore: SharedRankingStore = None     # Only opened by the process that publishes the shared leaderboard
+        self.sharedVersion: tuple = None                # (ledger high-water mark, highest user ID, leaderboard generation) of the last publish
+        self.shards: OrderedDict = OrderedDict()   # courseID -> Leaderboard, least recently used first
+        self.memoryBudget: int = memoryBudget
+        self.windowLeaderboards: dict = {}         # (window, window start, courseID) -> Leaderboard of a points window, see pointsRollup.py
+        self.windowVersion: tuple = None             # The rollup version the window leaderboards were built at
+        self.lock: RLock = RLock()  # Guards the shards themselves (each Leaderboard has its own lock for its rankings)
+
+    # Returns the leaderboard for the given course (or of all users, if courseID is None), building it on first use
+    def getLeaderboard(self, courseID: int = None) -> Leaderboard:
+        if courseID is None and self.sharedPath is not None:
+            sharedLeaderboard: SharedLeaderboard = self.__getSharedLeaderboard()
+
+            if sharedLeaderboard is not None:
+                return sharedLeaderboard
+
+        if courseID is None:
+            if self.globalLeaderboard is None:
+                with self.lock:
+                    if self.globalLeaderboard is None:
+                        self.globalLeaderboard = self.__loadGlobalLeaderboard()
+
+            return self.globalLeaderboard
+
+        with self.lock:
+            leaderboard: Leaderboard = self.shards.get(courseID)
+
+            if leaderboard is None:
+                return self.loadShards([courseID])[courseID]
+
+            self.shards.move_to_end(courseID)
+            return leaderboard
+
+    def __loadGlobalLeaderboard(self) -> Leaderboard:
+        if self.snapshotPath is None:
+            return Leaderboard()
+
+        snapshot: LeaderboardSnapshot = readLeaderboardSnapshot(self.snapshotPath)
+
+        if snapshot is not None:
+            leaderboard: Leaderboard = Leaderboard(None, snapshot.rows)
+            leaderboard.catchUp(snapshot.lastEventID, snapshot.maxUserID)
+            return leaderboard
+
+        # The high-water mark is read before the users, so that the snapshot never claims ledger entries its rows don't reflect
+        lastEventID: int = getLedgerHighWaterMark()
+        leaderboard = Leaderboard()
+        writeLeaderboardSnapshot(self.snapshotPath, leaderboard.getSnapshotRows(), lastEventID)
+        return leaderboard
+
+    # Returns a view of the leaderboard published to sharedPath, or None if nothing has been published there yet (in which case a process-local global
+    # leaderboard is served until something is)
+    def __getSharedLeaderboard(self) -> SharedLeaderboard:
+        if self.sharedLeaderboard is None:
+            with self.lock:
+                if self.sharedLeaderboard is None:
+                    store: SharedRankingStore = SharedRankingStore.open(self.sharedPath)
+                    self.sharedLeaderboard = None if store is None else SharedLeaderboard(store)
+
+        return self.sharedLeaderboard
+
+    # Publishes the global leaderboard to sharedPath, if anything changed since the last publish (judged by the points ledger's high-water mark, the 
+    # highest user ID and the leaderboard generation, see bumpLeaderboardGeneration()). Between publishes, the process-local leaderboard is caught up from
+    # the ledger if only awards were made, and re-synced with the database otherwise. Only the process holding the shared leaderboard's lock file should
+    # call this (see startSharedLeaderboardWriter()). Returns whether anything was published.
+    def publishSharedLeaderboard(self) -> bool:
+        with self.lock:
+            generation: int = getLeaderboardGeneration()    # Read first, so that a change made while publishing is published again next time
+            lastEventID: int = getLedgerHighWaterMark()
+            maxUserID: int = db.session.query(func.max(User.id)).scalar() or 0
+
+            if (lastEventID, maxUserID, generation) == self.sharedVersion:
+                return False
+
+            if self.globalLeaderboard is None:
+                self.globalLeaderboard = self.__loadGlobalLeaderboard()
+            elif self.sharedVersion is None or generation != self.sharedVersion[2]:
+                self.globalLeaderboard.updateData()     # Only followed this process' own changes so far, or changes were made outside the ledger
+            else:
+                self.globalLeaderboard.catchUp(*self.sharedVersion[:2])
+
+            if self.sharedStore is None:
+                self.sharedStore = SharedRankingStore.openForWriting(self.sharedPath)
+
+            self.sharedStore.publish(list(reversed(self.globalLeaderboard.getSnapshotRows())), lastEventID)
+            self.sharedVersion = (lastEventID, maxUserID, generation)
+            return True
+
+    # Saves a snapshot of the global leaderboard (building it first if needed) to <path>, or to snapshotPath; returns the size of the snapshot file
+    def saveSnapshot(self, path: str = None) -> int:
+        if (path or self.snapshotPath) is None:
+            raise ValueError("No path to save the leaderboard snapshot to (set LEADERBOARD_SNAPSHOT_PATH)")
+
+        lastEventID: int = getLedgerHighWaterMark()
+        if self.globalLeaderboard is None:
+            self.globalLeaderboard = self.__loadGlobalLeaderboard()
+
+        return writeLeaderboardSnapshot(path or self.snapshotPath, self.globalLeaderboard.getSnapshotRows(), lastEventID)
+
+    # Builds the shards of every given course that isn't loaded yet, using one query grouped by course; returns the shards of all the given courses. Courses
+    # that don't exist get an empty leaderboard that isn't kept, so that made-up course IDs can't push real shards out.
+    def loadShards(self, courseIDs: list[int]) -> dict:
+        with self.lock:
+            missingIDs: list[int] = sorted({courseID for courseID in courseIDs if courseID not in self.shards})
+            unknownShards: dict = {}
+
+            if missingIDs:
+                # Starts from Course, so that courses without any ranked users still show up (as a single row of NULLs)
+                dbEntries = db.session.query(
+                    Course.id, User.name, User.username, Points.points, User.id, Points.id
+                ).select_from(Course).outerjoin(user_course, user_course.c.course_id == Course.id).outerjoin(
+                    User, user_course.c.user_id == User.id
+                ).outerjoin(Points, Points.user_id == User.id).filter(Course.id.in_(missingIDs)).order_by(Course.id, Points.points, User.id).all()
+
+                entriesByCourse: dict = {
+                    courseID: [dbEntry[1:5] for dbEntry in courseEntries if dbEntry[5] is not None]
+                    for courseID, courseEntries in groupby(dbEntries, key=lambda dbEntry: dbEntry[0])
+                }
+
+                for courseID in missingIDs:
+                    if courseID in entriesByCourse:
+                        self.shards[courseID] = Leaderboard(courseID, entriesByCourse[courseID])
+                    else:
+                        unknownShards[courseID] = Leaderboard(courseID, [])
+
+            for courseID in courseIDs:
+                if courseID not in unknownShards:
+                    self.shards.move_to_end(courseID)
+
+            shards: dict = {courseID: unknownShards.get(courseID) or self.shards[courseID] for courseID in courseIDs}
+            self.__evictIdleShards(keep=len(shards) - len(unknownShards))
+            return shards
+
+    # Estimated number of bytes used by the loaded course shards
+    def getShardMemory(self) -> int:
+        with self.lock:
+            return sum(SHARD_BYTES_OVERHEAD + SHARD_BYTES_PER_USER * leaderboard.getUserCount() for leaderboard in self.shards.values())
+
+    # Drops the least recently used shards until the loaded shards fit in the memory budget; the <keep> most recently used shards are never dropped
+    def __evictIdleShards(self, keep: int = 1) -> None:
+        shardMemory: int = self.getShardMemory()
+
+        while shardMemory > self.memoryBudget and len(self.shards) > keep:
+            _, leaderboard = self.shards.popitem(last=False)
+            shardMemory -= SHARD_BYTES_OVERHEAD + SHARD_BYTES_PER_USER * leaderboard.getUserCount()
+
+    # Drops the shards of the given courses (e.g. after enrollments changed), so they are rebuilt from the database the next time they're needed
+    def invalidateShards(self, courseIDs) -> None:
+        with self.lock:
+            for courseID in courseIDs:
+                self.shards.pop(courseID, None)
+
+    # Returns the leaderboard of a points window, keyed by (window, window start, courseID); the window leaderboards don't take deltas, but are all rebuilt
+    # (with loadEntries(), which returns the same rows a Leaderboard queries for) once the rollup that feeds them reaches a new version
+    def getWindowLeaderboard(self, key: tuple, version: tuple, loadEntries) -> Leaderboard:
+        with self.lock:
+            if version != self.windowVersion:
+                self.windowLeaderboards.clear()
+                self.windowVersion = version
+
+            leaderboard: Leaderboard = self.windowLeaderboards.get(key)
+
+            if leaderboard is None:
+                leaderboard = Leaderboard(key[2], loadEntries())
+                self.windowLeaderboards[key] = leaderboard
+
+            return leaderboard
+
+    # Re-syncs the global leaderboard with the database and drops every course shard and window leaderboard (for changes made to Points outside of the
+    # session's flush events)
+    def updateData(self) -> None:
+        with self.lock:
+            self.shards.clear()
+            self.windowLeaderboards.clear()
+
+        if self.globalLeaderboard is not None:
+            self.globalLeaderboard.updateData()
+
+    def getRankByUser(self, username: str, courseID: int = None) -> int:
+        return self.getLeaderboard(courseID).getRankByUser(username)
+
+    def getPositionByUser(self, username: str, courseID: int = None) -> int:
+        return self.getLeaderboard(courseID).getPositionByUser(username)
+
+    # Applies points changes to the global leaderboard and to every loaded course shard; a shard only takes the changes of users it already holds, since
+    # enrolling a user into a course drops that course's shard instead (see _recordPointsDeltas())
+    def applyDeltas(self, deltas: list[PointsDelta]) -> None:
+        if self.globalLeaderboard is not None:
+            self.globalLeaderboard.applyDeltas(deltas)
+
+        with self.lock:
+            shards: list[Leaderboard] = list(self.shards.values())
+
+        for leaderboard in shards:
+            with leaderboard.lock:
+                shardDeltas: list[PointsDelta] = [delta for delta in deltas if leaderboard.hasUser(delta.username)]
+
+                if shardDeltas:
+                    leaderboard.applyDeltas(shardDeltas)
+
+_registrySetUpLock: RLock = RLock()  # Ensures only one request thread creates the process-wide registry
+
+# Returns the process-wide LeaderboardRegistry of the current app, creating it on first use (its memory budget comes from app.config["LEADERBOARD_SHARD_MEMORY_BUDGET"],
+# its snapshot file, if any, from app.config["LEADERBOARD_SNAPSHOT_PATH"], and its shared leaderboard file, if any, from app.config["LEADERBOARD_SHARED_PATH"])
+def getLeaderboardRegistry() -> LeaderboardRegistry:
+    registry: LeaderboardRegistry = current_app.extensions.get("leaderboards")
+
+    if registry is None:
+        with _registrySetUpLock:
+            registry = current_app.extensions.get("leaderboards")
+
+            if registry is None:
+                registry = LeaderboardRegistry(
+                    current_app.config.get("LEADERBOARD_SHARD_MEMORY_BUDGET", DEFAULT_SHARD_MEMORY_BUDGET), current_app.config.get("LEADERBOARD_SNAPSHOT_PATH"),
+                    current_app.config.get("LEADERBOARD_SHARED_PATH")
+                )
+                current_app.extensions["leaderboards"] = registry
+
+    return registry
+
+# Returns the ID of the newest points ledger entry (0 if there are none yet)
+def getLedgerHighWaterMark() -> int:
+    return db.session.query(func.max(PointsEvent.id)).scalar() or 0
+
+# Returns the number of leaderboard changes made without a points ledger entry so far (see bumpLeaderboardGeneration())
+def getLeaderboardGeneration() -> int:
+    return db.session.query(LeaderboardState.generation).filter_by(id=1).scalar() or 0
+
+# Counts a change to the global leaderboard that leaves no points ledger entry, within the session's transaction, so that the shared leaderboard is
+# re-synced once it commits; done for every change made through the session (see _recordPointsDeltas()), and to be called by anything that changes
+# Points or User with a bulk statement (e.g. rebuildPointsTotals())
+def bumpLeaderboardGeneration(session=None) -> None:
+    session = session or db.session
+    bumped: int = session.execute(
+        update(LeaderboardState).where(LeaderboardState.id == 1).values(generation=LeaderboardState.generation + 1).execution_options(synchronize_session=False)
+    ).rowcount
+
+    if not bumped:
+        session.add(LeaderboardState(id=1, generation=1))
+
+# Returns the process-wide leaderboard of all users (or of the users in a course) for the current app, building it on first use
+def getLeaderboard(courseID: int = None) -> Leaderboard:
+    return getLeaderboardRegistry().getLeaderboard(courseID)
+
+# Starts a daemon thread that competes for the shared leaderboard's lock file every <interval> seconds; once it holds the lock (which it keeps until the
+# process exits, so there's only ever one writer), it publishes the global leaderboard every <interval> seconds whenever it has changed. Set the returned
+# event to stop it.
+def startSharedLeaderboardWriter(app, interval: float) -> Event:
+    stopped: Event = Event()
+
+    def run() -> None:
+        with open(f"{app.config['LEADERBOARD_SHARED_PATH']}.lock", "a") as lockFile:
+            while not stopped.wait(interval):
+                try:
+                    fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    pass    # Another worker is the writer; it's checked again in case that worker exits
+
+            # Publishes right away once the lock is held, then every <interval> seconds
+            while not stopped.is_set():
+                with app.app_context():
+                    try:
+                        getLeaderboardRegistry().publishSharedLeaderboard()
+                    except Exception:
+                        db.session.rollback()
+                        app.logger.exception("Publishing the shared leaderboard failed")
+                    finally:
+                        db.session.remove()
+
+                stopped.wait(interval)
+
+    Thread(target=run, name="shared-leaderboard-writer", daemon=True).start()
+    return stopped
+
+# Shares the global leaderboard between the app's worker processes if app.config["LEADERBOARD_SHARED_PATH"] is set (to a file on local storage, ideally
+# in memory, e.g. under /dev/shm), publishing changes every LEADERBOARD_SHARED_INTERVAL seconds (1 by default); not started while the app is being tested
+def initSharedLeaderboard(app) -> None:
+    if app.config.get("LEADERBOARD_SHARED_PATH") and not app.testing:
+        app.extensions["shared_leaderboard_writer"] = startSharedLeaderboardWriter(app, app.config.get("LEADERBOARD_SHARED_INTERVAL", DEFAULT_SHARED_INTERVAL))
+
+# Records every change to Points.points made within a flush as a PointsDelta, to be applied once the transaction commits
+@event.listens_for(db.session, "before_flush")
+def _recordPointsDeltas(session, flushContext, instances) -> None:
+    deltas: list[PointsDelta] = session.info.setdefault("pointsDeltas", [])
+    numRecordedDeltas: int = len(deltas)    # e.g. by pointsLedger.py, whose awards do show in the ledger
+
+    with session.no_autoflush:
+        for pointsObj in session.new:
+            if isinstance(pointsObj, Points):
+                deltas.append(_makePointsDelta(session, pointsObj, None, 0 if pointsObj.points is None else pointsObj.points))
+
+        for pointsObj in session.dirty:
+            if isinstance(pointsObj, Points):
+                history = inspect(pointsObj).attrs.points.history
+
+                if history.added and history.deleted and history.added[0] != history.deleted[0]:
+                    deltas.append(_makePointsDelta(session, pointsObj, history.deleted[0], history.added[0]))
+
+        for pointsObj in session.deleted:
+            if isinstance(pointsObj, Points):
+                deltas.append(_makePointsDelta(session, pointsObj, pointsObj.points, None))
+
+        # Unlike awards, none of these changes (nor renaming or removing users) shows in the points ledger, which is all the shared leaderboard's writer
+        # follows otherwise
+        renamedOrRemoved: bool = any(isinstance(obj, User) for obj in session.deleted) or any(
+            isinstance(obj, User) and (inspect(obj).attrs.name.history.has_changes() or inspect(obj).attrs.username.history.has_changes())
+            for obj in session.dirty
+        )
+
+        if len(deltas) > numRecordedDeltas or renamedOrRemoved:
+            bumpLeaderboardGeneration(session)
+
+        # Course shards only follow the users they were built with, so courses whose enrollments change are rebuilt instead
+        staleCourseIDs: set = session.info.setdefault("staleCourseIDs", set())
+
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, User):
+                history = inspect(obj).attrs.courses.history
+                staleCourseIDs.update(course.id for course in history.added + history.deleted)
+            elif isinstance(obj, Course):
+                history = inspect(obj).attrs.users.history
+                if history.added or history.deleted:
+                    staleCourseIDs.add(obj.id)
+            elif isinstance(obj, Points) and obj in session.new and obj.user_id is not None:
+                # Points added for a user that may already be enrolled in some courses
+                user: User = obj.user or session.get(User, obj.user_id)
+                staleCourseIDs.update(course.id for course in user.courses)
+
+        for obj in session.deleted:
+            if isinstance(obj, Course):
+                staleCourseIDs.add(obj.id)
+
+        staleCourseIDs.discard(None)
+
+def _makePointsDelta(session, pointsObj: Points, oldPoints: int, newPoints: int) -> PointsDelta:
+    user: User = pointsObj.user or session.get(User, pointsObj.user_id)
+    return PointsDelta(user.id, user.name, user.username, oldPoints, newPoints)
+
+# Applies the deltas recorded during a transaction to the process-wide leaderboards (if they have been built yet; otherwise they will pick them up when they are)
+@event.listens_for(db.session, "after_commit")
+def _publishPointsDeltas(session) -> None:
+    deltas: list[PointsDelta] = session.info.pop("pointsDeltas", None)
+    staleCourseIDs: set = session.info.pop("staleCourseIDs", None)
+
+    if (deltas or staleCourseIDs) and has_app_context():
+        registry: LeaderboardRegistry = current_app.extensions.get("leaderboards")
+
+        if registry is not None:
+            if staleCourseIDs:
+                registry.invalidateShards(staleCourseIDs)
+            if deltas:
+                registry.applyDeltas(deltas)
+
+# Points changes that were rolled back never happened, so their deltas are thrown away
+@event.listens_for(db.session, "after_rollback")
+def _discardPointsDeltas(session) -> None:
+    session.info.pop("pointsDeltas", None)
+    session.info.pop("staleCourseIDs", None)
 
 ##########
     
@@ -0,0 +1,125 @@
+# contentCache.py - per-process LRU cache for course content (course outlines, lesson payloads and quiz answer keys), which changes rarely but is read on every lesson page
+#
+# Entries are keyed by (kind, id, content version). Any insert, update or delete of a Course, Module, Topic, Lesson, Quiz, QuizQuestion or QuizAnswer bumps the content version, so every entry
+# built before the change stops matching and simply ages out of the LRU order; this covers changes made through the session, including bulk statements
+# (query.update(), delete() etc.). The version only lives in this process, so as a backstop for changes made by other processes, entries also expire after
+# app.config["CONTENT_CACHE_TTL"] seconds (60 by default). Values are plain data (e.g. dicts of column values) rather than ORM objects, so that
+# a hit never touches the database or a (possibly closed) session; Jinja reads dict keys with the same `lesson.title` syntax as object attributes.
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from app.src.models import Course, Module, Topic, Lesson, Quiz, QuizQuestion, QuizAnswer, db
+
+DEFAULT_CONTENT_CACHE_SIZE: int = 256
+DEFAULT_CONTENT_CACHE_TTL: float = 60.0
+CONTENT_MODELS: tuple = (Course, Module, Topic, Lesson, Quiz, QuizQuestion, QuizAnswer)
+
+class ContentCache():
+    def __init__(self, maxEntries: int = DEFAULT_CONTENT_CACHE_SIZE, ttl: float = DEFAULT_CONTENT_CACHE_TTL):
+        self.maxEntries: int = maxEntries
+        self.ttl: float = ttl
+        self.entries: OrderedDict = OrderedDict()   # (kind, id, version) -> (expiry time, value), least recently used first
+        self.version: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock: Lock = Lock()
+
+    # Returns the cached value of (kind, id) for the current content version, calling loader() to build (and cache) it on a miss (or once it has expired)
+    def get(self, kind: str, itemID: int, loader):
+        with self.lock:
+            key = (kind, itemID, self.version)
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                entry = None
+
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+
+            self.misses += 1
+
+        value = loader()   # Built outside the lock, so a slow query doesn't hold up hits on other entries
+
+        with self.lock:
+            # Only cache the value if the content didn't change while it was being built
+            if key[2] == self.version:
+                self.entries[key] = (time.monotonic() + self.ttl, value)
+                self.entries.move_to_end(key)
+
+                while len(self.entries) > self.maxEntries:
+                    self.entries.popitem(last=False)
+
+        return value
+
+    # Makes every cached entry stale; called whenever course content changes
+    def bumpVersion(self) -> None:
+        with self.lock:
+            self.version += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "version": self.version}
+
+# Returns the content cache of the current app, creating it on first use (its size and TTL come from app.config["CONTENT_CACHE_SIZE"] and ["CONTENT_CACHE_TTL"])
+def getContentCache() -> ContentCache:
+    cache: ContentCache = current_app.extensions.get("content_cache")
+
+    if cache is None:
+        cache = current_app.extensions.setdefault("content_cache", ContentCache(
+            current_app.config.get("CONTENT_CACHE_SIZE", DEFAULT_CONTENT_CACHE_SIZE), current_app.config.get("CONTENT_CACHE_TTL", DEFAULT_CONTENT_CACHE_TTL)
+        ))
+
+    return cache
+
+# Returns a dict of the column values of a model instance (None stays None)
+def snapshot(obj) -> dict:
+    if obj is None:
+        return None
+
+    return {column.key: getattr(obj, column.key) for column in inspect(obj).mapper.column_attrs}
+
+def _bumpContentVersion() -> None:
+    if has_app_context():
+        cache: ContentCache = current_app.extensions.get("content_cache")
+
+        if cache is not None:
+            cache.bumpVersion()
+
+# The version is bumped as soon as a change is flushed, and again once it commits; otherwise a request reading the old rows in between could cache them
+# under the new version
+def _recordContentChange(mapper, connection, target) -> None:
+    _bumpContentVersion()
+    object_session(target).info["contentChanged"] = True
+
+for contentModel in CONTENT_MODELS:
+    for eventName in ["after_insert", "after_update", "after_delete"]:
+        event.listen(contentModel, eventName, _recordContentChange, propagate=True)
+
+# Bulk statements (query.update(), session.execute(update(Lesson)...) and so on) skip the mapper events above, so they're caught as they're executed instead
+@event.listens_for(db.session, "do_orm_execute")
+def _recordBulkContentChange(ormExecuteState) -> None:
+    mapper = ormExecuteState.bind_mapper
+
+    if (ormExecuteState.is_insert or ormExecuteState.is_update or ormExecuteState.is_delete) and mapper is not None and issubclass(mapper.class_, CONTENT_MODELS):
+        _bumpContentVersion()
+        ormExecuteState.session.info["contentChanged"] = True
+
+@event.listens_for(db.session, "after_commit")
+def _publishContentChange(session) -> None:
+    if session.info.pop("contentChanged", False):
+        _bumpContentVersion()
+
+@event.listens_for(db.session, "after_rollback")
+def _discardContentChange(session) -> None:
+    session.info.pop("contentChanged", False)
@@ -0,0 +1,153 @@
+# dashboardSnapshot.py - per-user snapshot of the data shown on the dashboard (points, streak and level progress), cached per process so that the dashboard
+# and the /user_points polling it does render without touching the database
+#
+# A snapshot is built from a single query, and kept until a change to the user's Points, UserProgress or User row is committed (or, as a backstop for
+# changes made by other processes, until it is app.config["DASHBOARD_CACHE_TTL"] seconds old). The leaderboard parts of the dashboard aren't part of the
+# snapshot, since they change with everyone's points; they come from the in-memory leaderboard instead (see calculateRankings.py).
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app, has_app_context
+from app.src.models import User, Points, UserProgress, db
+from sqlalchemy import event
+
+DEFAULT_DASHBOARD_CACHE_SIZE: int = 1024
+DEFAULT_DASHBOARD_CACHE_TTL: float = 60.0
+
+class DashboardSnapshot():
+    def __init__(self, userID: int, points: int, streak: int, level: int, xp: int, nextLevelXP: int, longestStreak: int, currentLessonID: int):
+        self.userID: int = userID
+        self.points: int = points
+        self.streak: int = streak
+        self.level: int = level
+        self.xp: int = xp
+        self.nextLevelXP: int = nextLevelXP
+        self.longestStreak: int = longestStreak
+        self.currentLessonID: int = currentLessonID
+
+    def getRemainingXP(self) -> int:
+        return max(self.nextLevelXP - self.xp, 0)
+
+    def __repr__(self) -> str:
+        return f"DashboardSnapshot(user {self.userID}: {self.points} points, level {self.level})"
+
+class DashboardCache():
+    def __init__(self, maxEntries: int = DEFAULT_DASHBOARD_CACHE_SIZE, ttl: float = DEFAULT_DASHBOARD_CACHE_TTL):
+        self.maxEntries: int = maxEntries
+        self.ttl: float = ttl
+        self.entries: OrderedDict = OrderedDict()   # user ID -> (expiry time, DashboardSnapshot), least recently used first
+        self.generation: int = 0                    # Goes up on every invalidation
+        self.lock: Lock = Lock()
+
+    # Returns the cached snapshot of a user, or None if it isn't cached (or has expired)
+    def get(self, userID: int) -> DashboardSnapshot:
+        with self.lock:
+            entry = self.entries.get(userID)
+
+            if entry is None:
+                return None
+
+            if entry[0] < time.monotonic():
+                del self.entries[userID]
+                return None
+
+            self.entries.move_to_end(userID)
+            return entry[1]
+
+    # Caches a snapshot, unless an invalidation happened since <generation> (the cache's generation from before the snapshot was built), in which case the
+    # snapshot may have been built from data that's already out of date
+    def put(self, snapshot: DashboardSnapshot, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:
+                return
+
+            self.entries[snapshot.userID] = (time.monotonic() + self.ttl, snapshot)
+            self.entries.move_to_end(snapshot.userID)
+
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, userID: int) -> None:
+        with self.lock:
+            self.entries.pop(userID, None)
+            self.generation += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+# Returns the dashboard cache of the current app, creating it on first use
+def getDashboardCache() -> DashboardCache:
+    cache: DashboardCache = current_app.extensions.get("dashboard_cache")
+
+    if cache is None:
+        cache = current_app.extensions.setdefault("dashboard_cache", DashboardCache(
+            current_app.config.get("DASHBOARD_CACHE_SIZE", DEFAULT_DASHBOARD_CACHE_SIZE), current_app.config.get("DASHBOARD_CACHE_TTL", DEFAULT_DASHBOARD_CACHE_TTL)
+        ))
+
+    return cache
+
+# Builds a user's snapshot with one query (users without Points or UserProgress rows get the same defaults as those models); None for an unknown user
+def buildDashboardSnapshot(userID: int) -> DashboardSnapshot:
+    row = db.session.query(
+        User.id, Points.points, User.streak, UserProgress.level, UserProgress.xp, UserProgress.next_level_xp, UserProgress.longest_streak,
+        UserProgress.current_lesson_id
+    ).select_from(User).outerjoin(Points, Points.user_id == User.id).outerjoin(UserProgress, UserProgress.user_id == User.id).filter(User.id == userID).first()
+
+    if row is None:
+        return None
+
+    userID, points, streak, level, xp, nextLevelXP, longestStreak, currentLessonID = row
+    return DashboardSnapshot(
+        userID, points or 0, streak or 0, level or 1, xp or 0, 1000 if nextLevelXP is None else nextLevelXP, longestStreak or 0, currentLessonID
+    )
+
+# Returns a user's (cached) dashboard snapshot
+def getDashboardSnapshot(userID: int) -> DashboardSnapshot:
+    cache: DashboardCache = getDashboardCache()
+    snapshot: DashboardSnapshot = cache.get(userID)
+
+    if snapshot is None:
+        generation: int = cache.generation
+        snapshot = buildDashboardSnapshot(userID)
+
+        if snapshot is not None:
+            cache.put(snapshot, generation)
+
+    return snapshot
+
+# Marks the snapshots of the given users as stale once the session's transaction commits; for writes that bypass the session's flush events, such as
+# the points ledger's UPDATE statements
+def markDashboardsStale(session, userIDs) -> None:
+    session.info.setdefault("staleDashboards", set()).update(userIDs)
+
+# Records every user whose points, progress or account row changed within a flush
+@event.listens_for(db.session, "before_flush")
+def _recordStaleDashboards(session, flushContext, instances) -> None:
+    userIDs: set = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Points, UserProgress)):
+            userIDs.add(obj.user_id if obj.user_id is not None or obj.user is None else obj.user.id)
+        elif isinstance(obj, User):
+            userIDs.add(obj.id)
+
+    userIDs.discard(None)
+    if userIDs:
+        markDashboardsStale(session, userIDs)
+
+@event.listens_for(db.session, "after_commit")
+def _invalidateStaleDashboards(session) -> None:
+    userIDs: set = session.info.pop("staleDashboards", None)
+
+    if userIDs and has_app_context():
+        cache: DashboardCache = current_app.extensions.get("dashboard_cache")
+
+        if cache is not None:
+            for userID in userIDs:
+                cache.invalidate(userID)
+
+@event.listens_for(db.session, "after_rollback")
+def _discardStaleDashboards(session) -> None:
+    session.info.pop("staleDashboards", None)
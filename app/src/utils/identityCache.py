@@ -0,0 +1,124 @@
+# identityCache.py - short-lived, per-process cache of logged-in accounts, so that Flask-Login's user_loader doesn't have to query the database on every request
+#
+# Accounts are cached by (role, id) as plain column values rather than ORM objects, since those belong to the session of the request that loaded them. On a cache hit
+# the account is rebuilt and attached to the current request's session without a query (relationships such as current_user.points still load lazily as usual).
+# Entries expire after app.config["IDENTITY_CACHE_TTL"] seconds (30 by default), and are dropped as soon as a change to that account is committed.
+
+import time
+from threading import Lock
+from flask import current_app, g, has_app_context
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app.src.models import User, Teacher, db
+
+DEFAULT_IDENTITY_CACHE_TTL: float = 30.0
+
+# Which table each session["login_type"] role is stored in
+ACCOUNT_MODELS: dict = {
+    "student": User,
+    "teacher": Teacher
+}
+
+class IdentityCache():
+    def __init__(self, ttl: float = DEFAULT_IDENTITY_CACHE_TTL):
+        self.ttl: float = ttl
+        self.entries: dict = {}     # (role, id) -> (expiry time, dict of column values)
+        self.lock: Lock = Lock()
+
+    # Returns the cached column values of an account, or None if it isn't cached (or has expired)
+    def get(self, role: str, accountID: int) -> dict:
+        with self.lock:
+            entry = self.entries.get((role, accountID))
+
+            if entry is None:
+                return None
+
+            if entry[0] < time.monotonic():
+                del self.entries[(role, accountID)]
+                return None
+
+            return entry[1]
+
+    def put(self, role: str, accountID: int, values: dict) -> None:
+        with self.lock:
+            self.entries[(role, accountID)] = (time.monotonic() + self.ttl, values)
+
+    def invalidate(self, role: str, accountID: int) -> None:
+        with self.lock:
+            self.entries.pop((role, accountID), None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+# Returns the identity cache of the current app, creating it on first use
+def getIdentityCache() -> IdentityCache:
+    cache: IdentityCache = current_app.extensions.get("identity_cache")
+
+    if cache is None:
+        cache = current_app.extensions.setdefault("identity_cache", IdentityCache(current_app.config.get("IDENTITY_CACHE_TTL", DEFAULT_IDENTITY_CACHE_TTL)))
+
+    return cache
+
+# Loads the account with the given ID from the table of the given role only (see ACCOUNT_MODELS); returns None for an unknown role or account
+def loadAccount(role: str, accountID: int):
+    model = ACCOUNT_MODELS.get(role)
+
+    if model is None:
+        return None
+
+    # Already part of this request's session (e.g. loaded by the route before current_user was first used)
+    account = db.session.identity_map.get(db.session.identity_key(model, accountID))
+    if account is not None:
+        return account
+
+    cache: IdentityCache = getIdentityCache()
+    values: dict = cache.get(role, accountID)
+
+    if values is not None:
+        account = model(**values)
+        make_transient_to_detached(account)     # Treated as if it was just loaded from the database, so nothing is written back
+        db.session.add(account)
+        return account
+
+    account = db.session.get(model, accountID)
+
+    if account is not None:
+        cache.put(role, accountID, {column.key: getattr(account, column.key) for column in inspect(model).column_attrs})
+
+    return account
+
+# Returns the role ("student" or "teacher") of the logged-in account, worked out once per request; None if nobody is logged in. The role is kept
+# together with the account it belongs to, so that logging in or out within the same app context (as the test client does) is noticed.
+def getCurrentRole() -> str:
+    account = current_user._get_current_object()
+
+    if g.get("current_role", (None, None))[0] is not account:
+        g.current_role = (account, account.get_role() if account.is_authenticated else None)
+
+    return g.current_role[1]
+
+# Records every account changed within a flush, so its cache entry can be dropped once the transaction commits
+@event.listens_for(db.session, "before_flush")
+def _recordChangedAccounts(session, flushContext, instances) -> None:
+    changedAccounts: set = session.info.setdefault("changedAccounts", set())
+
+    for account in list(session.dirty) + list(session.deleted):
+        if isinstance(account, (User, Teacher)) and account.id is not None:
+            changedAccounts.add((account.get_role(), account.id))
+
+@event.listens_for(db.session, "after_commit")
+def _invalidateChangedAccounts(session) -> None:
+    changedAccounts: set = session.info.pop("changedAccounts", None)
+
+    if changedAccounts and has_app_context():
+        cache: IdentityCache = current_app.extensions.get("identity_cache")
+
+        if cache is not None:
+            for role, accountID in changedAccounts:
+                cache.invalidate(role, accountID)
+
+@event.listens_for(db.session, "after_rollback")
+def _discardChangedAccounts(session) -> None:
+    session.info.pop("changedAccounts", None)
@@ -0,0 +1,84 @@
+# leaderboardSnapshot.py - saves the users of a leaderboard to a compact binary file, and reads them back through a memory map, so that a restarted worker
+# can rebuild its leaderboard without querying every user (see LeaderboardRegistry in calculateRankings.py, which then catches up from the points ledger)
+#
+# File layout (little-endian, 8-byte aligned):
+#   - header: magic, format version, number of users, ledger high-water mark, highest user ID, creation time and a CRC-32 of everything after the header
+#   - points:   int64[n], ascending
+#   - user IDs: int64[n], ascending among users with the same points
+#   - string offsets: uint32[2n + 1], into the string table, for each user's name then username
+#   - string table: UTF-8 names and usernames, back to back
+#
+# Files with another magic, version or byte order, or that fail their checksum, are treated as missing; the leaderboard is then built from the database.
+
+import mmap, os, struct, sys, time, zlib
+from array import array
+
+SNAPSHOT_MAGIC: bytes = b"LBSNAP\x00\x00"
+SNAPSHOT_VERSION: int = 1
+_HEADER: struct.Struct = struct.Struct("<8sHHIqqdI4x")
+
+class LeaderboardSnapshot():
+    def __init__(self, rows: list[tuple], lastEventID: int, maxUserID: int, createdAt: float):
+        self.rows: list[tuple] = rows               # (name, username, points, user ID), in (points, user ID) order, as the leaderboard queries return them
+        self.lastEventID: int = lastEventID         # ID of the last points ledger entry reflected in the rows
+        self.maxUserID: int = maxUserID             # Users registered after the snapshot have higher IDs than this
+        self.createdAt: float = createdAt
+
+    def __repr__(self) -> str:
+        return f"LeaderboardSnapshot({len(self.rows)} users, ledger entry {self.lastEventID})"
+
+# Writes a snapshot of <rows> (as described in LeaderboardSnapshot) to <path>; the file is written next to it first and then moved into place, so readers
+# never see a half-written snapshot. Returns the size of the file.
+def writeLeaderboardSnapshot(path: str, rows: list[tuple], lastEventID: int) -> int:
+    offsets: array = array("I", [0])
+    strings: bytearray = bytearray()
+
+    for name, username, _, _ in rows:
+        strings += (name or "").encode("utf-8")
+        offsets.append(len(strings))
+        strings += username.encode("utf-8")
+        offsets.append(len(strings))
+
+    payload: bytes = b"".join([
+        array("q", [row[2] for row in rows]).tobytes(), array("q", [row[3] for row in rows]).tobytes(), offsets.tobytes(), bytes(strings)
+    ])
+    header: bytes = _HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(rows), lastEventID, max((row[3] for row in rows), default=0), time.time(), zlib.crc32(payload)
+    )
+
+    tempPath: str = f"{path}.{os.getpid()}.tmp"
+    with open(tempPath, "wb") as file:
+        file.write(header)
+        file.write(payload)
+
+    os.replace(tempPath, path)
+    return len(header) + len(payload)
+
+# Reads the snapshot at <path>, or returns None if there isn't a usable one
+def readLeaderboardSnapshot(path: str) -> LeaderboardSnapshot:
+    if sys.byteorder != "little" or not os.path.isfile(path) or os.path.getsize(path) < _HEADER.size:
+        return None
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as snapshotMap, memoryview(snapshotMap) as view:
+        magic, version, _, numUsers, lastEventID, maxUserID, createdAt, checksum = _HEADER.unpack_from(view)
+        stringsStart: int = _HEADER.size + 16 * numUsers + 4 * (2 * numUsers + 1)
+
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or len(view) < stringsStart or zlib.crc32(view[_HEADER.size:]) != checksum:
+            return None
+
+        with view[_HEADER.size:stringsStart].cast("B") as arrays:
+            points: list[int] = arrays[:8 * numUsers].cast("q").tolist()
+            userIDs: list[int] = arrays[8 * numUsers:16 * numUsers].cast("q").tolist()
+            offsets: list[int] = arrays[16 * numUsers:].cast("I").tolist()
+
+        strings: bytes = snapshotMap[stringsStart:]
+
+    if len(strings) != offsets[-1]:
+        return None
+
+    rows: list[tuple] = [(
+        strings[offsets[2 * num]:offsets[2 * num + 1]].decode("utf-8"), strings[offsets[2 * num + 1]:offsets[2 * num + 2]].decode("utf-8"),
+        points[num], userIDs[num]
+    ) for num in range(numUsers)]
+
+    return LeaderboardSnapshot(rows, lastEventID, maxUserID, createdAt)
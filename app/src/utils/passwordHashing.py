@@ -0,0 +1,170 @@
+# passwordHashing.py - hashes and verifies passwords with bcrypt on a bounded pool of worker processes, instead of on the request threads
+#
+# bcrypt is deliberately slow (~0.25s per hash at the default cost of 12), so a burst of sign-ins (e.g. a whole class logging in at the start of a lesson)
+# would otherwise tie up every request thread. Here, at most app.config["PASSWORD_HASH_MAX_PENDING"] hashes may be queued or running at once, and a hash is
+# only queued if the ones ahead of it should be done within PASSWORD_HASH_TIMEOUT (judged by how long recent hashes took); any others are turned away before
+# they're submitted, with a PasswordHasherBusyError, which the app answers with a 503 and a Retry-After header, so that users retry shortly instead of
+# waiting behind an ever longer queue.
+#
+# Config:
+#   - BCRYPT_LOG_ROUNDS: bcrypt cost for new hashes (12 by default); accounts with hashes of another cost are rehashed when they next log in
+#   - PASSWORD_HASH_WORKERS: number of worker processes (one per CPU by default); 0 runs hashes on the calling thread, still within the pending limit
+#   - PASSWORD_HASH_MAX_PENDING: hashes that may be queued or running at once (4 per worker by default)
+#   - PASSWORD_HASH_TIMEOUT: seconds a hash may wait in the queue and run for before the request gives up with a PasswordHasherBusyError (2 by default);
+#     keep it well below the server's worker timeout (e.g. gunicorn's 30s), so that a backed-up pool answers with 503s rather than killed workers
+#
+# Hashes are in the same format as Flask-Bcrypt's, so existing passwords keep working.
+
+import os, time
+import bcrypt
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from threading import Lock
+from flask import current_app, has_app_context
+
+DEFAULT_BCRYPT_ROUNDS: int = 12
+DEFAULT_HASH_TIMEOUT: float = 2.0
+HASH_TIME_SMOOTHING: float = 0.2    # Weight of the newest hash in the running average of hash times
+
+class PasswordHasherBusyError(Exception):
+    pass
+
+# Worker pools are shared by every app in the process, one per pool size (so that tests, which create many apps, don't start a pool per app)
+_executors: dict = {}
+_executorsLock: Lock = Lock()
+
+def _getExecutor(workers: int) -> ProcessPoolExecutor:
+    with _executorsLock:
+        executor: ProcessPoolExecutor = _executors.get(workers)
+
+        if executor is None:
+            executor = _executors[workers] = ProcessPoolExecutor(max_workers=workers)
+
+        return executor
+
+# These run in the worker processes
+def _hashPassword(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+def _checkPassword(hashedPassword: str, password: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashedPassword.encode("utf-8"))
+    except ValueError:
+        return False    # Not a bcrypt hash
+
+# Returns (func(*args), seconds it took), timed in the worker so that time spent in the queue isn't counted
+def _timed(func, *args) -> tuple:
+    start: float = time.perf_counter()
+    return func(*args), time.perf_counter() - start
+
+class PasswordHasher():
+    def __init__(self, workers: int, maxPending: int, rounds: int = DEFAULT_BCRYPT_ROUNDS, timeout: float = DEFAULT_HASH_TIMEOUT):
+        self.workers: int = workers
+        self.maxPending: int = maxPending
+        self.rounds: int = rounds
+        self.timeout: float = timeout
+
+        # Metrics (see stats())
+        self.pending: int = 0       # Hashes queued or running right now, i.e. the queue depth
+        self.peakPending: int = 0
+        self.completed: int = 0
+        self.rejected: int = 0
+        self.hashSeconds: float = 0.0   # Running average of the time one hash takes on a worker (0 until one has finished)
+        self.lock: Lock = Lock()
+
+    def hashPassword(self, password: str) -> str:
+        return self.__run(_hashPassword, password, self.rounds)
+
+    def checkPassword(self, hashedPassword: str, password: str) -> bool:
+        return self.__run(_checkPassword, hashedPassword, password)
+
+    # Whether a hash was made with another cost than the current one (reading the cost from the "$2b$<cost>$..." prefix doesn't need a worker)
+    def needsRehash(self, hashedPassword: str) -> bool:
+        try:
+            return int(hashedPassword.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    # Runs one hash on the pool, or raises a PasswordHasherBusyError straight away if the pool already has its fill of pending hashes, or has more queued 
+    # than it's expected to get through within the timeout
+    def __run(self, func, *args):
+        with self.lock:
+            if self.pending >= self.maxPending:
+                self.rejected += 1
+                raise PasswordHasherBusyError(f"{self.pending} password hashes are already pending")
+
+            expectedWait: float = (self.pending // max(self.workers, 1) + 1) * self.hashSeconds
+            if self.workers > 0 and expectedWait > self.timeout:
+                self.rejected += 1
+                raise PasswordHasherBusyError(f"{self.pending} pending password hashes would take about {expectedWait:.1f}s")
+
+            self.pending += 1
+            self.peakPending = max(self.peakPending, self.pending)
+
+        if self.workers == 0:
+            try:
+                return func(*args)
+            finally:
+                self.__finish()
+
+        # The slot is only given back once the worker is done, even if the caller stops waiting for it before then
+        future = _getExecutor(self.workers).submit(_timed, func, *args)
+        future.add_done_callback(self.__finishFuture)
+
+        try:
+            return future.result(timeout=self.timeout)[0]
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHasherBusyError(f"Timed out after waiting {self.timeout}s for a password hash")
+
+    def __finish(self) -> None:
+        with self.lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def __finishFuture(self, future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            seconds: float = future.result()[1]
+
+            with self.lock:
+                self.hashSeconds = seconds if self.hashSeconds == 0 else self.hashSeconds + HASH_TIME_SMOOTHING * (seconds - self.hashSeconds)
+
+        self.__finish()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "peak_pending": self.peakPending,
+                "max_pending": self.maxPending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "hash_seconds": self.hashSeconds
+            }
+
+# Used outside of an app context (e.g. by scripts working on models directly), where there's no app to read the pool config from
+_inlineHasher: PasswordHasher = PasswordHasher(0, 1 << 30)
+
+# Returns the password hasher of the current app, creating it on first use
+def getPasswordHasher() -> PasswordHasher:
+    if not has_app_context():
+        return _inlineHasher
+
+    hasher: PasswordHasher = current_app.extensions.get("password_hasher")
+
+    if hasher is None:
+        workers: int = current_app.config.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1)
+        hasher = current_app.extensions.setdefault("password_hasher", PasswordHasher(
+            workers,
+            current_app.config.get("PASSWORD_HASH_MAX_PENDING", 4 * max(workers, 1)),
+            current_app.config.get("BCRYPT_LOG_ROUNDS", DEFAULT_BCRYPT_ROUNDS),
+            current_app.config.get("PASSWORD_HASH_TIMEOUT", DEFAULT_HASH_TIMEOUT)
+        ))
+
+    return hasher
+
+def hashPassword(password: str) -> str:
+    return getPasswordHasher().hashPassword(password)
+
+def checkPassword(hashedPassword: str, password: str) -> bool:
+    return getPasswordHasher().checkPassword(hashedPassword, password)
@@ -0,0 +1,174 @@
+# pointsLedger.py - awards points to users with atomic, server-side increments, recording every award in the PointsEvent ledger
+#
+# Points are never read, changed in Python and written back (which loses one of two awards made at the same time, e.g. from two tabs or two workers);
+# instead the database applies "UPDATE points SET points = points + :n" and returns the new total. A user's first award inserts their Points row with
+# "INSERT ... ON CONFLICT (user_id) DO UPDATE", so two first awards at the same time can't give them two rows. The ledger holds every award, so that 
+# the totals in the Points table can always be rebuilt from it (see rebuildPointsTotals()).
+#
+# These statements bypass the session's flush events, so the leaderboard deltas they cause are recorded here directly (see calculateRankings.py).
+# Nothing is committed here; awards become visible (and reach the leaderboard) when the caller commits.
+
+from datetime import datetime
+from weakref import WeakKeyDictionary
+from flask import current_app
+from sqlalchemy import update, insert, select, case, func, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.src.models import User, Points, PointsEvent, db
+from .calculateRankings import PointsDelta, LeaderboardRegistry, bumpLeaderboardGeneration
+from .dashboardSnapshot import markDashboardsStale
+
+# Gives a user <amount> points (which may be negative); returns their new total
+def awardPoints(userID: int, amount: int, reason: str, sourceID: int = None) -> int:
+    return awardPointsBatch([(userID, amount, reason, sourceID)])[userID]
+
+# Applies many awards, given as (user ID, amount, reason, source ID) tuples, with one UPDATE statement for all of the users involved plus one INSERT
+# for their ledger entries; returns a dict of user ID -> new total
+#
+# The ledger entries are only inserted once the users' Points rows are locked by the UPDATE, so that for each user, entry IDs go up in the order the awards
+# commit in; each user's newest entry ID goes on their leaderboard delta, which lets the leaderboard tell a late delta from an older transaction apart
+# from a newer one (see Leaderboard.updateUser())
+def awardPointsBatch(awards: list[tuple]) -> dict:
+    amounts: dict = {}
+    for userID, amount, _, _ in awards:
+        amounts[userID] = amounts.get(userID, 0) + amount
+
+    if not amounts:
+        return {}
+
+    totals: dict = _incrementPoints(amounts)
+
+    # Users that don't have a Points row yet get one; if another transaction inserts it first, the award is added to that row instead
+    newUsers: set = amounts.keys() - totals.keys()
+    if newUsers:
+        totals.update(_upsertPoints({userID: amounts[userID] for userID in newUsers}))
+
+    eventIDs: dict = _insertPointsEvents(awards)
+    _recordPointsDeltas({userID: (totals[userID] - amounts[userID], totals[userID], eventIDs.get(userID)) for userID in totals})
+    return totals
+
+# Adds the ledger entries of <awards>; returns user ID -> ID of their newest entry
+def _insertPointsEvents(awards: list[tuple]) -> dict:
+    now = datetime.now()
+    rows: list[dict] = [
+        {"user_id": userID, "amount": amount, "reason": reason, "source_id": sourceID, "created_at": now} for userID, amount, reason, sourceID in awards
+    ]
+    userIDs: list[int] = list({row["user_id"] for row in rows})
+
+    if db.session.get_bind().dialect.insert_executemany_returning:
+        eventIDs: dict = {}
+        for eventID, userID in db.session.execute(insert(PointsEvent).returning(PointsEvent.id, PointsEvent.user_id), rows):
+            eventIDs[userID] = max(eventID, eventIDs.get(userID, 0))
+
+        return eventIDs
+
+    db.session.execute(insert(PointsEvent), rows)
+    return dict(db.session.execute(select(PointsEvent.user_id, func.max(PointsEvent.id)).where(PointsEvent.user_id.in_(userIDs)).group_by(PointsEvent.user_id)).all())
+
+# Adds amounts[user ID] to each user's points in one statement; returns user ID -> new total for the users that have a Points row
+def _incrementPoints(amounts: dict) -> dict:
+    statement = update(Points).where(Points.user_id.in_(list(amounts))).values(
+        points=func.coalesce(Points.points, 0) + case(amounts, value=Points.user_id, else_=0)
+    ).execution_options(synchronize_session=False)
+
+    if db.session.get_bind().dialect.update_returning:
+        return {userID: points for userID, points in db.session.execute(statement.returning(Points.user_id, Points.points))}
+
+    # Databases without UPDATE ... RETURNING read the new totals back within the same transaction instead
+    db.session.execute(statement)
+    return {userID: points for userID, points in db.session.execute(select(Points.user_id, Points.points).where(Points.user_id.in_(list(amounts))))}
+
+# Whether each database has the unique index on Points.user_id that _upsertPoints() relies on; databases made before it that haven't run
+# "flask db upgrade" yet don't (db.create_all() doesn't add indexes to existing tables)
+_upsertSupport: WeakKeyDictionary = WeakKeyDictionary()
+
+def _canUpsertPoints() -> bool:
+    engine = db.session.get_bind()
+    supported: bool = _upsertSupport.get(engine)
+
+    if supported is None:
+        inspector = inspect(db.session.connection())
+        supported = any(index["unique"] and index["column_names"] == ["user_id"] for index in inspector.get_indexes("points")) or any(
+            constraint["column_names"] == ["user_id"] for constraint in inspector.get_unique_constraints("points")
+        )
+
+        if not supported:
+            current_app.logger.warning("points.user_id has no unique index, so first awards can't upsert; run \"flask db upgrade\" to add it")
+
+        _upsertSupport[engine] = supported
+
+    return supported
+
+# Inserts a Points row with amounts[user ID] for each user, or adds the amount to the user's row if there already is one (relies on the unique index
+# on Points.user_id; without it, rows are simply inserted, as before the index existed); returns user ID -> new total
+def _upsertPoints(amounts: dict) -> dict:
+    dialectName: str = db.session.get_bind().dialect.name
+    rows: list[dict] = [{"user_id": userID, "points": amount} for userID, amount in amounts.items()]
+
+    if not _canUpsertPoints():
+        db.session.execute(insert(Points), rows)
+        return dict(amounts)
+
+    if dialectName == "mysql":
+        statement = mysql_insert(Points).values(rows)
+        statement = statement.on_duplicate_key_update(points=func.coalesce(Points.points, 0) + statement.inserted.points)
+    else:
+        upsertInsert = postgresql_insert if dialectName == "postgresql" else sqlite_insert
+        statement = upsertInsert(Points).values(rows)
+        statement = statement.on_conflict_do_update(index_elements=[Points.user_id], set_={"points": func.coalesce(Points.points, 0) + statement.excluded.points})
+
+    if db.session.get_bind().dialect.insert_returning and dialectName != "mysql":
+        return {userID: points for userID, points in db.session.execute(statement.returning(Points.user_id, Points.points))}
+
+    db.session.execute(statement)
+    return {userID: points for userID, points in db.session.execute(select(Points.user_id, Points.points).where(Points.user_id.in_(list(amounts))))}
+
+# Queues the leaderboard deltas of users whose totals were changed by an UPDATE, given as user ID -> (old total, new total, newest ledger entry ID), for
+# the leaderboard to apply once the transaction commits (and marks their dashboard snapshots as stale); also refreshes any of their Points objects already loaded in the session, which the UPDATE didn't touch
+def _recordPointsDeltas(changes: dict) -> None:
+    if not changes:
+        return
+
+    deltas: list[PointsDelta] = db.session.info.setdefault("pointsDeltas", [])
+
+    for userID, name, username in db.session.query(User.id, User.name, User.username).filter(User.id.in_(list(changes))):
+        oldPoints, newPoints, version = changes[userID]
+        deltas.append(PointsDelta(userID, name, username, oldPoints, newPoints, version))
+
+    for obj in db.session.identity_map.values():
+        if isinstance(obj, Points) and obj.user_id in changes:
+            db.session.expire(obj, ["points"])
+
+    markDashboardsStale(db.session, changes)
+
+# One-time step for databases that had points before the ledger existed: gives every user with points but no ledger entries an "opening_balance" entry,
+# so that rebuildPointsTotals() keeps their points. Returns the number of entries added.
+def openPointsLedger() -> int:
+    loggedUsers = select(PointsEvent.user_id)
+    balances = db.session.query(Points.user_id, Points.points).filter(Points.points != 0, Points.user_id.not_in(loggedUsers)).all()
+
+    if balances:
+        now = datetime.now()
+        db.session.execute(insert(PointsEvent), [
+            {"user_id": userID, "amount": points, "reason": "opening_balance", "source_id": None, "created_at": now} for userID, points in balances
+        ])
+
+    db.session.commit()
+    return len(balances)
+
+# Recomputes every user's points total from the ledger in one statement; returns the number of Points rows that changed. The leaderboards are
+# re-synced with the database afterwards, since this bypasses the session's flush events as well.
+def rebuildPointsTotals() -> int:
+    ledgerTotal = select(func.coalesce(func.sum(PointsEvent.amount), 0)).where(PointsEvent.user_id == Points.user_id).scalar_subquery()
+    result = db.session.execute(
+        update(Points).where(func.coalesce(Points.points, 0) != ledgerTotal).values(points=ledgerTotal).execution_options(synchronize_session=False)
+    )
+    bumpLeaderboardGeneration()
+    db.session.commit()
+
+    registry: LeaderboardRegistry = current_app.extensions.get("leaderboards")
+    if registry is not None:
+        registry.updateData()
+
+    return result.rowcount
@@ -0,0 +1,161 @@
+# pointsRollup.py - rolls the points ledger (PointsEvent) up into per-user totals for each leaderboard window ("week" and "month"), which back the
+# time-windowed leaderboards served by /api/leaderboard?window=...
+#
+# The rollup is incremental: PointsRollupState remembers the highest ledger entry ID counted, so each run only reads the entries added since. Ledger IDs
+# are handed out when an entry is inserted, not when its transaction commits, so an entry can become visible after higher IDs were rolled up; each run
+# therefore also re-reads the last ROLLUP_OVERLAP IDs below the high-water mark, skipping the entries already counted there (kept in PointsRollupEvent).
+# An entry whose transaction commits after ROLLUP_OVERLAP later entries were rolled up is still missed. It runs in a
+# background thread every POINTS_ROLLUP_INTERVAL seconds (and can be run by hand with "flask --app run_app.py rollup-points"), so windowed leaderboards
+# lag behind the ledger by up to that long. Several processes may run it at once; a run only commits if nobody else moved the rollup on in the meantime.
+
+from datetime import date, datetime, timedelta
+from threading import Event, Thread
+from sqlalchemy import update, insert, delete
+from sqlalchemy.exc import IntegrityError
+from app.src.models import User, PointsEvent, PointsWindowTotal, PointsRollupState, PointsRollupEvent, user_course, db
+from .calculateRankings import Leaderboard, getLeaderboardRegistry, getLeaderboard
+
+WINDOWS: tuple = ("week", "month")
+DEFAULT_ROLLUP_INTERVAL: int = 60       # Seconds between background rollups; 0 turns the background thread off
+ROLLUP_BATCH_SIZE: int = 5000           # Ledger entries rolled up per transaction
+ROLLUP_OVERLAP: int = 1000              # Ledger IDs below the high-water mark that are read again by every run, for entries that committed late
+
+# Returns the first day of the window that the given moment falls in (weeks start on Monday)
+def getWindowStart(window: str, moment: datetime) -> date:
+    day: date = moment.date() if isinstance(moment, datetime) else moment
+
+    if window == "week":
+        return day - timedelta(days=day.weekday())
+    elif window == "month":
+        return day.replace(day=1)
+
+    raise ValueError(f"Unknown leaderboard window: {window}")
+
+# Creates the rollup state row if it doesn't exist yet
+def _createRollupState() -> None:
+    if db.session.query(PointsRollupState.id).filter_by(id=1).first() is None:
+        try:
+            db.session.add(PointsRollupState(id=1, last_event_id=0))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()   # Another process created it first
+
+# Returns the highest ledger entry ID counted by the rollup
+def getRollupHighWaterMark() -> int:
+    return db.session.query(PointsRollupState.last_event_id).filter_by(id=1).scalar() or 0
+
+# Returns the version of the window totals, which changes with every committed rollup batch (including ones that only counted late entries)
+def getRollupVersion() -> tuple:
+    return tuple(db.session.query(PointsRollupState.last_event_id, PointsRollupState.rolled_up_at).filter_by(id=1).first() or (0, None))
+
+# Adds every ledger entry that hasn't been rolled up yet to the window totals; returns the number of entries rolled up
+def rollupPoints(batchSize: int = ROLLUP_BATCH_SIZE) -> int:
+    numRolledUp: int = 0
+    _createRollupState()
+
+    while True:
+        lastEventID: int = getRollupHighWaterMark()
+
+        # Databases rolled up before PointsRollupEvent existed have no record of the entries counted below the high-water mark, so they start from it
+        firstEventID: int = lastEventID
+        if db.session.query(PointsRollupEvent.event_id).first() is not None:
+            firstEventID -= ROLLUP_OVERLAP
+
+        events: list[tuple] = db.session.query(PointsEvent.id, PointsEvent.user_id, PointsEvent.amount, PointsEvent.created_at).outerjoin(
+            PointsRollupEvent, PointsRollupEvent.event_id == PointsEvent.id
+        ).filter(PointsEvent.id > firstEventID, PointsRollupEvent.event_id.is_(None)).order_by(PointsEvent.id).limit(batchSize).all()
+
+        if not events:
+            return numRolledUp
+
+        amounts: dict = {}      # (window, window start, user ID) -> points
+        for _, userID, amount, createdAt in events:
+            for window in WINDOWS:
+                key: tuple = (window, getWindowStart(window, createdAt), userID)
+                amounts[key] = amounts.get(key, 0) + amount
+
+        totals: dict = {
+            (total.window, total.window_start, total.user_id): total for total in PointsWindowTotal.query.filter(
+                PointsWindowTotal.user_id.in_({userID for _, _, userID in amounts}),
+                PointsWindowTotal.window_start.in_({windowStart for _, windowStart, _ in amounts})
+            )
+        }
+
+        for key, amount in amounts.items():
+            if key in totals:
+                totals[key].points += amount
+            else:
+                db.session.add(PointsWindowTotal(window=key[0], window_start=key[1], user_id=key[2], points=amount))
+
+        # Records the entries counted within the overlap of the new high-water mark, and forgets those that fell out of it
+        newLastEventID: int = max(lastEventID, events[-1][0])
+        countedIDs: list[dict] = [{"event_id": eventID} for eventID, _, _, _ in events if eventID > newLastEventID - ROLLUP_OVERLAP]
+        db.session.execute(delete(PointsRollupEvent).where(PointsRollupEvent.event_id <= newLastEventID - ROLLUP_OVERLAP))
+
+        # Moves the rollup on only from where this run started; if another process got there first, its totals already include these entries (and if 
+        # it counted any of the same late entries, recording them again fails)
+        claimed: int = db.session.execute(
+            update(PointsRollupState).where(PointsRollupState.id == 1, PointsRollupState.last_event_id == lastEventID).values(
+                last_event_id=newLastEventID, rolled_up_at=datetime.now()
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+
+        if not claimed:
+            db.session.rollback()
+            continue
+
+        try:
+            if countedIDs:
+                db.session.execute(insert(PointsRollupEvent), countedIDs)
+
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            continue
+
+        numRolledUp += len(events)
+
+# Returns the leaderboard of the current week or month (or of all time, for "all"), optionally limited to the users of a course. Windowed leaderboards are built
+# from the rolled up totals only, and are kept until the rollup moves on.
+def getWindowLeaderboard(window: str, courseID: int = None) -> Leaderboard:
+    if window == "all":
+        return getLeaderboard(courseID)
+
+    windowStart: date = getWindowStart(window, datetime.now())
+
+    def loadEntries() -> list[tuple]:
+        query = db.session.query(User.name, User.username, PointsWindowTotal.points, User.id).join(
+            PointsWindowTotal, PointsWindowTotal.user_id == User.id
+        ).filter(PointsWindowTotal.window == window, PointsWindowTotal.window_start == windowStart)
+
+        if courseID is not None:
+            query = query.join(user_course, user_course.c.user_id == User.id).filter(user_course.c.course_id == courseID)
+
+        return query.order_by(PointsWindowTotal.points, User.id).all()
+
+    return getLeaderboardRegistry().getWindowLeaderboard((window, windowStart, courseID), getRollupVersion(), loadEntries)
+
+# Starts a daemon thread that rolls up the ledger every <interval> seconds; set the returned event to stop it
+def startPointsRollup(app, interval: int) -> Event:
+    stopped: Event = Event()
+
+    def run() -> None:
+        while not stopped.wait(interval):
+            with app.app_context():
+                try:
+                    rollupPoints()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("Rolling up the points ledger failed")
+                finally:
+                    db.session.remove()
+
+    Thread(target=run, name="points-rollup", daemon=True).start()
+    return stopped
+
+# Starts the background rollup for an app, unless it is disabled (POINTS_ROLLUP_INTERVAL = 0) or the app is being tested
+def initPointsRollup(app) -> None:
+    interval: int = app.config.get("POINTS_ROLLUP_INTERVAL", DEFAULT_ROLLUP_INTERVAL)
+
+    if interval and not app.testing:
+        app.extensions["points_rollup"] = startPointsRollup(app, interval)
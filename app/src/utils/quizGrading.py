@@ -0,0 +1,104 @@
+# quizGrading.py - grades quiz submissions against the quizzes stored in the database (Quiz/QuizQuestion/QuizAnswer)
+#
+# Each quiz is compiled once into an AnswerKey (question ID -> set of correct answer IDs), which is kept in the content cache (see contentCache.py) until any
+# quiz content changes. A submission is a dict of question ID -> selected answer ID(s), and is graded in a single pass over the quiz's questions.
+
+from sqlalchemy.orm import selectinload
+from app.src.models import QuizQuestion, QuizAnswer, QuizSubmission, db
+from .contentCache import getContentCache
+
+class AnswerKey():
+    def __init__(self, quizID: int):
+        self.quizID: int = quizID
+        self.questionIDs: list[int] = []        # In question order
+        self.questionContent: dict = {}         # question ID -> question text
+        self.correctAnswers: dict = {}          # question ID -> frozenset of correct answer IDs
+        self.answerContent: dict = {}           # answer ID -> answer text
+
+    def getNumQuestions(self) -> int:
+        return len(self.questionIDs)
+
+# The result of grading one submission; results holds (question ID, frozenset of selected answer IDs, whether the question was answered correctly) per question
+class GradedSubmission():
+    def __init__(self, quizID: int, score: int, numQuestions: int, results: list[tuple]):
+        self.quizID: int = quizID
+        self.score: int = score
+        self.numQuestions: int = numQuestions
+        self.results: list[tuple] = results
+
+    def __repr__(self) -> str:
+        return f"GradedSubmission(quiz {self.quizID}: {self.score}/{self.numQuestions})"
+
+# Compiles the answer key of a quiz with one query for its questions and one for their answers
+def buildAnswerKey(quizID: int) -> AnswerKey:
+    answerKey = AnswerKey(quizID)
+    correctAnswers: dict = {}
+
+    for question in QuizQuestion.query.filter_by(quiz_id=quizID).order_by(QuizQuestion.id):
+        answerKey.questionIDs.append(question.id)
+        answerKey.questionContent[question.id] = question.question_content
+        correctAnswers[question.id] = set()
+
+    for answer in QuizAnswer.query.filter_by(quiz_id=quizID).order_by(QuizAnswer.id):
+        answerKey.answerContent[answer.id] = answer.answer_content
+
+        if answer.correct and answer.quiz_question_id in correctAnswers:
+            correctAnswers[answer.quiz_question_id].add(answer.id)
+
+    answerKey.correctAnswers = {questionID: frozenset(answerIDs) for questionID, answerIDs in correctAnswers.items()}
+    return answerKey
+
+# Returns the (cached) answer key of a quiz
+def getAnswerKey(quizID: int) -> AnswerKey:
+    return getContentCache().get("answer_key", quizID, lambda: buildAnswerKey(quizID))
+
+# Grades one submission, given as a dict of question ID -> selected answer ID (or a collection of IDs, for questions with several correct answers).
+# A question counts as correct only if exactly its correct answers were selected; unanswered questions and unknown IDs are simply wrong.
+def gradeSubmission(answerKey: AnswerKey, selections: dict) -> GradedSubmission:
+    score: int = 0
+    results: list[tuple] = []
+
+    for questionID in answerKey.questionIDs:
+        selected = selections.get(questionID, ())
+        selected = frozenset((selected,) if isinstance(selected, int) else selected)
+        correct: bool = bool(selected) and selected == answerKey.correctAnswers[questionID]
+
+        score += correct
+        results.append((questionID, selected, correct))
+
+    return GradedSubmission(answerKey.quizID, score, answerKey.getNumQuestions(), results)
+
+# Grades many submissions of the same quiz, fetching its answer key only once
+def gradeSubmissions(quizID: int, selectionsList: list[dict]) -> list[GradedSubmission]:
+    answerKey: AnswerKey = getAnswerKey(quizID)
+    return [gradeSubmission(answerKey, selections) for selections in selectionsList]
+
+# Re-grades every stored submission of a quiz against its current answer key (e.g. after a teacher fixed a wrong answer), updating their scores and
+# per-question results in one transaction. Points that were already awarded are left as they are. Returns the number of submissions whose score changed.
+def regradeSubmissions(quizID: int) -> int:
+    submissions: list[QuizSubmission] = QuizSubmission.query.filter_by(quiz_id=quizID).options(selectinload(QuizSubmission.answers)).all()
+    selectionsList: list[dict] = []
+
+    for submission in submissions:
+        selections: dict = {}
+
+        for answer in submission.answers:
+            if answer.quiz_question_id is not None and answer.quiz_answer_id is not None:
+                selections.setdefault(answer.quiz_question_id, set()).add(answer.quiz_answer_id)
+
+        selectionsList.append(selections)
+
+    numChanged: int = 0
+
+    for submission, graded in zip(submissions, gradeSubmissions(quizID, selectionsList)):
+        correctByQuestion: dict = {questionID: correct for questionID, _, correct in graded.results}
+
+        for answer in submission.answers:
+            answer.correct = correctByQuestion.get(answer.quiz_question_id, False)
+
+        if (submission.score, submission.num_questions) != (graded.score, graded.numQuestions):
+            submission.score, submission.num_questions = graded.score, graded.numQuestions
+            numChanged += 1
+
+    db.session.commit()
+    return numChanged
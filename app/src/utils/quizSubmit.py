@@ -1,146 +1,253 @@
-import json, re
-from flask import Blueprint, jsonify, request, redirect, url_for, session
+import json, binascii
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from flask import Blueprint, jsonify, request, redirect, url_for, session, current_app, Response, stream_with_context
 from flask_login import current_user, login_required
 from datetime import datetime
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import selectinload
 from app.src.app import db
+from app.src.models import QuizSubmission, QuizSubmissionAnswer
+from .quizGrading import getAnswerKey, gradeSubmission, regradeSubmissions
+from .identityCache import getCurrentRole
+from .pointsLedger import awardPoints
 
 quiz_api = Blueprint("quiz_api", __name__)
 
-try:
-    # Pulling json data from "questions.json"
-    with open("../json/questions.json", "r") as f:
-        data = json.load(f)
-
-except IOError:
-    print("questions.json file not found")
-    with open("../json/questions.json", "x") as f:
-        data = {
-            "number": 1,
-            "topic": 2,
-            "name": "Prime Factorization",
-            "num_questions": 3,
-            "revision": "2024-03-24",
-            "max_xp_points": 100,
-            "questions": [
-                {
-                    "number": 1,
-                    "question": "Which of the following is not a prime number?",
-                    "answers": ["2", "3", "4", "5"],
-                    "correct_answer": "4",
-                },
-                {
-                    "number": 2,
-                    "question": "What is the prime factorization of 150?",
-                    "answers": [
-                        "2 × 3 × 5²",
-                        "2² × 3² × 5²",
-                        "3² + 4² + 5³",
-                        "2³ × 3 × 5²",
-                    ],
-                    "correct_answer": "2 × 3 × 5²",
-                },
-                {
-                    "number": 2,
-                    "question": "Making a factor tree is not an effective way to demonstrate the prime factorization of a number.",
-                    "answers": ["True", "False"],
-                    "correct_answer": "False",
-                },
-            ],
-        }
-
-        json.dump(data, f)
-        # data = json.load(f)
-        # exit()
-
-try:
-    # Pulling json data from "responses.json"
-    with open("../json/responses.json") as f:
-        listObj = json.load(f)
-
-except IOError:
-    print("responses.json file not found")
-    with open("../json/responses.json", "x") as f:
-        json.dump({}, f)
-    # exit()
-
+DEFAULT_QUIZ_MAX_POINTS = 100
 
 @quiz_api.route("/submit")
 @login_required
 def SubmitQuiz():
-    queryStr = request.query_string.decode()
-    print(queryStr)
-
-    # Currently hardcoded to choose quiz #2 (Prime Factorization) every single time for the demo;
-    # we would change this to be dynamic in the future (send through query string of what quiz number)
-    moduleNum = 1
-    topicNum = 2
-    userAnswers = {
-        (int(re.findall("\d+", answer)[0]) - 1): (int(re.findall("\d+", answer)[2]))
-        for answer in queryStr.split("&")
-    }
-    chosenQuiz = [
-        quiz
-        for quiz in data["module"]
-        if quiz["number"] == moduleNum and quiz["topic"] == topicNum
-    ][0]
-    totalNumQs = chosenQuiz["num_questions"]
-
-    # Initializing new submission with timestamp
-    timestamp = str(datetime.now())
-    score = 0
-    # individual question data stored as list
-    listObj[timestamp] = {"data": []}
-    listObj[timestamp]["module"] = str(chosenQuiz["number"])
-    listObj[timestamp]["topic"] = str(chosenQuiz["topic"])
-    listObj[timestamp]["user_id"] = current_user.id
-
-    # Created for loop to iterate for all the questions defined in "questions.json"
-    for i in range(totalNumQs):
-        # Initialized response variable with user's response
-        response = chosenQuiz["questions"][i]["answers"][userAnswers[i]]
-        # Pulling expected value from "questions.json" file
-        correct_resp = str(chosenQuiz["questions"][i]["correct_answer"])
-
-        try:
-            # Appending user response to "responses.json"
-            listObj[timestamp]["data"].append(
-                {
-                    "number": str(chosenQuiz["questions"][i]["number"]),
-                    "question": str(chosenQuiz["questions"][i]["question"]),
-                    "answers": str(chosenQuiz["questions"][i]["answers"]),
-                    "user_answer": response,
-                    "correct": response == correct_resp,
-                }
+    # Submissions and their points belong to students; a teacher's ID would be taken for the student with the same ID
+    if getCurrentRole() != "student":
+        return "403: Forbidden", 403
+
+    # The quiz form sends the quiz ID, plus "question_<question ID>=<answer ID>" for every answered question (repeated for questions with several answers)
+    quizID = request.args.get("quiz_id", type=int)
+    if quizID is None:
+        return "400: Bad request", 400
+
+    selections = {}
+    for name, values in request.args.lists():
+        if name.startswith("question_") and name[9:].isdigit():
+            selections[int(name[9:])] = {int(value) for value in values if value.isdigit()}
+
+    answerKey = getAnswerKey(quizID)
+    if answerKey.getNumQuestions() == 0:
+        return "404: Quiz not found", 404
+
+    graded = gradeSubmission(answerKey, selections)
+
+    # The submission and the points it awards are written to the database in one transaction
+    submission = QuizSubmission(
+        user_id=current_user.id,
+        quiz_id=quizID,
+        submitted_at=datetime.now(),
+        score=graded.score,
+        num_questions=graded.numQuestions,
+        points_awarded=round(current_app.config.get("QUIZ_MAX_POINTS", DEFAULT_QUIZ_MAX_POINTS) * (graded.score / graded.numQuestions))
+    )
+
+    # One row per selected answer (or a single empty one for an unanswered question)
+    for questionNum, (questionID, selected, correct) in enumerate(graded.results, start=1):
+        for answerID in (sorted(selected) or [None]):
+            submission.answers.append(
+                QuizSubmissionAnswer(
+                    question_number=questionNum,
+                    quiz_question_id=questionID,
+                    quiz_answer_id=answerID,
+                    question_content=answerKey.questionContent[questionID],
+                    user_answer=answerKey.answerContent.get(answerID),
+                    correct=correct
+                )
             )
-            if response == correct_resp:
-                # Implement logic for the case where user enters the correct response
-                score += 1
-            else:
-                # Implement logic for the case where user enters the wrong response
-                pass
-            listObj[timestamp]["points"] = score
-            listObj[timestamp]["score"] = "{}/{}".format(score, totalNumQs)
-            with open("../json/responses.json", "w") as f:
-                json.dump(listObj, f, indent=4, separators=(",", ": "))
-        except IOError:
-            print("responses.json file not found")
-            redirect(url_for("main.dashboard_page"))
 
     # Update current user's points based off of their score and max XP points given from quiz
-    current_user.points.points += round(chosenQuiz["max_xp_points"] * (score / totalNumQs))
-    print(current_user.points.points)
+    db.session.add(submission)
+    db.session.flush()
+    if submission.points_awarded:
+        awardPoints(current_user.id, submission.points_awarded, "quiz", submission.id)
     db.session.commit()
 
     # Store user's quiz results in local Flask session to be used + rendered in redirected route
-    session["quiz_num_q"] = totalNumQs
-    session["quiz_score"] = score
+    session["quiz_num_q"] = graded.numQuestions
+    session["quiz_score"] = graded.score
 
     return redirect(url_for("main.quiz_results"))
 
+# Re-grades every submission of a quiz against its current answers (for teachers, after fixing a quiz)
+@quiz_api.route("/quiz/<int:quiz_id>/regrade", methods=["POST"])
+@login_required
+def RegradeQuiz(quiz_id):
+    if getCurrentRole() != "teacher":
+        return "403: Forbidden", 403
+
+    return jsonify({"quiz_id": quiz_id, "changed": regradeSubmissions(quiz_id)}), 200
+
+
+DEFAULT_SUBMISSIONS_PAGE_SIZE = 50
+MAX_SUBMISSIONS_PAGE_SIZE = 500
+SUBMISSIONS_STREAM_BATCH_SIZE = 500
 
 @quiz_api.route("/submissions", methods=["GET"])
+@login_required
 def GetSubmissions():
-    return jsonify(listObj)
+    """
+    Lists quiz submissions in order of submission time, optionally filtered by user_id, quiz_id and a since/until date range (ISO 8601 dates or times).
+    Students can only see their own submissions, while teachers can see anyone's.
+
+    By default, returns a page of up to <limit> submissions (50 if not given, at most 500):
+    {
+        "submissions" : [ <submission>, ... ],
+        "next_cursor" : String to pass as "cursor" for the next page, or null on the last page
+    }
+
+    With format=ndjson, every matching submission is instead streamed back as one JSON object per line, fetched from the database in batches so that
+    exporting a whole term's submissions doesn't need the whole export in memory.
+    """
+    try:
+        query = filter_submissions(request.args)
+        cursor = decode_submissions_cursor(request.args.get("cursor"))
+    except ValueError:
+        return "400: Bad request", 400
+
+    if request.args.get("format") == "ndjson":
+        return Response(stream_with_context(stream_submissions(query, cursor)), mimetype="application/x-ndjson")
+
+    limit = min(max(request.args.get("limit", DEFAULT_SUBMISSIONS_PAGE_SIZE, type=int), 1), MAX_SUBMISSIONS_PAGE_SIZE)
+    submissions = fetch_submissions_page(query, cursor, limit + 1)   # One extra row tells whether there is another page
+    has_next = len(submissions) > limit
+    submissions = submissions[:limit]
+
+    return jsonify({
+        "submissions": [serialize_submission(submission) for submission in submissions],
+        "next_cursor": encode_submissions_cursor(submissions[-1]) if has_next else None
+    })
+
+# Builds the submissions query for the filters given in the request args; raises ValueError for malformed filters
+def filter_submissions(args):
+    query = QuizSubmission.query
+
+    if getCurrentRole() != "teacher":
+        query = query.filter(QuizSubmission.user_id == current_user.id)
+    elif args.get("user_id"):
+        query = query.filter(QuizSubmission.user_id == int(args["user_id"]))
+
+    if args.get("quiz_id"):
+        query = query.filter(QuizSubmission.quiz_id == int(args["quiz_id"]))
+    if args.get("since"):
+        query = query.filter(QuizSubmission.submitted_at >= datetime.fromisoformat(args["since"]))
+    if args.get("until"):
+        query = query.filter(QuizSubmission.submitted_at < datetime.fromisoformat(args["until"]))
+
+    return query
+
+# Cursors point just past the last submission of a page, as "<submitted_at>,<id>" (the ID breaks ties between submissions made at the same time)
+def encode_submissions_cursor(submission):
+    return urlsafe_b64encode(f"{submission.submitted_at.isoformat()},{submission.id}".encode()).decode()
+
+def decode_submissions_cursor(cursor):
+    if not cursor:
+        return None
+
+    try:
+        submitted_at, _, submission_id = urlsafe_b64decode(cursor.encode()).decode().partition(",")
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Malformed cursor")
+
+    return datetime.fromisoformat(submitted_at), int(submission_id)
+
+# Returns up to <limit> submissions that come after the cursor, seeking straight to it rather than skipping over the previous pages
+def fetch_submissions_page(query, cursor, limit):
+    if cursor is not None:
+        submitted_at, submission_id = cursor
+        query = query.filter(or_(
+            QuizSubmission.submitted_at > submitted_at,
+            and_(QuizSubmission.submitted_at == submitted_at, QuizSubmission.id > submission_id)
+        ))
+
+    return query.options(selectinload(QuizSubmission.answers)).order_by(QuizSubmission.submitted_at, QuizSubmission.id).limit(limit).all()
+
+# Yields every submission after the cursor as a line of JSON, one batch of submissions at a time
+def stream_submissions(query, cursor):
+    while True:
+        submissions = fetch_submissions_page(query, cursor, SUBMISSIONS_STREAM_BATCH_SIZE)
+
+        for submission in submissions:
+            yield json.dumps(serialize_submission(submission)) + "\n"
+
+        if len(submissions) < SUBMISSIONS_STREAM_BATCH_SIZE:
+            break
+
+        cursor = (submissions[-1].submitted_at, submissions[-1].id)
+
+        # Don't keep the batches that were already sent in the session's identity map (expunging a submission expunges its answers as well)
+        for submission in submissions:
+            db.session.expunge(submission)
+
+def serialize_submission(submission):
+    return {
+        "id": submission.id,
+        "user_id": submission.user_id,
+        "quiz_id": submission.quiz_id,
+        "module": submission.module_number,
+        "topic": submission.topic_number,
+        "submitted_at": submission.submitted_at.isoformat(),
+        "score": submission.score,
+        "num_questions": submission.num_questions,
+        "points_awarded": submission.points_awarded,
+        "answers": [
+            {
+                "number": answer.question_number,
+                "question_id": answer.quiz_question_id,
+                "question": answer.question_content,
+                "answer_id": answer.quiz_answer_id,
+                "user_answer": answer.user_answer,
+                "correct": answer.correct
+            } for answer in submission.answers
+        ]
+    }
+
+
+# One-shot import of the submissions saved in the old responses.json file (keyed by submission timestamp) into the QuizSubmission table.
+# Submissions that were already imported (same user and timestamp) are skipped, so running it twice does no harm. Returns the number of submissions imported.
+def import_responses(path="../json/responses.json"):
+    with open(path) as f:
+        responses = json.load(f)
+
+    existing = set(db.session.query(QuizSubmission.user_id, QuizSubmission.submitted_at))
+    submissions = []
+
+    for timestamp, response in responses.items():
+        submitted_at = datetime.fromisoformat(timestamp)
+
+        if (response["user_id"], submitted_at) in existing:
+            continue
+
+        score, _, num_questions = str(response.get("score", "")).partition("/")
+        submission = QuizSubmission(
+            user_id=response["user_id"],
+            module_number=int(response["module"]),
+            topic_number=int(response["topic"]),
+            submitted_at=submitted_at,
+            score=int(response.get("points", sum(answer["correct"] for answer in response["data"]))),
+            num_questions=int(num_questions) if num_questions else len(response["data"]),
+            points_awarded=0    # The JSON file never recorded the points that were awarded
+        )
+        submission.answers = [
+            QuizSubmissionAnswer(
+                question_number=int(answer["number"]),
+                question_content=answer["question"],
+                user_answer=answer.get("user_answer"),
+                correct=answer["correct"]
+            ) for answer in response["data"]
+        ]
+        submissions.append(submission)
+
+    db.session.add_all(submissions)
+    db.session.commit()
+
+    return len(submissions)
 
 
 # with open("/app/src/templates/results.html", "w+") as f:
@@ -0,0 +1,370 @@
+# sharedRankings.py - a ranking store in a memory-mapped file, so that every worker process of the app reads one copy of the global leaderboard instead of
+# building (and keeping up to date) its own (see SharedLeaderboard in calculateRankings.py, which serves the leaderboard API on top of it)
+#
+# There is a single writer (the worker that holds the store's lock file), which publishes the whole leaderboard every time it changes, and any number of
+# readers, which never lock anything. The file holds two slots, and a sequence counter in its header (a seqlock) tells which one is current:
+#   - while the counter is even (2k), slot k % 2 is current, and the other slot is free
+#   - to publish, the writer sets the counter to 2k + 1, fills slot (k + 1) % 2, then sets the counter to 2k + 2, which makes that slot current
+# A reader notes the counter, reads the slot it points to, and reads the counter again; the read is consistent as long as the writer hasn't started
+# filling that same slot in the meantime (i.e. the counter moved on by 2 at most), and is retried otherwise. Since the writer fills the other slot first,
+# readers only retry when two publishes happen during one read.
+#
+# When a leaderboard outgrows the file, the writer publishes into a bigger file, moves it into place, and marks the old one as retired; readers that see
+# the mark reopen the path. Within a process, reads in progress on other threads keep the old mapping open until they finish (see read()).
+#
+# File layout (little-endian, native int64s, so the file is only shared between processes on one machine):
+#   - header: magic, format version, retired flag, sequence counter, user capacity, string capacity, username index size
+#   - 2 slots, each: number of users, bytes of strings used, ledger high-water mark, then
+#       points, user IDs and ranks (int64[capacity] each, in leaderboard page order: most points first, ties by user ID),
+#       string offsets (int64[2 * capacity + 1]) into the slot's UTF-8 names and usernames,
+#       a username index (int64[index size]: open addressing over CRC-32s of usernames, holding position + 1, 0 for an empty bucket),
+#       and the strings themselves
+
+import mmap, os, struct, sys, zlib
+from array import array
+from contextlib import contextmanager
+from threading import local, RLock
+
+SHARED_RANKINGS_MAGIC: bytes = b"LBSHARED"
+SHARED_RANKINGS_VERSION: int = 1
+MIN_USER_CAPACITY: int = 1024
+
+_HEADER: struct.Struct = struct.Struct("<8sHH4xQQQQ16x")
+_SEQ: struct.Struct = struct.Struct("<Q")
+_SEQ_OFFSET: int = 16
+_RETIRED_OFFSET: int = 10
+_SLOT_HEADER: struct.Struct = struct.Struct("<qqq8x")
+
+class SharedRankingsError(Exception):
+    pass
+
+# One slot of the store, read through memoryviews of the file (nothing is copied until a row is asked for)
+class SharedRankingsSlot():
+    def __init__(self, view: memoryview, offset: int, capacity: int, stringCapacity: int, indexSize: int):
+        self.header: memoryview = view[offset:offset + _SLOT_HEADER.size]
+        offset += _SLOT_HEADER.size
+
+        sections: list = []
+        for length in [capacity, capacity, capacity, 2 * capacity + 1, indexSize]:
+            sections.append(view[offset:offset + 8 * length])
+            offset += 8 * length
+
+        self.rawIndex: memoryview = sections[4]
+        self.points, self.userIDs, self.ranks, self.offsets, self.index = [section.cast("q") for section in sections]
+        self.strings: memoryview = view[offset:offset + stringCapacity]
+        self.indexMask: int = indexSize - 1
+
+    @staticmethod
+    def getSize(capacity: int, stringCapacity: int, indexSize: int) -> int:
+        return _SLOT_HEADER.size + 8 * (5 * capacity + 1 + indexSize) + stringCapacity
+
+    def getUserCount(self) -> int:
+        return _SLOT_HEADER.unpack_from(self.header)[0]
+
+    def getLastEventID(self) -> int:
+        return _SLOT_HEADER.unpack_from(self.header)[2]
+
+    # Returns (name, username, points, user ID, rank) of the user at a 0-indexed position
+    def getRow(self, index: int) -> tuple:
+        offsets = self.offsets
+        return (
+            bytes(self.strings[offsets[2 * index]:offsets[2 * index + 1]]).decode("utf-8"),
+            bytes(self.strings[offsets[2 * index + 1]:offsets[2 * index + 2]]).decode("utf-8"),
+            self.points[index], self.userIDs[index], self.ranks[index]
+        )
+
+    def getUsername(self, index: int) -> bytes:
+        return bytes(self.strings[self.offsets[2 * index + 1]:self.offsets[2 * index + 2]])
+
+    # Returns the 0-indexed position of a user, or -1 if they aren't in the slot
+    def findUser(self, username: str) -> int:
+        usernameBytes: bytes = username.encode("utf-8")
+        bucket: int = zlib.crc32(usernameBytes) & self.indexMask
+
+        for _ in range(self.indexMask + 1):     # Bounded, in case the slot is being overwritten under a reader
+            entry: int = self.index[bucket]
+
+            if entry == 0:
+                return -1
+            if self.getUsername(entry - 1) == usernameBytes:
+                return entry - 1
+
+            bucket = (bucket + 1) & self.indexMask
+
+        return -1
+
+    # Returns the number of users that come before the (points, user ID) key in page order, plus the key itself if it's in the slot; binary search
+    def countUsersThroughKey(self, points: int, userID: int) -> int:
+        low, high = 0, self.getUserCount()
+
+        while low < high:
+            middle: int = (low + high) // 2
+
+            if self.points[middle] > points or (self.points[middle] == points and self.userIDs[middle] <= userID):
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    # Returns the number of users with more points than <points>
+    def countUsersAbove(self, points: int) -> int:
+        low, high = 0, self.getUserCount()
+
+        while low < high:
+            middle: int = (low + high) // 2
+
+            if self.points[middle] > points:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    # Fills the slot with <rows> of (name, username, points, user ID), which must be in page order and fit in the slot
+    def fill(self, rows: list[tuple], lastEventID: int) -> None:
+        numUsers: int = len(rows)
+        ranks: array = array("q", bytes(8 * numUsers))
+        offsets: array = array("q", [0])
+        strings: list[bytes] = []
+        stringBytes: int = 0
+        rank: int = 0
+        lastPoints = None
+
+        for index, (name, username, points, _) in enumerate(rows):
+            if points != lastPoints:
+                rank += 1
+                lastPoints = points
+            ranks[index] = rank
+
+            for string in [(name or "").encode("utf-8"), username.encode("utf-8")]:
+                strings.append(string)
+                stringBytes += len(string)
+                offsets.append(stringBytes)
+
+        self.points[:numUsers] = array("q", [row[2] for row in rows])
+        self.userIDs[:numUsers] = array("q", [row[3] for row in rows])
+        self.ranks[:numUsers] = ranks
+        self.offsets[:2 * numUsers + 1] = offsets
+        self.strings[:stringBytes] = b"".join(strings)
+
+        self.rawIndex[:] = bytes(len(self.rawIndex))
+        index, indexMask = self.index, self.indexMask
+        for position, string in enumerate(strings[1::2]):
+            bucket: int = zlib.crc32(string) & indexMask
+
+            while index[bucket] != 0:
+                bucket = (bucket + 1) & indexMask
+
+            index[bucket] = position + 1
+
+        _SLOT_HEADER.pack_into(self.header, 0, numUsers, stringBytes, lastEventID)
+
+    def release(self) -> None:
+        for view in [self.points, self.userIDs, self.ranks, self.offsets, self.index, self.rawIndex, self.strings, self.header]:
+            view.release()
+
+# A memory-mapped ranking file; open it with SharedRankingStore.open() to read it, or with SharedRankingStore.openForWriting() to publish to it
+class SharedRankingStore():
+    def __init__(self, path: str, writable: bool):
+        self.path: str = path
+        self.writable: bool = writable
+        self.file = None
+        self.map: mmap.mmap = None
+        self.view: memoryview = None
+        self.slots: list[SharedRankingsSlot] = []
+        self.capacity: int = 0
+        self.stringCapacity: int = 0
+        self.indexSize: int = 0
+        self.pins: local = local()     # The mapping and sequence counter each thread's reads are pinned to, see pinned()
+        self.lock: RLock = RLock()     # Guards swapping the mapping against the threads starting and finishing reads on it
+        self.readers: int = 0          # Reads in progress on the current mapping
+        self.unmapped: list = []       # Replaced mappings, as (file, map, view, slots, readers), closed once their last read finishes
+
+    # Opens an existing store for reading; None if there is no (usable) store at <path> yet
+    @classmethod
+    def open(cls, path: str):
+        store = cls(path, writable=False)
+        return store if store.__map() else None
+
+    # Opens the store at <path> for publishing (the file itself is only created by the first publish); only one process should publish to a store at a
+    # time (see calculateRankings.py)
+    @classmethod
+    def openForWriting(cls, path: str):
+        store = cls(path, writable=True)
+        store.__map()
+        return store
+
+    # Maps the file at self.path; returns False if it's missing or isn't a store of this version
+    def __map(self) -> bool:
+        if sys.byteorder != "little" or not os.path.isfile(self.path):
+            return False
+
+        file = open(self.path, "r+b" if self.writable else "rb")
+        try:
+            if os.fstat(file.fileno()).st_size < _HEADER.size:
+                raise SharedRankingsError("Truncated shared rankings file")
+
+            fileMap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ)
+        except (SharedRankingsError, ValueError):
+            file.close()
+            return False
+
+        magic, version, _, _, capacity, stringCapacity, indexSize = _HEADER.unpack_from(fileMap)
+        slotSize: int = SharedRankingsSlot.getSize(capacity, stringCapacity, indexSize)
+
+        if magic != SHARED_RANKINGS_MAGIC or version != SHARED_RANKINGS_VERSION or len(fileMap) < _HEADER.size + 2 * slotSize:
+            fileMap.close()
+            file.close()
+            return False
+
+        view: memoryview = memoryview(fileMap)
+        slots: list = [SharedRankingsSlot(view, _HEADER.size + num * slotSize, capacity, stringCapacity, indexSize) for num in range(2)]
+
+        with self.lock:
+            if self.map is not None:
+                self.unmapped.append([self.file, self.map, self.view, self.slots, self.readers])
+                self.__closeUnusedMappings()
+
+            self.file, self.map, self.view, self.slots, self.readers = file, fileMap, view, slots, 0
+            self.capacity, self.stringCapacity, self.indexSize = capacity, stringCapacity, indexSize
+
+        return True
+
+    # Closes the replaced mappings that no read is using any more
+    def __closeUnusedMappings(self) -> None:
+        for mapping in [mapping for mapping in self.unmapped if mapping[4] == 0]:
+            file, fileMap, view, slots, _ = mapping
+            for slot in slots:
+                slot.release()
+
+            view.release()
+            fileMap.close()
+            file.close()
+            self.unmapped.remove(mapping)
+
+    # Registers a read on the current mapping (reopening the path first if the file was retired), and returns the map and slots to read
+    def __startRead(self) -> tuple:
+        with self.lock:
+            if self.isRetired():
+                self.pins.seq, self.pins.map = None, None
+
+                if not self.__map():
+                    raise SharedRankingsError("The shared rankings file was retired, and no new one has been published")
+
+            self.readers += 1
+            return self.map, self.slots
+
+    # Ends a read started on <fileMap>, closing that mapping if it has been replaced and this was its last read
+    def __finishRead(self, fileMap: mmap.mmap) -> None:
+        with self.lock:
+            if fileMap is self.map:
+                self.readers -= 1
+                return
+
+            for mapping in self.unmapped:
+                if mapping[1] is fileMap:
+                    mapping[4] -= 1
+
+            self.__closeUnusedMappings()
+
+    # Publishes <rows> into a new file with room for <capacity> users, which then replaces the one at self.path (the old one is marked as retired, so that its
+    # readers reopen the path; readers never see the new file before it holds the rows)
+    def __create(self, capacity: int, stringCapacity: int, rows: list[tuple], lastEventID: int) -> None:
+        indexSize: int = 1 << (2 * capacity - 1).bit_length()     # At most half full
+        tempPath: str = f"{self.path}.{os.getpid()}.tmp"
+
+        with open(tempPath, "wb") as file:
+            file.write(_HEADER.pack(SHARED_RANKINGS_MAGIC, SHARED_RANKINGS_VERSION, 0, 0, capacity, stringCapacity, indexSize))
+            file.truncate(_HEADER.size + 2 * SharedRankingsSlot.getSize(capacity, stringCapacity, indexSize))
+
+        newStore = SharedRankingStore(tempPath, writable=True)
+        newStore.__map()
+        newStore.publish(rows, lastEventID)
+        newStore.close()
+
+        os.replace(tempPath, self.path)
+
+        if self.map is not None:
+            self.map[_RETIRED_OFFSET] = 1
+
+        self.__map()
+
+    def getSeq(self, fileMap: mmap.mmap = None) -> int:
+        return _SEQ.unpack_from(self.map if fileMap is None else fileMap, _SEQ_OFFSET)[0]
+
+    def isRetired(self) -> bool:
+        return self.map[_RETIRED_OFFSET] != 0
+
+    # Publishes <rows> of (name, username, points, user ID), in page order, as the store's current contents
+    def publish(self, rows: list[tuple], lastEventID: int) -> None:
+        if not self.writable:
+            raise SharedRankingsError("This store was opened for reading only")
+
+        stringBytes: int = sum(len((name or "").encode("utf-8")) + len(username.encode("utf-8")) for name, username, _, _ in rows)
+
+        if self.map is None or len(rows) > self.capacity or stringBytes > self.stringCapacity:
+            self.__create(max(2 * len(rows), MIN_USER_CAPACITY), max(2 * stringBytes, 64 * MIN_USER_CAPACITY), rows, lastEventID)
+            return
+
+        seq: int = self.getSeq()
+        _SEQ.pack_into(self.map, _SEQ_OFFSET, seq + 1)
+        self.slots[(seq // 2 + 1) % 2].fill(rows, lastEventID)
+        _SEQ.pack_into(self.map, _SEQ_OFFSET, seq + 2)
+
+    # Calls read(slot) on the current slot and returns its result, retrying whenever the writer may have overwritten the slot during the call (in which case
+    # whatever read() returned or raised is discarded). The mapping read from stays open until the call returns, even if another thread reopens the path
+    # in the meantime.
+    def read(self, read):
+        while True:
+            fileMap, slots = self.__startRead()
+            error: Exception = None
+            result = None
+
+            try:
+                seq: int = self.getSeq(fileMap)
+                pinnedSeq: int = getattr(self.pins, "seq", None)
+
+                if pinnedSeq is not None and self.pins.map is fileMap and seq - (pinnedSeq & ~1) <= 2:
+                    seq = pinnedSeq
+
+                try:
+                    result = read(slots[(seq // 2) % 2])
+                except Exception as readError:
+                    error = readError
+
+                consistent: bool = self.getSeq(fileMap) - (seq & ~1) <= 2
+            finally:
+                self.__finishRead(fileMap)
+
+            if consistent:
+                if error is not None:
+                    raise error
+
+                return result
+
+    # Within this block, the calling thread's reads keep to the slot that was current when it started, so that several reads answer from the same version.
+    # Readers can't hold the writer back, though: if the writer gets round to overwriting that slot (two publishes later), reads move on to the current one.
+    @contextmanager
+    def pinned(self):
+        if getattr(self.pins, "seq", None) is not None:
+            yield   # Already pinned by an enclosing block
+            return
+
+        self.pins.seq, self.pins.map = self.getSeq(), self.map
+        try:
+            yield
+        finally:
+            self.pins.seq, self.pins.map = None, None
+
+    # Closes the store; reads must not be in progress
+    def close(self) -> None:
+        with self.lock:
+            if self.map is not None:
+                self.unmapped.append([self.file, self.map, self.view, self.slots, 0])
+
+            for mapping in self.unmapped:
+                mapping[4] = 0
+            self.__closeUnusedMappings()
+
+            self.slots, self.view, self.map, self.file, self.readers = [], None, None, None, 0
@@ -0,0 +1,178 @@
+# bench_auth.py - load test for the auth blueprint: seeds a scratch database with users, then drives concurrent sign-ins (auth.login_post) and registrations
+# (auth.register) through the app, and reports the latency percentiles, throughput and SQL statements per request of each
+# To run it, type "python -m benchmarks.bench_auth" from the root of the project; "python -m benchmarks.bench_auth --help" lists the options
+#
+# By default the app runs against a temporary SQLite file that is deleted afterwards. Use --database-uri to run against another database (e.g. a scratch
+# Postgres one); its tables are created if needed, and the seeded users are left in it.
+
+import argparse, os, shutil, sys, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event, insert, select
+from app.src.app import create_app, db
+from app.src.models import User, Points, UserProgress, GradeEnum
+from app.src.utils.passwordHashing import getPasswordHasher
+
+PASSWORD: str = "Bench@12345"
+
+# Counts the SQL statements run by each thread, so that a request's statements can be told apart from those of requests running at the same time
+class StatementCounter():
+    def __init__(self, engine):
+        self.engine = engine
+        self.local: threading.local = threading.local()
+        event.listen(engine, "before_cursor_execute", self.__count)
+
+    def __count(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.local.count = getattr(self.local, "count", 0) + 1
+
+    def get(self) -> int:
+        return getattr(self.local, "count", 0)
+
+    def close(self) -> None:
+        event.remove(self.engine, "before_cursor_execute", self.__count)
+
+class BenchResult():
+    def __init__(self, name: str, latencies: list[float], statements: list[int], statuses: dict, elapsed: float):
+        self.name: str = name
+        self.latencies: list[float] = sorted(latencies)
+        self.statements: list[int] = statements
+        self.statuses: dict = statuses          # HTTP status -> number of responses
+        self.elapsed: float = elapsed
+
+    # Nearest-rank percentile of the latencies, in seconds
+    def getPercentile(self, percent: float) -> float:
+        if not self.latencies:
+            return 0.0
+
+        return self.latencies[min(len(self.latencies) - 1, max(0, -(-len(self.latencies) * percent // 100) - 1))]
+
+    def getThroughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def getStatementsPerRequest(self) -> float:
+        return sum(self.statements) / len(self.statements) if self.statements else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.name:<16} | {len(self.latencies):>6} requests | {self.getThroughput():8.1f} req/s | "
+                f"p50 {self.getPercentile(50) * 1000:8.1f} ms  p95 {self.getPercentile(95) * 1000:8.1f} ms  p99 {self.getPercentile(99) * 1000:8.1f} ms | "
+                f"{self.getStatementsPerRequest():5.1f} SQL/request (max {max(self.statements, default=0)}) | "
+                f"statuses {dict(sorted(self.statuses.items()))}")
+
+def makeApp(databaseURI: str, rounds: int, workers: int):
+    config: dict = {"TESTING": True, "SQLALCHEMY_DATABASE_URI": databaseURI, "BCRYPT_LOG_ROUNDS": rounds}
+
+    if workers is not None:
+        config["PASSWORD_HASH_WORKERS"] = workers
+
+    return create_app(test_config=config)
+
+def getEmail(num: int) -> str:
+    return f"bench{num}@example.com"
+
+# Adds <numUsers> students (with their Points and UserProgress rows, like registration does) in bulk; every one of them shares one password hash, since
+# hashing each password would take far longer than the benchmark itself
+def seedUsers(app, numUsers: int) -> None:
+    with app.app_context():
+        if db.session.scalar(select(User.id).where(User.email == getEmail(0))) is not None:
+            return      # Seeded by an earlier run against the same database
+
+        hashedPassword: str = getPasswordHasher().hashPassword(PASSWORD)
+        db.session.execute(insert(User), [{
+            "name": f"Bench User {num}", "username": f"bench{num}", "email": getEmail(num), "hashed_password": hashedPassword,
+            "age": 15, "grade": GradeEnum.TENTH, "failed_signin_attempts": 0
+        } for num in range(numUsers)])
+
+        userIDs: list[int] = db.session.scalars(select(User.id).where(User.username.like("bench%"))).all()
+        db.session.execute(insert(Points), [{"user_id": userID, "points": 0} for userID in userIDs])
+        db.session.execute(insert(UserProgress), [{
+            "user_id": userID, "xp": 0, "level": 1, "next_level_xp": 1000, "current_streak": 0, "longest_streak": 0
+        } for userID in userIDs])
+        db.session.commit()
+
+# Sends every request in <payloads> to <path> from <concurrency> threads (each with its own test client, i.e. its own cookies), and times each one
+def runRequests(app, name: str, path: str, payloads: list[dict], concurrency: int, counter: StatementCounter) -> BenchResult:
+    clients: threading.local = threading.local()
+    statusesLock: threading.Lock = threading.Lock()
+    statuses: dict = {}
+
+    def send(payload: dict) -> tuple:
+        client = getattr(clients, "client", None)
+
+        if client is None:
+            client = clients.client = app.test_client()
+
+        startStatements: int = counter.get()
+        start: float = time.perf_counter()
+        response = client.post(path, data=payload)
+        latency: float = time.perf_counter() - start
+
+        with statusesLock:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        # A sign-in leaves the client logged in, so it's logged out again before its next request (outside of the timed part)
+        with client.session_transaction() as session:
+            session.clear()
+
+        return latency, counter.get() - startStatements
+
+    start: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results: list[tuple] = list(executor.map(send, payloads))
+    elapsed: float = time.perf_counter() - start
+
+    return BenchResult(name, [latency for latency, _ in results], [statements for _, statements in results], statuses, elapsed)
+
+# Runs the sign-in and registration scenarios against an app whose database has already been seeded with <numUsers> bench users
+def runScenarios(app, numUsers: int, numRequests: int, concurrency: int) -> list[BenchResult]:
+    with app.app_context():
+        counter: StatementCounter = StatementCounter(db.engine)
+
+    try:
+        logins: list[dict] = [{"email": getEmail(num % numUsers), "password": PASSWORD} for num in range(numRequests)]
+        wrongPasswords: list[dict] = [{"email": getEmail(num % numUsers), "password": "Wrong@12345"} for num in range(numRequests)]
+        runID: int = int(time.time())     # Keeps the usernames of each run's registrations unique, for databases that outlive a run
+        registrations: list[dict] = [{
+            "role": "student", "name": f"New Bench User {num}", "username": f"new{runID}_{num}", "date_of_birth": "2010-01-01", "grade": "TENTH",
+            "email": f"new{runID}_{num}@example.com", "confirm_email": f"new{runID}_{num}@example.com", "password": PASSWORD, "confirm_password": PASSWORD
+        } for num in range(numRequests)]
+
+        return [
+            runRequests(app, "login", "/login", logins, concurrency, counter),
+            runRequests(app, "login (wrong pw)", "/login", wrongPasswords, concurrency, counter),
+            runRequests(app, "register", "/register", registrations, concurrency, counter)
+        ]
+    finally:
+        counter.close()
+
+def main(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_auth", description="Load test for sign-ins and registrations")
+    parser.add_argument("--users", type=int, default=10000, help="users to seed the database with (default: 10000)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once (default: 8)")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost (default: 12, as in production)")
+    parser.add_argument("--workers", type=int, default=None, help="password hashing worker processes (default: the app's default)")
+    parser.add_argument("--database-uri", default=None, help="database to run against instead of a temporary SQLite file")
+    args = parser.parse_args(argv)
+
+    tempDir: str = None
+    databaseURI: str = args.database_uri
+
+    if databaseURI is None:
+        tempDir = tempfile.mkdtemp(prefix="bench_auth_")
+        databaseURI = f"sqlite:///{os.path.join(tempDir, 'bench.db')}"
+
+    try:
+        app = makeApp(databaseURI, args.rounds, args.workers)
+        seedUsers(app, args.users)
+
+        print(f"users={args.users} concurrency={args.concurrency} rounds={args.rounds} database={app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]}")
+        for result in runScenarios(app, args.users, args.requests, args.concurrency):
+            print(result)
+
+        with app.app_context():
+            print(f"password hashing: {getPasswordHasher().stats()}")
+    finally:
+        if tempDir is not None:
+            shutil.rmtree(tempDir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,158 @@
+# bench_rankings.py - measures the memory use and throughput of the leaderboard's data structures (UserHashTable + its rank engines) without needing a database
+# To run it, type "python -m benchmarks.bench_rankings" from the root of the project (optionally followed by the number of users, e.g. "... 200000")
+
+import sys, random, time, tracemalloc
+from app.src.utils.calculateRankings import UserEntryNode, UserHashTable, PointsTree, FenwickRankEngine, Leaderboard, chooseRankEngine
+
+# Builds the same set of entries every run, so that numbers are comparable between versions of the leaderboard
+def makeEntries(numUsers: int, maxPoints: int) -> list:
+    rng = random.Random(42)
+    return [UserEntryNode(f"Student {num}", f"student{num}", rng.randint(0, maxPoints), num) for num in range(numUsers)]
+
+def benchInsert(numUsers: int, maxPoints: int) -> None:
+    entries = makeEntries(numUsers, maxPoints)
+
+    tracemalloc.start()
+    startMem, _ = tracemalloc.get_traced_memory()
+    userInfo, rankings = UserHashTable(numUsers), PointsTree()
+
+    for userEntry in entries:
+        userInfo.insertUser(userEntry)
+        rankings.insertUser(userEntry)
+
+    endMem, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # The entries themselves were allocated before tracing started, so count them separately
+    entryBytes = sum(sys.getsizeof(entry) + (sys.getsizeof(entry.__dict__) if hasattr(entry, "__dict__") else 0) for entry in entries)
+
+    # Throughput is measured on a fresh set of structures, without tracemalloc slowing things down
+    entries = makeEntries(numUsers, maxPoints)
+    userInfo, rankings = UserHashTable(numUsers), PointsTree()
+    start = time.perf_counter()
+
+    for userEntry in entries:
+        userInfo.insertUser(userEntry)
+        rankings.insertUser(userEntry)
+
+    elapsed = time.perf_counter() - start
+
+    print(f"users={numUsers:>8} maxPoints={maxPoints:>7} | "
+          f"{(endMem - startMem + entryBytes) / numUsers:7.1f} bytes/user | "
+          f"{numUsers / elapsed:10.0f} inserts/s")
+
+    # Moving users between points values exercises deletion as well
+    rng = random.Random(7)
+    start = time.perf_counter()
+
+    for userEntry in rng.sample(entries, min(numUsers, 20000)):
+        rankings.deleteUser(userEntry)
+        userEntry.points = rng.randint(0, maxPoints)
+        rankings.insertUser(userEntry)
+
+    elapsed = time.perf_counter() - start
+    print(f"{'':>34} | {min(numUsers, 20000) / elapsed:10.0f} updates/s (delete + insert)")
+
+# Cold start of a whole Leaderboard from query rows (already in (points, user ID) order, as the leaderboard's queries return them), which bulk-builds the
+# hash table and rankings; compared against inserting the same users one at a time
+def benchBulkLoad(numUsers: int, maxPoints: int) -> None:
+    rng = random.Random(42)
+    dbEntries = sorted(((f"Student {num}", f"student{num}", rng.randint(0, maxPoints), num) for num in range(numUsers)), key=lambda dbEntry: dbEntry[2:])
+
+    start = time.perf_counter()
+    leaderboard = Leaderboard(None, dbEntries)
+    elapsed = time.perf_counter() - start
+
+    entries = makeEntries(numUsers, maxPoints)
+    start = time.perf_counter()
+    userInfo, rankings = UserHashTable(numUsers), PointsTree()
+
+    for userEntry in entries:
+        userInfo.insertUser(userEntry)
+        rankings.insertUser(userEntry)
+
+    insertElapsed = time.perf_counter() - start
+
+    print(f"users={leaderboard.getUserCount():>8} maxPoints={maxPoints:>7} | bulk load {elapsed:6.2f}s | one at a time {insertElapsed:6.2f}s")
+
+# Worst-case latency of single inserts into a UserHashTable that starts empty and grows the whole way (its rehashing is spread over the inserts that
+# follow a resize, so no one insert should pause for a whole table's worth of entries)
+def benchHashTable(numUsers: int) -> None:
+    entries = makeEntries(numUsers, 0)
+    userInfo = UserHashTable(0)
+    latencies = []
+    start = time.perf_counter()
+
+    for userEntry in entries:
+        insertStart = time.perf_counter()
+        userInfo.insertUser(userEntry)
+        latencies.append(time.perf_counter() - insertStart)
+
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"users={numUsers:>8} hash table | {numUsers / elapsed:10.0f} inserts/s | p99.9 {latencies[len(latencies) * 999 // 1000] * 1e6:7.1f} us | "
+          f"max {latencies[-1] * 1000:7.2f} ms | capacity {userInfo.capacity}")
+
+# Compares the rank engines on the same users: bulk build time and memory, points updates, standing lookups and page reads. The thresholds in
+# chooseRankEngine() come from this (the engine it picks for each case is printed alongside)
+def benchEngines(numUsers: int, maxPoints: int) -> None:
+    entries = sorted(makeEntries(numUsers, maxPoints), key=lambda entry: (entry.points, entry.userID))
+    numOps = min(numUsers, 20000)
+    chosen = chooseRankEngine(numUsers, maxPoints + 1)
+
+    for engineClass in [PointsTree, FenwickRankEngine]:
+        rankings = engineClass()
+        tracemalloc.start()
+        rankings.buildFromSorted(entries)
+        engineBytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rankings = engineClass()
+        start = time.perf_counter()
+        rankings.buildFromSorted(entries)
+        buildElapsed = time.perf_counter() - start
+
+        rng = random.Random(7)
+        start = time.perf_counter()
+
+        for userEntry in rng.sample(entries, numOps):
+            rankings.deleteUser(userEntry)
+            userEntry.points = min(maxPoints, max(0, userEntry.points + rng.randint(-50, 100)))
+            rankings.insertUser(userEntry)
+
+        updateElapsed = time.perf_counter() - start
+        lookups = rng.sample(entries, numOps)
+        start = time.perf_counter()
+
+        for userEntry in lookups:
+            rankings.getStandingByUser(userEntry)
+            rankings.getRankByPoints(userEntry.points)
+
+        lookupElapsed = time.perf_counter() - start
+        starts = [rng.randint(1, numUsers) for _ in range(numOps // 10)]
+        start = time.perf_counter()
+
+        for position in starts:
+            rankings.getUsersByPosition(position, 25)
+
+        pageElapsed = time.perf_counter() - start
+
+        # The updates moved users around, so they're put back for the next engine
+        entries = sorted(makeEntries(numUsers, maxPoints), key=lambda entry: (entry.points, entry.userID))
+
+        print(f"users={numUsers:>8} maxPoints={maxPoints:>8} {engineClass.__name__:<17}{'*' if engineClass is chosen else ' '} | "
+              f"build {buildElapsed:6.2f}s {engineBytes / numUsers:7.1f} bytes/user | {numOps / updateElapsed:8.0f} updates/s | "
+              f"{numOps / lookupElapsed:8.0f} lookups/s | {len(starts) / pageElapsed:7.0f} pages/s")
+
+if __name__ == "__main__":
+    numUsers = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    for maxPoints in [1000, numUsers * 10]:
+        benchInsert(numUsers, maxPoints)
+        benchBulkLoad(numUsers, maxPoints)
+
+    benchHashTable(numUsers)
+
+    # "*" marks the engine chooseRankEngine() picks
+    for maxPoints in [1000, numUsers, numUsers * 10, numUsers * 1000]:
+        benchEngines(numUsers, maxPoints)
@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.src.app import db
+
+# Helpers shared by the test modules; each module still sets up its own app fixture, with whatever config its tests need
+PASSWORD = 'jSmith123-'
+
+def get_email(username):
+    return f'{username}99@gmail.com'
+
+def register(client, role='student', username='jsmith'):
+    return client.post('/register', data={
+        'role': role,
+        'name': 'James Smith',
+        'username': username,
+        'date_of_birth': '2000-10-01',
+        'grade': 'FOURTH',
+        'yrs_experience': '3',
+        'email': get_email(username),
+        'confirm_email': get_email(username),
+        'password': PASSWORD,
+        'confirm_password': PASSWORD
+    })
+
+def login(client, username='jsmith'):
+    return client.post('/login', data={'email': get_email(username), 'password': PASSWORD})
+
+def register_and_login(client, role='student', username='jsmith'):
+    register(client, role, username)
+    return login(client, username)
+
+# Collects the SQL statements run inside the block (optionally only those matching <include>)
+@contextmanager
+def recorded_statements(include=None):
+    statements = []
+    def record_statement(conn, cursor, statement, *args):
+        if include is None or include(statement):
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record_statement)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record_statement)
+
+# Returns the response of the given page, along with the SQL statements it took
+def get_page(client, url, include=None):
+    with recorded_statements(include) as statements:
+        response = client.get(url)
+
+    return response, statements
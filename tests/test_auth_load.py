@@ -0,0 +1,21 @@
+import pytest
+from benchmarks.bench_auth import makeApp, seedUsers, runScenarios
+
+# Runs the auth load harness at a small scale; latencies vary from machine to machine, but the SQL statements each request needs don't, so those are checked
+# to catch extra queries creeping into the sign-in and registration paths
+@pytest.fixture
+def results(tmp_path):
+    app = makeApp(f"sqlite:///{tmp_path / 'bench.db'}", rounds=4, workers=0)
+    seedUsers(app, 50)
+    return {result.name: result for result in runScenarios(app, 50, 20, 2)}
+
+def test_every_request_succeeds(results):
+    for result in results.values():
+        assert result.statuses == {302: 20}
+        assert len(result.latencies) == 20 and result.getThroughput() > 0
+        assert result.getPercentile(50) <= result.getPercentile(95) <= result.getPercentile(99)
+
+# (registering bumps the leaderboard generation, so that the shared leaderboard's writer picks the new user up; see calculateRankings.py)
+@pytest.mark.parametrize("name, maxStatements", [("login", 2), ("login (wrong pw)", 3), ("register", 11)])
+def test_sql_statements_per_request(results, name, maxStatements):
+    assert max(results[name].statements) <= maxStatements
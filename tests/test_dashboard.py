@@ -0,0 +1,58 @@
+import pytest
+from conftest import register_and_login, get_page
+from app.src.app import create_app, db
+from app.src.models import User, UserProgress
+from app.src.utils.dashboardSnapshot import getDashboardCache, getDashboardSnapshot
+
+@pytest.fixture
+def app():
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    register_and_login(client)
+    return client
+
+def test_dashboard_renders_from_the_snapshot(client):
+    client.post('/user_points', data={'num_points': 120})
+    user = User.query.filter_by(username='jsmith').first()
+    progress = UserProgress.query.filter_by(user_id=user.id).one()
+    progress.level, progress.xp, progress.next_level_xp = 3, 400, 1000
+    db.session.commit()
+
+    # The first view builds the snapshot with a single query; after that, neither the dashboard nor its polling touch the database
+    response, statements = get_page(client, '/dashboard')
+    assert len([statement for statement in statements if 'user_progress' in statement]) == 1
+    assert 'Level 3' in response.get_data(as_text=True) and '600 more XP' in response.get_data(as_text=True)
+
+    response, statements = get_page(client, '/dashboard')
+    assert response.status_code == 200 and statements == []
+    response, statements = get_page(client, '/user_points')
+    assert response.get_json() == {'points': 120, 'streak': 0} and statements == []
+
+def test_snapshots_are_refreshed_on_write(client):
+    user = User.query.filter_by(username='jsmith').first()
+    assert getDashboardSnapshot(user.id).points == 0
+
+    # Points awarded through the ledger
+    client.post('/user_points', data={'num_points': 50})
+    assert client.get('/user_points').get_json()['points'] == 50
+
+    # Streak and progress changes made through the session
+    user.streak = 4
+    UserProgress.query.filter_by(user_id=user.id).one().xp = 10
+    db.session.commit()
+    assert client.get('/user_points').get_json()['streak'] == 4
+    assert getDashboardSnapshot(user.id).xp == 10
+
+    # Rolled back changes leave the snapshot alone
+    user.streak = 99
+    db.session.flush()
+    db.session.rollback()
+    assert getDashboardSnapshot(user.id) is getDashboardCache().get(user.id)
@@ -0,0 +1,50 @@
+import re
+import pytest
+from conftest import register_and_login, get_page
+from app.src.app import create_app, db
+from app.src.models import User
+
+@pytest.fixture
+def app():
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+# Returns the statements that read the user or teacher tables while fetching the given page
+def identity_queries(client, url):
+    response, statements = get_page(client, url, include=lambda statement: re.search(r'FROM (user|teacher)\b', statement))
+    assert response.status_code == 200
+    return statements
+
+def test_user_loader_only_queries_the_logged_in_role(client):
+    register_and_login(client)
+
+    # The first page loads the account from the user table only; after that it comes from the identity cache
+    statements = identity_queries(client, '/profile')
+    assert len(statements) == 1 and 'FROM user' in statements[0]
+    assert identity_queries(client, '/profile') == []
+
+def test_teachers_are_loaded_from_the_teacher_table(client):
+    register_and_login(client, 'teacher', 'msmith')
+
+    statements = identity_queries(client, '/teacher')
+    assert len(statements) == 1 and 'FROM teacher' in statements[0]
+    assert identity_queries(client, '/teacher') == []
+
+def test_committed_account_changes_drop_the_cached_account(app, client):
+    register_and_login(client)
+    identity_queries(client, '/profile')
+
+    user = User.query.filter_by(username='jsmith').first()
+    user.name = 'Jim Smith'
+    db.session.commit()
+
+    assert len(identity_queries(client, '/profile')) == 1
+    assert b'Jim Smith' in client.get('/profile').data
@@ -0,0 +1,530 @@
+import re
+import random
+import pytest
+from app.src.app import create_app, db
+from conftest import register_and_login, recorded_statements
+from app.src.models import User, Points, Course, Subject
+from app.src.utils.calculateRankings import Leaderboard, LeaderboardRegistry, UserDoesNotExistError, UserDBError, getLeaderboard, getLeaderboardRegistry, \
+    RankEngine, PointsTree, FenwickRankEngine, UserEntryNode, UserHashTable, RED, SHARD_BYTES_OVERHEAD, SHARD_BYTES_PER_USER, chooseRankEngine
+
+@pytest.fixture
+def app():
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+# Adds users straight into the database (skips password hashing, which is slow and not needed here)
+def add_users(points_list):
+    users = []
+
+    for num, points in enumerate(points_list):
+        user = User(email=f"rank{num}@example.com", username=f"rank{num}", name=f"Rank {num}", hashed_password="-")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Points(user_id=user.id, points=points))
+        users.append(user)
+
+    db.session.commit()
+    return users
+
+# Adds courses, each with the given users enrolled
+def add_courses(*enrolled_users):
+    courses = []
+
+    for num, users in enumerate(enrolled_users):
+        course = Course(name=f"Course {num}", subject_type=Subject.CALCULUS)
+        course.users.extend(users)
+        db.session.add(course)
+        courses.append(course)
+
+    db.session.commit()
+    return courses
+
+# Expected leaderboard page order: most points first, ties broken by user ID
+def expected_order(user_points: dict) -> list:
+    return sorted(user_points, key=lambda user_id: (-user_points[user_id][1], user_id))
+
+# Checks the R-B tree properties and subtree counts of every node; returns the black height of the subtree
+def check_subtree(node, low=None, high=None):
+    if node is None:
+        return 1
+
+    assert (low is None or node.points > low) and (high is None or node.points < high)
+    assert node.left is None or node.left.parent is node
+    assert node.right is None or node.right.parent is node
+    if node.colour == RED:
+        assert not any(child is not None and child.colour == RED for child in [node.left, node.right])
+
+    left_height = check_subtree(node.left, low, node.points)
+    right_height = check_subtree(node.right, node.points, high)
+    assert left_height == right_height
+
+    assert node.numNodes == sum(child.numNodes for child in [node.left, node.right] if child) + 1
+    assert node.numUsers == sum(child.numUsers for child in [node.left, node.right] if child) + len(node.userEntryRefs)
+    return left_height + (node.colour != RED)
+
+def test_points_tree_stays_balanced():
+    rng = random.Random(99)
+    tree = PointsTree()
+    entries = {}
+
+    for step in range(3000):
+        username = f"user{rng.randint(0, 300)}"
+
+        if username in entries and rng.random() < 0.5:
+            tree.deleteUser(entries.pop(username))
+        else:
+            if username in entries:
+                tree.deleteUser(entries[username])
+            entries[username] = UserEntryNode(username, username, rng.randint(0, 150), int(username[4:]))
+            tree.insertUser(entries[username])
+
+        if step % 100 == 0:
+            assert tree.root is None or tree.root.colour != RED
+            check_subtree(tree.root)
+
+    check_subtree(tree.root)
+    order = sorted(entries.values(), key=lambda entry: (-entry.points, entry.userID))
+    assert tree.getUsersByPosition(1, len(order)) == order
+    assert all(entry.nodeRef.points == entry.points for entry in entries.values())
+
+    # Ascending inserts are the worst case for an unbalanced tree; deep trees must not hit the recursion limit either
+    tree = PointsTree()
+    for points in range(20000):
+        tree.insertUser(UserEntryNode("", f"asc{points}", points, points))
+
+    assert tree.getUsersByPosition(1, 1)[0].points == 19999
+    assert len(tree.getAllUsers()) == 20000
+
+# Bulk-built trees must hold the same red-black properties as ones built by inserts, for every size (full and part-full deepest levels alike), and keep
+# taking inserts and deletes afterwards
+@pytest.mark.parametrize("num_nodes", [0, 1, 2, 3, 6, 7, 8, 100, 1023, 1500])
+def test_bulk_built_tree_is_balanced(num_nodes):
+    rng = random.Random(num_nodes)
+    entries = []
+
+    for points in range(num_nodes):  # 1-3 users with each points value
+        entries.extend(UserEntryNode("", f"user{len(entries)}", points * 5, len(entries)) for _ in range(rng.randint(1, 3)))
+    entries.sort(key=lambda entry: (entry.points, entry.userID))
+
+    tree = PointsTree()
+    tree.buildFromSorted(entries)
+    assert tree.root is None or (tree.root.colour != RED and tree.root.numNodes == num_nodes and tree.root.numUsers == len(entries))
+    check_subtree(tree.root)
+
+    order = sorted(entries, key=lambda entry: (-entry.points, entry.userID))
+    assert tree.getUsersByPosition(1, len(order)) == order
+    assert all(entry in entry.nodeRef.userEntryRefs for entry in entries)
+
+    for entry in entries[::3]:
+        tree.deleteUser(entry)
+        entry.points += 1
+        tree.insertUser(entry)
+
+    check_subtree(tree.root)
+    assert tree.getUsersByPosition(1, len(order)) == sorted(entries, key=lambda entry: (-entry.points, entry.userID))
+
+# The hash table must hand back the very entries it was given (the rankings hold references to them) through every resize, including while an
+# incremental rehash is part way through
+def test_hash_table_keeps_entries_through_resizes():
+    rng = random.Random(99)
+    table, entries = UserHashTable(0), {}
+    table.buildFromEntries([UserEntryNode("", f"built{num}", 0, num) for num in range(20)])
+    entries.update({entry.username: entry for entry in table.getAllEntries()})
+    seen_rehash = False
+
+    for step in range(6000):
+        username = f"user{rng.randrange(3000 if step < 4000 else 200)}"
+
+        if username in entries and rng.random() < 0.4:
+            table.deleteUser(username)
+            del entries[username]
+        elif username in entries:
+            assert table.insertUser(UserEntryNode("New name", username, entries[username].points + 1)) == entries[username].points - 1
+            assert entries[username].name == "New name"
+        else:
+            entries[username] = UserEntryNode("", username, 0)
+            assert table.insertUser(entries[username]) is None
+
+        seen_rehash = seen_rehash or table.oldKeys is not None
+        assert table.size == len(entries)
+        if step % 250 == 0 or table.oldKeys is not None:
+            assert all(table.getUser(username) is entry for username, entry in entries.items())
+
+    assert seen_rehash
+    assert sorted(entry.username for entry in table.getAllEntries()) == sorted(entries)
+    with pytest.raises(UserDoesNotExistError):
+        table.getUser("user3000")
+    with pytest.raises(UserDoesNotExistError):
+        table.deleteUser("user3000")
+
+def test_leaderboard_is_bulk_built_from_the_database(app):
+    add_users([40, 10, 40, 70, 10, 40])
+
+    leaderboard = Leaderboard(rankEngine=PointsTree)
+    check_subtree(leaderboard.rankings.root)
+    assert leaderboard.getUserCount() == len(leaderboard.getUsersByPosition(1, 100)) == User.query.count()
+    assert leaderboard.rankings.root.numNodes == len({entry["points"] for entry in leaderboard.getUsersByPosition(1, 100)})
+    assert leaderboard.getStandingByUser("rank1")["points"] == 10
+
+# The Fenwick engine must answer every query exactly as a PointsTree holding the same users does, including after points move outside of its range
+@pytest.mark.parametrize("max_points", [5, 60, 2000])
+def test_fenwick_engine_matches_points_tree(max_points):
+    rng = random.Random(max_points)
+    entries = {f"user{num}": UserEntryNode("", f"user{num}", rng.randint(0, max_points), num) for num in range(80)}
+    ordered = sorted(entries.values(), key=lambda entry: (entry.points, entry.userID))
+    tree, fenwick = PointsTree(), FenwickRankEngine()
+    tree.buildFromSorted(ordered)
+    fenwick.buildFromSorted(ordered)
+
+    for step in range(600):
+        username = f"user{rng.randrange(100)}"
+
+        if username in entries:
+            tree.deleteUser(entries[username])
+            fenwick.deleteUser(entries.pop(username))
+        if rng.random() < 0.8:
+            entries[username] = UserEntryNode("", username, rng.randint(-10, max_points * 3), int(username[4:]))
+            tree.insertUser(entries[username])
+            fenwick.insertUser(entries[username])
+
+        if step % 150 == 0 or step == 599:
+            assert fenwick.getUserCount() == tree.getUserCount() == len(entries)
+            assert fenwick.getDistinctPointsCount() == tree.getDistinctPointsCount()
+            assert fenwick.getAllUsers() == tree.getAllUsers()
+            assert fenwick.getTopUsers() == tree.getTopUsers() and fenwick.getBottomUsers() == tree.getBottomUsers()
+
+            for start in range(len(entries) + 2):
+                assert fenwick.getUsersByPosition(start, 7) == tree.getUsersByPosition(start, 7)
+            for entry in entries.values():
+                assert fenwick.getStandingByUser(entry) == tree.getStandingByUser(entry)
+                assert fenwick.getRankByPoints(entry.points) == tree.getRankByPoints(entry.points)
+                assert fenwick.getUsersThroughKey(entry.points, entry.userID) == tree.getUsersThroughKey(entry.points, entry.userID)
+                assert fenwick.getUsersThroughKey(entry.points + 1, -1) == tree.getUsersThroughKey(entry.points + 1, -1)
+
+    with pytest.raises(UserDBError):
+        fenwick.getUsersByRank(fenwick.getDistinctPointsCount() + 1)
+    with pytest.raises(UserDBError):
+        fenwick.getRankByPoints(max_points * 10)
+
+def test_rank_engine_follows_the_points_range(app):
+    assert chooseRankEngine(100000, 1001) is FenwickRankEngine
+    assert chooseRankEngine(100000, 10 ** 7) is PointsTree
+
+    users = add_users([5, 30, 30, 12, 0])
+    assert isinstance(Leaderboard().rankings, FenwickRankEngine)
+    Points.query.filter_by(user_id=users[0].id).first().points = 10 ** 6
+    db.session.commit()
+    assert isinstance(Leaderboard().rankings, PointsTree)
+
+    app.config["LEADERBOARD_RANK_ENGINE"] = "fenwick"
+    leaderboard = Leaderboard()
+    assert isinstance(leaderboard.rankings, FenwickRankEngine)
+    assert leaderboard.getUsersByPosition(1, 2)[0]["points"] == 10 ** 6
+    assert leaderboard.getBottomRankNum() == 4
+
+def test_rank_engines_implement_the_whole_interface():
+    with pytest.raises(TypeError):
+        RankEngine()
+
+    class PartialEngine(RankEngine):
+        def insertUser(self, userEntry):
+            pass
+
+    with pytest.raises(TypeError):
+        PartialEngine()
+
+    assert not PointsTree.__abstractmethods__ and not FenwickRankEngine.__abstractmethods__
+
+def test_positions_match_database_order(app):
+    add_users([50, 25, 60, 25, 90, 60, 0])
+    leaderboard = Leaderboard()
+
+    rows = db.session.query(User.id, User.username, Points.points).join(Points).order_by(Points.points.desc(), User.id).all()
+    page = leaderboard.getUsersByPosition(1, len(rows))
+
+    assert leaderboard.getUserCount() == len(rows)
+    assert [entry["username"] for entry in page] == [row.username for row in rows]
+    assert [entry["rank"] for entry in page] == list(range(1, len(rows) + 1))
+
+    for position, row in enumerate(rows, start=1):
+        assert leaderboard.getPositionByUser(row.username) == position
+
+    # Slices starting part way through, and past the end of the leaderboard
+    assert [entry["username"] for entry in leaderboard.getUsersByPosition(3, 3)] == [row.username for row in rows[2:5]]
+    assert leaderboard.getUsersByPosition(len(rows) + 1, 10) == []
+
+def test_random_updates_keep_rankings_consistent(app):
+    rng = random.Random(1234)
+    add_users([rng.randint(0, 40) for _ in range(60)])
+    leaderboard = Leaderboard()
+    user_points = {row.id: (row.username, row.points) for row in db.session.query(User.id, User.username, Points.points).join(Points)}
+
+    for _ in range(400):
+        user_id = rng.choice(list(user_points))
+        username, _ = user_points[user_id]
+        new_points = rng.randint(0, 40)
+
+        leaderboard.updateUser(user_id, f"Rank {user_id}", username, new_points)
+        user_points[user_id] = (username, new_points)
+
+    order = expected_order(user_points)
+    page = leaderboard.getUsersByPosition(1, len(order))
+
+    assert leaderboard.getUserCount() == len(order)
+    assert [entry["username"] for entry in page] == [user_points[user_id][0] for user_id in order]
+    assert [entry["points"] for entry in page] == [user_points[user_id][1] for user_id in order]
+
+    for position, user_id in enumerate(order, start=1):
+        assert leaderboard.getPositionByUser(user_points[user_id][0]) == position
+
+    # Dense ranks (users with the same points share a rank) stay consistent as well
+    distinct_points = sorted({points for _, points in user_points.values()}, reverse=True)
+    for rank, points in enumerate(distinct_points, start=1):
+        assert {entry["points"] for entry in leaderboard.getUsersByRank(rank)} == {points}
+
+def test_rank_ranges_walk_the_rankings_once(app):
+    rng = random.Random(5)
+    add_users([rng.randint(0, 30) for _ in range(80)])
+    leaderboard = Leaderboard()
+    bottom_rank = leaderboard.getBottomRankNum()
+
+    assert bottom_rank == len(leaderboard.getAllUsers())
+    assert leaderboard.getUsersByRankRange(1, bottom_rank) == leaderboard.getAllUsers()
+    assert leaderboard.getUsersByRankRange(4, 9) == {rank: leaderboard.getUsersByRank(rank) for rank in range(4, 10)}
+
+    # The generator variant streams the same ranks in chunks
+    assert dict(leaderboard.iterUsersByRankRange(chunkSize=7)) == leaderboard.getAllUsers()
+    assert [rank for rank, _ in leaderboard.iterUsersByRankRange(3, 12, chunkSize=4)] == list(range(3, 13))
+
+    with pytest.raises(UserDBError):
+        leaderboard.getUsersByRankRange(1, bottom_rank + 1)
+
+def test_unknown_user_is_not_ranked(app):
+    add_users([10])
+    leaderboard = Leaderboard()
+
+    with pytest.raises(UserDoesNotExistError):
+        leaderboard.getPositionByUser("nobody")
+
+def test_committed_point_changes_are_applied_as_deltas(app):
+    users = add_users([30, 20, 10])
+    leaderboard = getLeaderboard()
+
+    users[2].points.points += 50
+    db.session.commit()
+    assert leaderboard.getPositionByUser(users[2].username) == 1
+
+    # Rolled back changes never reach the leaderboard
+    users[0].points.points = 1000
+    db.session.flush()
+    db.session.rollback()
+    assert leaderboard.getUsersByPosition(1, 1)[0]["username"] == users[2].username
+
+    # Removing a user's points removes them from the rankings
+    db.session.delete(users[1].points)
+    db.session.commit()
+    with pytest.raises(UserDoesNotExistError):
+        leaderboard.getPositionByUser(users[1].username)
+
+def test_update_data_picks_up_changes_made_outside_the_session(app):
+    users = add_users([30, 20, 10])
+    leaderboard = Leaderboard()
+
+    # Bulk updates bypass the session's flush events, so the leaderboard has to be re-synced with the database
+    db.session.query(Points).filter(Points.user_id == users[2].id).update({Points.points: 99})
+    db.session.query(Points).filter(Points.user_id == users[0].id).delete()
+    db.session.commit()
+    late_user = User(email="late@example.com", username="late", name="Late", hashed_password="-")
+    db.session.add(late_user)
+    db.session.flush()
+    db.session.execute(Points.__table__.insert().values(user_id=late_user.id, points=25))
+    db.session.commit()
+
+    leaderboard.updateData()
+    rows = db.session.query(User.username).join(Points).order_by(Points.points.desc(), User.id).all()
+
+    assert [entry["username"] for entry in leaderboard.getUsersByPosition(1, 10)] == [row.username for row in rows]
+
+def test_leaderboard_api_follows_point_changes(app, client):
+    add_users([30, 20, 10])
+    register_and_login(client)
+
+    response = client.get('/api/leaderboard').get_json()
+    usernames = [entry['username'] for entry in response['leaderboard']]
+
+    assert response['total_users'] == User.query.join(Points).count()
+    assert usernames[:3] == ['rank0', 'rank1', 'rank2']
+    assert 'jsmith' in usernames
+
+    # Points changes are pushed into the process-wide leaderboard without rebuilding it
+    client.post('/user_points', data={'num_points': 100})
+    response = client.get('/api/leaderboard').get_json()
+
+    assert response['leaderboard'][0] == {'rank': 1, 'username': 'jsmith', 'points': 100}
+    assert client.get('/leaderboard').status_code == 200
+
+def test_standings_match_database_counts(app):
+    rng = random.Random(99)
+    add_users([rng.randint(0, 10) for _ in range(40)])
+    leaderboard = Leaderboard()
+    rows = db.session.query(User.id, User.username, Points.points).join(Points).order_by(Points.points.desc(), User.id).all()
+
+    for position, row in enumerate(rows, start=1):
+        higher = [other for other in rows if other.points > row.points]
+        lower = [other for other in rows if other.points < row.points]
+        tied = len(rows) - len(higher) - len(lower)
+
+        assert leaderboard.getStandingByUser(row.username) == {
+            "rank": len({other.points for other in higher}) + 1,
+            "position": position,
+            "points": row.points,
+            "percentile": round(100 * (len(lower) + tied / 2) / len(rows), 1),
+            "total_users": len(rows)
+        }
+
+def test_neighbours_surround_the_user(app):
+    add_users([70, 60, 50, 40, 30, 20, 10])
+    leaderboard = Leaderboard()
+
+    assert [entry["username"] for entry in leaderboard.getNeighboursByUser("rank3", 2)] == ["rank1", "rank2", "rank3", "rank4", "rank5"]
+    assert [entry["rank"] for entry in leaderboard.getNeighboursByUser("rank3", 2)] == [2, 3, 4, 5, 6]
+
+    # Near the top and bottom of the leaderboard there are fewer neighbours on one side
+    assert [entry["username"] for entry in leaderboard.getNeighboursByUser("rank0", 2)] == ["rank0", "rank1", "rank2"]
+    bottom_user = leaderboard.getUsersByPosition(leaderboard.getUserCount(), 1)[0]["username"]     # The seeded user, with no points
+    assert [entry["username"] for entry in leaderboard.getNeighboursByUser(bottom_user, 2)] == ["rank5", "rank6", bottom_user]
+    assert [entry["username"] for entry in leaderboard.getNeighboursByUser("rank6", 0)] == ["rank6"]
+
+def test_standing_api_and_dashboard_answer_from_memory(app, client):
+    add_users([30, 20, 10])
+    register_and_login(client)
+    client.post('/user_points', data={'num_points': 25})
+    client.get('/api/leaderboard')      # Builds the leaderboard and loads the user into the identity cache
+
+    with recorded_statements() as statements:
+        response = client.get('/api/leaderboard/me?k=1').get_json()
+
+    assert not any('FROM points' in statement for statement in statements)
+    assert response['standing']['position'] == 2 and response['standing']['rank'] == 2
+    assert [entry['username'] for entry in response['neighbours']] == ['rank0', 'jsmith', 'rank1']
+
+    page = client.get('/dashboard').get_data(as_text=True)
+    assert "You&#39;re #2" in page or "You're #2" in page
+
+def test_keyset_pages_survive_point_changes(app):
+    users = add_users([90, 80, 80, 80, 70, 60, 50, 40])
+    leaderboard = getLeaderboard()
+
+    first_page, key = leaderboard.getUsersAfterKey(None, 3)
+    assert [entry["username"] for entry in first_page] == ["rank0", "rank1", "rank2"]
+    assert key == (80, users[2].id) == leaderboard.getKeyByPosition(3)
+
+    # A user above the cursor drops below it between page fetches; with positions rank3 would be skipped, but the cursor still points past rank2
+    users[0].points.points = 10
+    db.session.commit()
+
+    second_page, key = leaderboard.getUsersAfterKey(key, 3)
+    assert [entry["username"] for entry in second_page] == ["rank3", "rank4", "rank5"]
+    assert [entry["rank"] for entry in second_page] == [3, 4, 5]
+
+    # Cursors of users that have since moved or left still seek to where they were
+    db.session.delete(users[5].points)
+    db.session.commit()
+    assert [entry["username"] for entry in leaderboard.getUsersAfterKey(key, 2)[0]] == ["rank6", "rank7"]
+
+def test_leaderboard_api_pages_with_cursors(app, client):
+    add_users(list(range(100, 0, -4)))
+    register_and_login(client)
+
+    # The page links the first cursor for leaderboard.js
+    page = client.get('/leaderboard').get_data(as_text=True)
+    cursor = re.search(r'data-next-cursor="([^"]*)"', page).group(1)
+    seen = []
+
+    while cursor:
+        response = client.get('/api/leaderboard', query_string={'cursor': cursor}).get_json()
+        seen += [entry['rank'] for entry in response['leaderboard']]
+        cursor = response['next_cursor']
+
+    per_page = app.config['PER_PAGE']
+    total_users = getLeaderboard().getUserCount()
+    assert seen == list(range(per_page + 1, total_users + 1))
+    assert client.get('/api/leaderboard?cursor=').get_json()['leaderboard'][0]['username'] == 'rank0'
+    assert client.get('/api/leaderboard?cursor=%21%21').status_code == 400
+
+def test_course_leaderboards_only_hold_enrolled_users(app):
+    users = add_users([40, 30, 20, 10])
+    algebra, calculus = add_courses(users[1:3], [users[0], users[3]])
+    registry = getLeaderboardRegistry()
+    course_ids = [algebra.id, calculus.id]
+
+    with recorded_statements() as statements:
+        shards = registry.loadShards(course_ids)
+
+    assert len(statements) == 1     # Both shards come from one grouped query
+    assert [entry["username"] for entry in shards[algebra.id].getUsersByPosition(1, 10)] == [users[1].username, users[2].username]
+    assert [entry["username"] for entry in shards[calculus.id].getUsersByPosition(1, 10)] == [users[0].username, users[3].username]
+    assert getLeaderboard(algebra.id) is shards[algebra.id]
+    assert registry.getPositionByUser(users[2].username, algebra.id) == 2
+    assert registry.getPositionByUser(users[2].username) == 3
+
+    with pytest.raises(UserDoesNotExistError):
+        registry.getPositionByUser(users[0].username, algebra.id)
+
+    # Points changes reach the course shards holding the user, and enrolling a user rebuilds the course's shard
+    users[2].points.points = 100
+    db.session.commit()
+    assert registry.getPositionByUser(users[2].username, algebra.id) == 1
+
+    users[3].courses.append(algebra)
+    db.session.commit()
+    assert registry.getPositionByUser(users[3].username, algebra.id) == 3
+    assert getLeaderboard(calculus.id) is shards[calculus.id]
+
+def test_course_leaderboards_are_only_served_to_their_students_and_teachers(app, client):
+    register_and_login(client, 'student', 'jsmith')
+    jsmith = User.query.filter_by(username='jsmith').first()
+    users = add_users([30, 20])
+    enrolled, other = add_courses([jsmith, users[0]], [users[1]])
+    registry = getLeaderboardRegistry()
+
+    response = client.get('/api/leaderboard', query_string={'course_id': enrolled.id})
+    assert response.status_code == 200 and [entry['username'] for entry in response.get_json()['leaderboard']] == [users[0].username, 'jsmith']
+    assert client.get('/api/leaderboard', query_string={'course_id': other.id}).status_code == 403
+    assert client.get('/api/leaderboard/me', query_string={'course_id': other.id}).status_code == 403
+    assert client.get('/leaderboard', query_string={'course_id': other.id}).status_code == 403
+
+    # Made-up course IDs are turned away without building (or caching) a shard
+    for url in ['/api/leaderboard', '/api/leaderboard/me', '/leaderboard']:
+        assert client.get(url, query_string={'course_id': 99999}).status_code == 404
+    assert list(registry.shards) == [enrolled.id]
+    assert registry.loadShards([99999])[99999].getUserCount() == 0 and 99999 not in registry.shards
+
+    client.get('/logout')
+    register_and_login(client, 'teacher', 'mrsmith')
+    assert client.get('/api/leaderboard', query_string={'course_id': other.id}).get_json()['total_users'] == 1
+
+def test_idle_course_shards_are_evicted_under_the_memory_budget(app):
+    users = add_users([30, 20, 10])
+    courses = add_courses(*[[user] for user in users])
+    registry = LeaderboardRegistry(memoryBudget=2 * (SHARD_BYTES_OVERHEAD + SHARD_BYTES_PER_USER))
+
+    first = registry.getLeaderboard(courses[0].id)
+    registry.getLeaderboard(courses[1].id)
+    assert registry.getLeaderboard(courses[0].id) is first     # Using a shard makes it the most recently used one
+
+    registry.getLeaderboard(courses[2].id)
+    assert list(registry.shards) == [courses[0].id, courses[2].id]
+    assert registry.getShardMemory() <= registry.memoryBudget
+
+    # Evicted shards are rebuilt on demand
+    assert registry.getPositionByUser(users[1].username, courses[1].id) == 1
+    assert courses[0].id not in registry.shards
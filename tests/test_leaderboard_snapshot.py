@@ -0,0 +1,99 @@
+import pytest
+from flask import current_app
+from sqlalchemy import update
+from app.src.app import create_app, db
+from app.src.models import User, Points
+from app.src.utils.calculateRankings import getLeaderboard, getLeaderboardRegistry
+from app.src.utils.leaderboardSnapshot import readLeaderboardSnapshot, writeLeaderboardSnapshot, SNAPSHOT_VERSION
+from app.src.utils.pointsLedger import awardPoints
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return str(tmp_path / "leaderboard.snapshot")
+
+@pytest.fixture
+def app(snapshot_path):
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'LEADERBOARD_SNAPSHOT_PATH': snapshot_path})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def add_users(points_list, first_num=0):
+    users = []
+
+    for num, points in enumerate(points_list, start=first_num):
+        user = User(email=f"snap{num}@example.com", username=f"snap{num}", name=f"Snap {num}", hashed_password="-")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Points(user_id=user.id, points=points))
+        users.append(user)
+
+    db.session.commit()
+    return users
+
+# Drops the process-wide leaderboards, as a worker restart would
+def restart():
+    current_app.extensions.pop("leaderboards", None)
+
+def database_order():
+    rows = db.session.query(User.username, Points.points).join(Points).order_by(Points.points.desc(), User.id).all()
+    return [tuple(row) for row in rows]
+
+def leaderboard_order():
+    leaderboard = getLeaderboard()
+    return [(entry["username"], entry["points"]) for entry in leaderboard.getUsersByPosition(1, leaderboard.getUserCount())]
+
+def test_snapshot_round_trip(snapshot_path):
+    rows = [("Zoë Ålvarez", "zoe", 0, 3), ("", "noname", 5, 1), ("李雷", "lilei", 5, 2), ("Big", "big", 2 ** 40, 7)]
+    size = writeLeaderboardSnapshot(snapshot_path, rows, 42)
+
+    snapshot = readLeaderboardSnapshot(snapshot_path)
+    assert snapshot.rows == rows and snapshot.lastEventID == 42 and snapshot.maxUserID == 7
+    assert size == len(open(snapshot_path, "rb").read())
+
+    writeLeaderboardSnapshot(snapshot_path, [], 0)
+    assert readLeaderboardSnapshot(snapshot_path).rows == []
+
+def test_unusable_snapshots_are_ignored(snapshot_path):
+    assert readLeaderboardSnapshot(snapshot_path) is None
+
+    writeLeaderboardSnapshot(snapshot_path, [("A", "a", 1, 1), ("B", "b", 2, 2)], 1)
+    data = bytearray(open(snapshot_path, "rb").read())
+
+    for corrupt in [data[:-3], data[:-1] + b"?", data[:8] + bytes([SNAPSHOT_VERSION + 1]) + data[9:], b"not a snapshot"]:
+        open(snapshot_path, "wb").write(bytes(corrupt))
+        assert readLeaderboardSnapshot(snapshot_path) is None
+
+def test_restart_loads_the_snapshot_and_catches_up(app, snapshot_path):
+    users = add_users([30, 10, 20, 10])
+    before = leaderboard_order()
+    assert readLeaderboardSnapshot(snapshot_path).rows[-1][1] == before[0][0]   # The cold build saved a snapshot
+
+    # Changes made while the worker is down: an award (in the ledger), a new user, and a change made behind the ledger's back
+    awardPoints(users[1].id, 50, "badge")
+    db.session.commit()
+    add_users([25], first_num=10)
+    db.session.execute(update(Points).where(Points.user_id == users[3].id).values(points=99))
+    db.session.commit()
+
+    restart()
+    order = leaderboard_order()
+    assert ("snap1", 60) in order and ("snap10", 25) in order
+    assert ("snap3", 10) in order   # Only the snapshot and the ledger are read, so the unlogged change isn't picked up
+
+    getLeaderboard().updateData()
+    assert leaderboard_order() == database_order()
+
+def test_removed_users_trigger_a_full_resync(app, snapshot_path):
+    users = add_users([30, 10, 20])
+    getLeaderboardRegistry().saveSnapshot()
+
+    db.session.delete(Points.query.filter_by(user_id=users[0].id).first())
+    db.session.delete(users[0])
+    db.session.commit()
+
+    restart()
+    assert leaderboard_order() == database_order()
+    assert "snap0" not in [username for username, _ in leaderboard_order()]
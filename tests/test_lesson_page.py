@@ -0,0 +1,117 @@
+import pytest
+from conftest import register_and_login, get_page
+from app.src.app import create_app, db
+from app.src.models import Course, Module, Topic, Lesson, Subject
+from app.src.utils.contentCache import ContentCache, getContentCache
+
+@pytest.fixture
+def app():
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    register_and_login(client)
+    return client
+
+# Adds a course with the given number of modules, each with 3 topics of 2 lessons
+def add_course(num_modules):
+    course = Course(name=f"Course with {num_modules} modules", subject_type=Subject.CALCULUS)
+    db.session.add(course)
+    db.session.flush()
+
+    for m_num in range(num_modules):
+        module = Module(name=f"Module {m_num}", course_id=course.id)
+        db.session.add(module)
+        db.session.flush()
+
+        for t_num in range(3):
+            topic = Topic(name=f"Topic {m_num}.{t_num}", module_id=module.id)
+            db.session.add(topic)
+            db.session.flush()
+            db.session.add_all([
+                Lesson(title=f"Lesson {m_num}.{t_num}.{l_num}", learning_objective="-", topic_id=topic.id) for l_num in range(2)
+            ])
+
+    db.session.commit()
+    return course.id
+
+def get_lesson_page(client, course_id):
+    response, statements = get_page(client, f'/lesson/{course_id}')
+
+    assert response.status_code == 200
+    return response.get_data(as_text=True), len(statements)
+
+def test_course_outline_is_loaded_in_a_constant_number_of_queries(client):
+    small_course, large_course = add_course(1), add_course(8)
+    client.get('/profile')   # Loads the logged-in user into the identity cache
+
+    _, small_count = get_lesson_page(client, small_course)
+    page, large_count = get_lesson_page(client, large_course)
+
+    assert large_count == small_count
+    assert "8 MODULES - 24 TOPICS" in page
+    assert page.index("Lesson 0.0.0 - Lesson") < page.index("Lesson 0.0.1 - Lesson") < page.index("Lesson 7.2.1 - Lesson")
+
+def test_course_content_is_cached_until_it_changes(client):
+    course_id = add_course(2)
+    get_lesson_page(client, course_id)
+    cache = getContentCache()
+    misses = cache.misses
+
+    # Hits don't touch the database at all
+    page, num_statements = get_lesson_page(client, course_id)
+    assert num_statements == 0
+    assert cache.misses == misses and cache.hits >= 1
+
+    # Changing any lesson, topic, module or course invalidates the cached outline
+    lesson = Lesson.query.filter_by(title="Lesson 1.2.1").first()
+    lesson.title = "Renamed lesson"
+    db.session.commit()
+
+    page, num_statements = get_lesson_page(client, course_id)
+    assert num_statements > 0
+    assert "Renamed lesson - Lesson" in page and "Lesson 1.2.1 - Lesson" not in page
+
+    db.session.add(Module(name="Late module", course_id=course_id))
+    db.session.commit()
+    assert "3 MODULES - 6 TOPICS" in get_lesson_page(client, course_id)[0]
+
+    # Bulk statements skip the mapper events, but still invalidate the cache
+    Module.query.filter_by(name="Late module").delete()
+    db.session.commit()
+    assert "2 MODULES - 6 TOPICS" in get_lesson_page(client, course_id)[0]
+
+def test_content_cache_entries_expire():
+    cache = ContentCache(ttl=0.0)
+    loads = []
+
+    # Changes made by other processes don't bump this process' version, so entries are only trusted for <ttl> seconds
+    assert cache.get("lesson", 1, lambda: loads.append(1) or "first") == "first"
+    assert cache.get("lesson", 1, lambda: loads.append(2) or "second") == "second"
+    assert loads == [1, 2]
+
+    cache.ttl = 60.0
+    cache.clear()
+    cache.get("lesson", 1, lambda: "third")
+    assert cache.get("lesson", 1, lambda: "fourth") == "third"
+
+def test_lesson_api_is_cached_until_the_lesson_changes(client):
+    course_id = add_course(1)
+    lesson = Lesson.query.filter_by(title="Lesson 0.0.0").first()
+
+    response, _ = get_page(client, f'/api/lesson/{lesson.id}')
+    assert response.get_json()["title"] == "Lesson 0.0.0"
+
+    response, statements = get_page(client, f'/api/lesson/{lesson.id}')
+    assert statements == [] and response.get_json()["title"] == "Lesson 0.0.0"
+
+    lesson.learning_objective = "Factor numbers"
+    db.session.commit()
+    assert get_page(client, f'/api/lesson/{lesson.id}')[0].get_json()["learning_objective"] == "Factor numbers"
+    assert get_page(client, '/api/lesson/99999')[0].status_code == 404
@@ -0,0 +1,71 @@
+import pytest
+from conftest import register, login
+from flask_bcrypt import Bcrypt
+from app.src.app import create_app, db
+from app.src.models import User
+from app.src.utils.passwordHashing import PasswordHasher, PasswordHasherBusyError, getPasswordHasher
+
+@pytest.fixture
+def app():
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'BCRYPT_LOG_ROUNDS': 4})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    register(client)
+    return client
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_hashes_round_trip(workers):
+    hasher = PasswordHasher(workers, maxPending=4, rounds=4)
+    hashed = hasher.hashPassword('jSmith123-')
+
+    assert hashed.startswith('$2b$04$')
+    assert hasher.checkPassword(hashed, 'jSmith123-')
+    assert not hasher.checkPassword(hashed, 'wrong')
+    assert not hasher.checkPassword('not a hash', 'jSmith123-')
+    assert hasher.stats()['pending'] == 0 and hasher.stats()['completed'] == 4
+
+def test_flask_bcrypt_hashes_still_verify(app):
+    hashed = Bcrypt().generate_password_hash('jSmith123-', rounds=4).decode('utf-8')
+    assert getPasswordHasher().checkPassword(hashed, 'jSmith123-')
+
+def test_full_pool_answers_with_a_fast_503(client):
+    hasher = getPasswordHasher()
+    hasher.pending = hasher.maxPending     # As if the pool was busy with other sign-ins
+
+    response = login(client)
+    assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+    assert hasher.stats()['rejected'] == 1
+
+    hasher.pending = 0
+    assert login(client).status_code == 302
+
+def test_hashes_that_would_time_out_are_turned_away_before_queueing():
+    hasher = PasswordHasher(1, maxPending=8, rounds=4, timeout=2.0)
+    hasher.hashPassword('jSmith123-')
+    assert 0 < hasher.stats()['hash_seconds'] < 2.0
+
+    # Two hashes ahead of a third, at a second each, would take it past the timeout
+    hasher.hashSeconds, hasher.pending = 1.0, 2
+    with pytest.raises(PasswordHasherBusyError):
+        hasher.hashPassword('jSmith123-')
+    assert hasher.stats()['rejected'] == 1 and hasher.stats()['pending'] == 2
+
+    hasher.pending = 1
+    assert hasher.hashPassword('jSmith123-').startswith('$2b$04$')
+
+def test_hashes_are_upgraded_to_the_configured_cost_on_login(app, client):
+    user = User.query.filter_by(username='jsmith').first()
+    assert user.hashed_password.startswith('$2b$04$')
+
+    getPasswordHasher().rounds = 5
+    login(client)
+    db.session.refresh(user)
+    assert user.hashed_password.startswith('$2b$05$')
+    assert user.check_password('jSmith123-')
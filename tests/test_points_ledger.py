@@ -0,0 +1,218 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from conftest import register_and_login, recorded_statements
+from app.src.app import create_app, db
+from app.src.models import User, Points, PointsEvent, PointsWindowTotal, PointsRollupState
+from app.src.utils.calculateRankings import getLeaderboard
+from app.src.utils.pointsLedger import awardPoints, awardPointsBatch, openPointsLedger, rebuildPointsTotals, _upsertPoints
+from app.src.utils.pointsRollup import rollupPoints, getWindowStart
+
+@pytest.fixture
+def app():
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def add_users(points_list):
+    users = []
+
+    for num, points in enumerate(points_list):
+        user = User(email=f"ledger{num}@example.com", username=f"ledger{num}", name=f"Ledger {num}", hashed_password="-")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Points(user_id=user.id, points=points))
+        users.append(user)
+
+    db.session.commit()
+    return users
+
+def test_awards_are_not_lost_to_stale_reads(app, client):
+    register_and_login(client, 'student', 'jsmith')
+    user = User.query.filter_by(username='jsmith').first()
+    stale_points = user.points      # Loaded before the other awards below, like a second tab or worker would have
+
+    assert client.post('/user_points', data={'num_points': 100}).get_json()['total_points'] == 100
+    assert client.post('/user_points', data={'num_points': 100}).get_json()['total_points'] == 200
+
+    assert awardPoints(user.id, 50, "badge") == 250
+    db.session.commit()
+
+    assert stale_points.points == 250
+    assert [event.amount for event in PointsEvent.query.filter_by(user_id=user.id).order_by(PointsEvent.id)] == [100, 100, 50]
+    assert getLeaderboard().getUsersByPosition(1, 1)[0] == {'rank': 1, 'name': 'James Smith', 'username': 'jsmith', 'points': 250}
+
+def test_batch_awards_use_one_update(app):
+    users = add_users([10, 20, 30])
+    leaderboard = getLeaderboard()
+    loner = User(email="loner@example.com", username="loner", name="Loner", hashed_password="-")
+    db.session.add(loner)
+    db.session.commit()
+
+    with recorded_statements() as statements:
+        totals = awardPointsBatch([(users[0].id, 100, "badge", None), (users[1].id, 5, "badge", None), (users[0].id, -20, "penalty", None), (loner.id, 40, "badge", None)])
+        db.session.commit()
+
+    assert totals == {users[0].id: 90, users[1].id: 25, loner.id: 40}
+    assert len([statement for statement in statements if statement.startswith("UPDATE points")]) == 1
+    assert [entry['username'] for entry in leaderboard.getUsersByPosition(1, 10)] == ['ledger0', 'loner', 'ledger2', 'ledger1', 'johndoe']
+
+def test_late_deltas_do_not_overwrite_newer_totals(app):
+    users = add_users([0])
+    leaderboard = getLeaderboard()
+    deltas = []
+
+    # Held back from the leaderboard, as if both transactions committed before either's after_commit hook ran
+    for amount in (10, 5):
+        awardPoints(users[0].id, amount, "quiz")
+        deltas.extend(db.session.info.pop("pointsDeltas"))
+        db.session.commit()
+
+    assert [delta.newPoints for delta in deltas] == [10, 15] and deltas[0].version < deltas[1].version
+    leaderboard.applyDeltas([deltas[1]])
+    leaderboard.applyDeltas([deltas[0]])
+    assert leaderboard.getStandingByUser('ledger0')['points'] == 15
+
+def test_first_awards_upsert_the_points_row(app):
+    loner = User(email="loner@example.com", username="loner", name="Loner", hashed_password="-")
+    db.session.add(loner)
+    db.session.commit()
+
+    # As if another transaction inserted the user's row between this one's UPDATE and INSERT: the second insert adds to that row
+    assert _upsertPoints({loner.id: 40}) == {loner.id: 40}
+    assert _upsertPoints({loner.id: 15}) == {loner.id: 55}
+    db.session.commit()
+    assert Points.query.filter_by(user_id=loner.id).count() == 1
+    assert getLeaderboard().getStandingByUser('loner')['points'] == 55
+
+    db.session.add(Points(user_id=loner.id, points=1))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+def test_first_awards_work_before_the_unique_index_is_migrated(app, caplog):
+    db.session.execute(text("DROP INDEX uq_points_user_id"))     # As in a database made before the index, which create_all() doesn't add
+    db.session.commit()
+    loner = User(email="loner@example.com", username="loner", name="Loner", hashed_password="-")
+    db.session.add(loner)
+    db.session.commit()
+
+    assert awardPoints(loner.id, 40, "badge") == 40
+    db.session.commit()
+    assert Points.query.filter_by(user_id=loner.id).one().points == 40
+    assert "flask db upgrade" in caplog.text
+
+def test_totals_can_be_rebuilt_from_the_ledger(app):
+    users = add_users([70, 0])
+    assert openPointsLedger() == 1      # Only users with points get an opening balance
+    assert openPointsLedger() == 0
+
+    awardPoints(users[1].id, 15, "quiz")
+    db.session.commit()
+    db.session.query(Points).update({Points.points: 999})
+    db.session.commit()
+
+    assert rebuildPointsTotals() >= 2
+    assert {user.username: user.points.points for user in users} == {'ledger0': 70, 'ledger1': 15}
+    assert getLeaderboard().getPositionByUser('ledger1') == 2
+
+def test_teachers_cannot_award_themselves_points(app, client):
+    add_users([10])
+    totals = db.session.query(Points.user_id, Points.points).order_by(Points.user_id).all()
+    num_events = PointsEvent.query.count()
+
+    # Teacher IDs overlap with student IDs, so an award made with the teacher's ID would go to a student
+    register_and_login(client, 'teacher', 'msmith')
+    assert client.post('/user_points', data={'num_points': 500}).status_code == 404
+    assert client.get('/user_points').status_code == 404
+
+    assert db.session.query(Points.user_id, Points.points).order_by(Points.user_id).all() == totals
+    assert PointsEvent.query.count() == num_events
+
+def test_batch_endpoint_is_for_teachers_only(app, client):
+    users = add_users([0, 0])
+    awards = {'awards': [{'user_id': users[0].id, 'points': 30}, {'user_id': users[1].id, 'points': 10, 'reason': 'badge'}]}
+
+    register_and_login(client, 'student', 'jsmith')
+    assert client.post('/points/batch', json=awards).status_code == 403
+    client.get('/logout')
+
+    register_and_login(client, 'teacher', 'msmith')
+    assert client.post('/points/batch', json=awards).get_json() == {'totals': {str(users[0].id): 30, str(users[1].id): 10}}
+    assert client.post('/points/batch', json={'awards': [{'user_id': 99999, 'points': 1}]}).status_code == 404
+    assert client.post('/points/batch', json={'awards': [{'points': 1}]}).status_code == 400
+
+def test_window_totals_are_rolled_up_incrementally(app):
+    users = add_users([0, 0])
+    now = datetime.now()
+    awardPoints(users[0].id, 10, "quiz")
+    awardPoints(users[0].id, 5, "quiz")
+    awardPoints(users[1].id, 7, "quiz")
+    db.session.add(PointsEvent(user_id=users[1].id, amount=100, reason="quiz", created_at=now - timedelta(days=40)))
+    db.session.commit()
+
+    assert rollupPoints(batchSize=3) == 4
+    assert rollupPoints() == 0
+
+    def window_totals(window, moment):
+        return {total.user_id: total.points for total in PointsWindowTotal.query.filter_by(window=window, window_start=getWindowStart(window, moment))}
+
+    assert window_totals("week", now) == {users[0].id: 15, users[1].id: 7}
+    assert window_totals("month", now) == {users[0].id: 15, users[1].id: 7}
+    assert window_totals("month", now - timedelta(days=40)) == {users[1].id: 100}
+
+    # Only entries added since the last run are read
+    awardPoints(users[1].id, 20, "quiz")
+    db.session.commit()
+    assert rollupPoints() == 1
+    assert window_totals("week", now) == {users[0].id: 15, users[1].id: 27}
+
+def test_late_committing_entries_are_rolled_up_once(app):
+    users = add_users([0])
+    for amount in (1, 10, 100):
+        awardPoints(users[0].id, amount, "quiz")
+    db.session.commit()
+
+    # The middle entry's transaction hasn't committed when the rollup runs, so only the entries either side of it are visible
+    lateEntry = PointsEvent.query.filter_by(amount=10).one()
+    lastID = PointsEvent.query.filter_by(amount=100).one().id
+    lateValues = {'id': lateEntry.id, 'user_id': lateEntry.user_id, 'amount': lateEntry.amount, 'reason': lateEntry.reason, 'created_at': lateEntry.created_at}
+    db.session.delete(lateEntry)
+    db.session.commit()
+    assert rollupPoints() == 2
+
+    db.session.add(PointsEvent(**lateValues))
+    db.session.commit()
+    assert rollupPoints() == 1
+    assert rollupPoints() == 0
+
+    total = PointsWindowTotal.query.filter_by(window="week", user_id=users[0].id).one()
+    assert total.points == 111
+    assert db.session.query(PointsRollupState.last_event_id).scalar() == lastID
+
+def test_windowed_leaderboards_are_served_from_the_rollup(app, client):
+    register_and_login(client, 'student', 'jsmith')
+    users = add_users([500, 0])
+    awardPoints(users[1].id, 30, "quiz")
+    db.session.add(PointsEvent(user_id=users[0].id, amount=500, reason="opening_balance", created_at=datetime.now() - timedelta(days=40)))
+    db.session.commit()
+
+    # Nothing is in the weekly leaderboard until the rollup has run
+    assert client.get('/api/leaderboard?window=week').get_json()['total_users'] == 0
+    rollupPoints()
+
+    with recorded_statements() as statements:
+        weekly = client.get('/api/leaderboard?window=week').get_json()
+
+    assert [(entry['username'], entry['points']) for entry in weekly['leaderboard']] == [('ledger1', 30)]
+    assert not any('points_event' in statement for statement in statements)
+    assert client.get('/api/leaderboard?window=all').get_json()['leaderboard'][0]['username'] == 'ledger0'
+    assert client.get('/api/leaderboard?window=year').status_code == 400
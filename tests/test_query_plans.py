@@ -0,0 +1,53 @@
+import re
+import pytest
+from sqlalchemy import text
+from app.src.app import create_app, db
+from app.src.models import User, Points, Course, Module, Topic, Lesson, QuizQuestion, QuizAnswer, user_course
+
+@pytest.fixture
+def app():
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+# Returns the steps of SQLite's query plan for a query
+def query_plan(query):
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[3] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+# The queries run by the leaderboard, the lesson page's course outline and the quiz pages
+def hot_queries():
+    return {
+        'leaderboard page': User.query.join(Points).order_by(Points.points.desc()).limit(10),
+        'user points': Points.query.filter_by(user_id=1),
+        'course leaderboard': db.session.query(Course.id, User.name, User.username, Points.points, User.id, Points.id).select_from(Course).outerjoin(
+            user_course, user_course.c.course_id == Course.id
+        ).outerjoin(User, user_course.c.user_id == User.id).outerjoin(Points, Points.user_id == User.id).filter(Course.id.in_([1, 2])).order_by(Course.id),
+        'course modules': Module.query.filter_by(course_id=1).order_by(Module.id),
+        'module topics': Topic.query.filter(Topic.module_id.in_([1, 2])).order_by(Topic.id),
+        'topic lessons': Lesson.query.filter(Lesson.topic_id.in_([1, 2])).order_by(Lesson.id),
+        'quiz questions': QuizQuestion.query.filter(QuizQuestion.quiz_id.in_([1, 2])).order_by(QuizQuestion.id),
+        'quiz answers': QuizAnswer.query.filter(QuizAnswer.quiz_id.in_([1, 2])).order_by(QuizAnswer.id),
+        'question answers': QuizAnswer.query.filter_by(quiz_id=1, quiz_question_id=2),
+    }
+
+HOT_QUERY_NAMES = [
+    'leaderboard page', 'user points', 'course leaderboard', 'course modules', 'module topics', 'topic lessons', 'quiz questions', 'quiz answers', 'question answers'
+]
+
+@pytest.mark.parametrize('name', HOT_QUERY_NAMES)
+def test_hot_queries_use_indexes(app, name):
+    plan = query_plan(hot_queries()[name])
+
+    # Every table is either searched by key or scanned through an index, never scanned row by row
+    assert not [step for step in plan if re.fullmatch(r'SCAN \w+', step)], plan
+    assert any('INDEX' in step for step in plan), plan
+
+def test_leaderboard_order_comes_from_the_points_index(app):
+    plan = query_plan(hot_queries()['leaderboard page'])
+
+    assert 'ix_points_points_user' in plan[0]
+    assert not any('TEMP B-TREE' in step for step in plan), plan
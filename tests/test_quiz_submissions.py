@@ -0,0 +1,189 @@
+import json
+import pytest
+from conftest import register_and_login
+from datetime import datetime
+from app.src.app import create_app, db
+from app.src.models import User, Quiz, QuizQuestion, QuizAnswer, QuizSubmission, PointsEvent
+from app.src.utils import quizSubmit
+from app.src.utils.quizGrading import getAnswerKey, gradeSubmissions, regradeSubmissions
+
+@pytest.fixture
+def app():
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    register_and_login(client)
+    return client
+
+# Adds a quiz whose questions each have one correct answer (the first one), except for the last question where the first two answers are both correct
+def add_quiz(num_questions=3):
+    quiz = Quiz(title="Prime Factorization", active=True, level=1, score=0)
+    db.session.add(quiz)
+    db.session.flush()
+
+    for q_num in range(num_questions):
+        question = QuizQuestion(quiz_id=quiz.id, question_content=f"Question {q_num}")
+        db.session.add(question)
+        db.session.flush()
+        db.session.add_all([
+            QuizAnswer(quiz_id=quiz.id, quiz_question_id=question.id, correct=(a_num == 0 or (a_num == 1 and q_num == num_questions - 1)), answer_content=f"Answer {q_num}.{a_num}")
+            for a_num in range(4)
+        ])
+
+    db.session.commit()
+    return quiz.id
+
+# Returns [(question ID, [answer IDs]), ...] for every question of a quiz, in order
+def answer_ids(quiz_id):
+    questions = QuizQuestion.query.filter_by(quiz_id=quiz_id).order_by(QuizQuestion.id).all()
+    return [(question.id, [answer.id for answer in QuizAnswer.query.filter_by(quiz_question_id=question.id).order_by(QuizAnswer.id)]) for question in questions]
+
+def test_submissions_are_graded_and_stored_in_the_database(client):
+    quiz_id = add_quiz()
+    (q1, a1), (q2, a2), (q3, a3) = answer_ids(quiz_id)
+    user = User.query.filter_by(username='jsmith').first()
+
+    # Right, wrong, and both correct answers of the last question
+    client.get(f'/submit?quiz_id={quiz_id}&question_{q1}={a1[0]}&question_{q2}={a2[3]}&question_{q3}={a3[0]}&question_{q3}={a3[1]}')
+
+    submission = QuizSubmission.query.filter_by(user_id=user.id).one()
+    assert (submission.quiz_id, submission.score, submission.num_questions, submission.points_awarded) == (quiz_id, 2, 3, 67)
+    assert [(answer.user_answer, answer.correct) for answer in submission.answers] == [
+        ("Answer 0.0", True), ("Answer 1.3", False), ("Answer 2.0", True), ("Answer 2.1", True)
+    ]
+    assert db.session.get(User, user.id).points.points == 67
+
+    assert client.get('/submit').status_code == 400
+    assert client.get('/submit?quiz_id=99999').status_code == 404
+
+def test_grading_uses_a_cached_answer_key(app):
+    quiz_id = add_quiz()
+    (q1, a1), (q2, a2), (q3, a3) = answer_ids(quiz_id)
+
+    graded = gradeSubmissions(quiz_id, [
+        {q1: a1[0], q2: a2[0], q3: {a3[0], a3[1]}},
+        {q1: a1[1], q3: a3[0]},     # Missing one of the correct answers of the last question
+        {}
+    ])
+    assert [(result.score, result.numQuestions) for result in graded] == [(3, 3), (0, 3), (0, 3)]
+    assert getAnswerKey(quiz_id) is getAnswerKey(quiz_id)
+
+    # Changing the quiz builds a new answer key
+    QuizAnswer.query.get(a1[1]).correct = True
+    db.session.commit()
+    assert getAnswerKey(quiz_id).correctAnswers[q1] == {a1[0], a1[1]}
+
+def test_teachers_can_regrade_a_quiz(client):
+    quiz_id = add_quiz()
+    (q1, a1), (q2, a2), (q3, a3) = answer_ids(quiz_id)
+    client.get(f'/submit?quiz_id={quiz_id}&question_{q1}={a1[1]}&question_{q2}={a2[0]}')
+
+    # Students can't regrade quizzes
+    assert client.post(f'/quiz/{quiz_id}/regrade').status_code == 403
+
+    # The second answer of the first question was meant to be the right one
+    QuizAnswer.query.get(a1[0]).correct = False
+    QuizAnswer.query.get(a1[1]).correct = True
+    db.session.commit()
+
+    assert regradeSubmissions(quiz_id) == 1
+    submission = QuizSubmission.query.filter_by(quiz_id=quiz_id).one()
+    assert submission.score == 2
+    assert [answer.correct for answer in submission.answers] == [True, True, False]
+
+def test_teachers_cannot_submit_quizzes(app):
+    quiz_id = add_quiz()
+    (q1, a1), _, _ = answer_ids(quiz_id)
+    client = app.test_client()
+    register_and_login(client, 'teacher', 'msmith')
+
+    assert client.get(f'/submit?quiz_id={quiz_id}&question_{q1}={a1[0]}').status_code == 403
+    assert QuizSubmission.query.count() == 0 and PointsEvent.query.count() == 0
+
+def test_json_responses_are_imported_once(app, tmp_path):
+    user = User(email="import@example.com", username="importer", name="Importer", hashed_password="-")
+    db.session.add(user)
+    db.session.commit()
+
+    responses = {
+        "2024-03-24 10:15:00.123456": {
+            "data": [
+                {"number": "1", "question": "Which of the following is not a prime number?", "answers": "['2', '3', '4', '5']", "user_answer": "4", "correct": True},
+                {"number": "2", "question": "What is the prime factorization of 150?", "answers": "[]", "user_answer": "3² + 4² + 5³", "correct": False}
+            ],
+            "module": "1",
+            "topic": "2",
+            "user_id": user.id,
+            "points": 1,
+            "score": "1/2"
+        }
+    }
+    path = tmp_path / "responses.json"
+    path.write_text(json.dumps(responses))
+
+    assert quizSubmit.import_responses(str(path)) == 1
+    assert quizSubmit.import_responses(str(path)) == 0    # Already imported submissions are skipped
+
+    submission = QuizSubmission.query.one()
+    assert submission.submitted_at == datetime(2024, 3, 24, 10, 15, 0, 123456)
+    assert (submission.user_id, submission.score, submission.num_questions) == (user.id, 1, 2)
+    assert [answer.user_answer for answer in submission.answers] == ["4", "3² + 4² + 5³"]
+
+# Adds a submission (without answers) for each of the given times
+def add_submissions(user_id, times, quiz_id=None):
+    db.session.add_all([
+        QuizSubmission(user_id=user_id, quiz_id=quiz_id, submitted_at=submitted_at, score=num % 3, num_questions=3) for num, submitted_at in enumerate(times)
+    ])
+    db.session.commit()
+
+def test_submissions_are_paginated_with_a_cursor(client):
+    user = User.query.filter_by(username='jsmith').first()
+    other_user = User(email="other@example.com", username="other", name="Other", hashed_password="-")
+    db.session.add(other_user)
+    db.session.commit()
+
+    # Some submissions share a submission time, so pages have to break ties by ID
+    times = [datetime(2024, 9, day // 2 + 1, 12) for day in range(10)]
+    add_submissions(user.id, times)
+    add_submissions(other_user.id, times)
+
+    seen, cursor = [], None
+    while True:
+        page = client.get('/submissions', query_string={'limit': 3, **({'cursor': cursor} if cursor else {})}).get_json()
+        seen += page['submissions']
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    # Students only see their own submissions, each exactly once and in order of submission time
+    assert [submission['user_id'] for submission in seen] == [user.id] * 10
+    assert len({submission['id'] for submission in seen}) == 10
+    assert [submission['submitted_at'] for submission in seen] == [submitted_at.isoformat() for submitted_at in times]
+
+    page = client.get('/submissions', query_string={'since': '2024-09-02', 'until': '2024-09-04'}).get_json()
+    assert [submission['submitted_at'][:10] for submission in page['submissions']] == ['2024-09-02'] * 2 + ['2024-09-03'] * 2
+
+    assert client.get('/submissions', query_string={'since': 'yesterday'}).status_code == 400
+    assert client.get('/submissions', query_string={'cursor': '!!'}).status_code == 400
+
+def test_submissions_can_be_streamed_as_ndjson(client, monkeypatch):
+    monkeypatch.setattr(quizSubmit, "SUBMISSIONS_STREAM_BATCH_SIZE", 4)
+    user = User.query.filter_by(username='jsmith').first()
+    times = [datetime(2024, 9, 1, hour) for hour in range(10)]
+    add_submissions(user.id, times)
+
+    response = client.get('/submissions?format=ndjson')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert [row['submitted_at'] for row in rows] == [submitted_at.isoformat() for submitted_at in times]
+
+    client.get('/logout')
+    assert client.get('/submissions').status_code == 302    # Redirected to the login page
@@ -0,0 +1,60 @@
+import pytest
+from conftest import register_and_login, get_page
+from app.src.app import create_app, db
+from app.src.models import Quiz, QuizQuestion, QuizAnswer
+
+@pytest.fixture
+def app():
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    register_and_login(client)
+    return client
+
+# Adds quizzes with 3 questions of 4 answers each (the first answer being the correct one)
+def add_quizzes(num_quizzes):
+    for num in range(num_quizzes):
+        quiz = Quiz(title=f"Quiz {num}", active=True, level=1, score=0)
+        db.session.add(quiz)
+        db.session.flush()
+
+        for q_num in range(3):
+            question = QuizQuestion(quiz_id=quiz.id, question_content=f"Quiz {num} question {q_num}")
+            db.session.add(question)
+            db.session.flush()
+            db.session.add_all([
+                QuizAnswer(quiz_id=quiz.id, quiz_question_id=question.id, correct=(a_num == 0), answer_content=f"Answer {a_num}") for a_num in range(4)
+            ])
+
+    db.session.commit()
+
+# Returns the JSON response of /quizzes, along with the number of SQL statements it took
+def get_quizzes(client):
+    response, statements = get_page(client, '/quizzes')
+    assert response.status_code == 200
+    return response.get_json(), len(statements)
+
+def test_quizzes_are_loaded_in_a_constant_number_of_queries(client):
+    add_quizzes(1)
+    quizzes, few_quizzes_count = get_quizzes(client)
+    assert len(quizzes) == 1
+
+    add_quizzes(10)
+    quizzes, many_quizzes_count = get_quizzes(client)
+
+    assert len(quizzes) == 11
+    assert many_quizzes_count == few_quizzes_count
+
+    for quiz in quizzes:
+        assert [question["question_content"] for question in quiz["questions"]] == [f"{quiz['title']} question {q_num}" for q_num in range(3)]
+
+        for question in quiz["questions"]:
+            assert [answer["answer_content"] for answer in question["question_answers"]] == [f"Answer {a_num}" for a_num in range(4)]
+            assert [answer["answer_correct"] for answer in question["question_answers"]] == [True, False, False, False]
@@ -0,0 +1,180 @@
+import random
+import threading
+import multiprocessing
+import pytest
+from app.src.app import create_app, db
+from app.src.models import User, Points
+from app.src.utils.calculateRankings import Leaderboard, SharedLeaderboard, UserDoesNotExistError, getLeaderboard, getLeaderboardRegistry
+from app.src.utils.sharedRankings import SharedRankingStore, MIN_USER_CAPACITY
+from app.src.utils.pointsLedger import awardPoints, rebuildPointsTotals
+
+@pytest.fixture
+def shared_path(tmp_path):
+    return str(tmp_path / "leaderboard.shared")
+
+@pytest.fixture
+def app(shared_path):
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'LEADERBOARD_SHARED_PATH': shared_path})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def make_rows(num_users, max_points, seed=5):
+    rng = random.Random(seed)
+    rows = [(f"Name {num} ü", f"user{num}", rng.randint(0, max_points), num + 1) for num in range(num_users)]
+    return sorted(rows, key=lambda row: (row[2], row[3]))
+
+# Publishes a leaderboard built from <rows> to a new store, and returns both it and a SharedLeaderboard reading the store
+def publish(shared_path, rows):
+    leaderboard = Leaderboard(None, rows)
+    writer = SharedRankingStore.openForWriting(shared_path)
+    writer.publish(list(reversed(leaderboard.getSnapshotRows())), 7)
+    return leaderboard, writer, SharedLeaderboard(SharedRankingStore.open(shared_path))
+
+def test_shared_leaderboard_answers_like_the_local_one(shared_path):
+    assert SharedRankingStore.open(shared_path) is None     # Nothing published yet
+    leaderboard, _, shared = publish(shared_path, make_rows(300, 40))
+
+    assert shared.getUserCount() == leaderboard.getUserCount() == 300
+    assert shared.getBottomRankNum() == leaderboard.getBottomRankNum()
+    assert shared.getLastEventID() == 7
+    assert shared.getUsersByPosition(1, 400) == leaderboard.getUsersByPosition(1, 400)
+    assert shared.getUsersByPosition(290, 20) == leaderboard.getUsersByPosition(290, 20)
+
+    for num in range(300):
+        username = f"user{num}"
+        assert shared.getRankByUser(username) == leaderboard.getRankByUser(username)
+        assert shared.getStandingByUser(username) == leaderboard.getStandingByUser(username)
+        assert shared.getNeighboursByUser(username, 2) == leaderboard.getNeighboursByUser(username, 2)
+
+    key, shared_pages, local_pages = None, [], []
+    while True:
+        entries, key = shared.getUsersAfterKey(key, 7)
+        if not entries:
+            break
+        shared_pages.append(entries)
+        assert shared.getKeyByPosition(entries[-1]["rank"]) == key == leaderboard.getKeyByPosition(entries[-1]["rank"])
+
+    assert [entry for page in shared_pages for entry in page] == leaderboard.getUsersByPosition(1, 300)
+    assert shared.getKeyByPosition(0) is None and shared.getKeyByPosition(301) is None
+
+    with pytest.raises(UserDoesNotExistError):
+        shared.getStandingByUser("nobody")
+
+def test_readers_follow_publishes_and_regrown_files(shared_path):
+    _, writer, shared = publish(shared_path, make_rows(10, 5))
+
+    # Outgrowing the file moves the store to a bigger one; readers of the old one switch over
+    rows = make_rows(MIN_USER_CAPACITY + 1, 1000, seed=6)
+    writer.publish(list(reversed(Leaderboard(None, rows).getSnapshotRows())), 8)
+    assert shared.getUserCount() == MIN_USER_CAPACITY + 1 and shared.getLastEventID() == 8
+
+    writer.publish([("Only", "only", 1, 1)], 9)
+    assert shared.getUsersByPosition(1, 5) == [{"rank": 1, "name": "Only", "username": "only", "points": 1}]
+
+def test_reads_overlapping_a_slot_rewrite_are_retried(shared_path):
+    _, writer, shared = publish(shared_path, [("A", "a", 1, 1)])
+    calls = []
+
+    # Two publishes during one read means the slot being read was rewritten under it
+    def read(slot):
+        calls.append(slot.getRow(0))
+        if len(calls) == 1:
+            writer.publish([("B", "b", 2, 2)], 1)
+            writer.publish([("C", "c", 3, 3)], 2)
+        return slot.getRow(0)
+
+    assert shared.store.read(read)[1] == "c"
+    assert len(calls) == 2
+
+    # One publish during a read leaves the slot being read alone, and reads within a pinned block keep to one version
+    with shared.lock:
+        before = shared.getUsersByPosition(1, 1)
+        writer.publish([("D", "d", 4, 4)], 3)
+        assert shared.getUsersByPosition(1, 1) == before
+    assert shared.getUsersByPosition(1, 1)[0]["username"] == "d"
+
+def test_reads_in_progress_keep_a_retired_file_mapped(shared_path):
+    _, writer, shared = publish(shared_path, [("A", "a", 1, 1)])
+    counts = []
+
+    # Another thread reopening the path mid-read must not unmap the slot being read
+    def read(slot):
+        writer.publish(list(reversed(Leaderboard(None, make_rows(MIN_USER_CAPACITY + 1, 1000, seed=6)).getSnapshotRows())), 8)
+        thread = threading.Thread(target=lambda: counts.append(shared.getUserCount()))
+        thread.start()
+        thread.join()
+        return slot.getRow(0)
+
+    assert shared.store.read(read)[1] == "a"
+    assert counts == [MIN_USER_CAPACITY + 1]
+    assert shared.store.unmapped == []      # Closed once the read finished
+    assert shared.getUserCount() == MIN_USER_CAPACITY + 1
+
+def read_standing(shared_path, connection):
+    connection.send(SharedLeaderboard(SharedRankingStore.open(shared_path)).getStandingByUser("user3"))
+
+def test_other_processes_read_the_same_leaderboard(shared_path):
+    leaderboard, _, _ = publish(shared_path, make_rows(50, 10))
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.get_context("fork").Process(target=read_standing, args=(shared_path, sender))
+    process.start()
+
+    assert receiver.recv() == leaderboard.getStandingByUser("user3")
+    process.join()
+
+def test_registry_publishes_and_serves_the_shared_leaderboard(app):
+    users = []
+    for num, points in enumerate([30, 10, 20]):
+        user = User(email=f"shared{num}@example.com", username=f"shared{num}", name=f"Shared {num}", hashed_password="-")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Points(user_id=user.id, points=points))
+        users.append(user)
+    db.session.commit()
+
+    registry = getLeaderboardRegistry()
+    assert not isinstance(getLeaderboard(), SharedLeaderboard)     # Served locally until the first publish
+    assert registry.publishSharedLeaderboard()
+    assert not registry.publishSharedLeaderboard()                # Nothing changed since
+
+    registry.sharedLeaderboard = None   # As in a worker that started after the first publish
+    assert isinstance(getLeaderboard(), SharedLeaderboard)
+
+    awardPoints(users[1].id, 100, "badge")
+    db.session.commit()
+    assert registry.publishSharedLeaderboard()
+    assert getLeaderboard().getStandingByUser("shared1")["position"] == 1
+
+def test_changes_outside_the_ledger_are_republished(app):
+    users = []
+    for num, points in enumerate([30, 10, 20]):
+        user = User(email=f"shared{num}@example.com", username=f"shared{num}", name=f"Shared {num}", hashed_password="-")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Points(user_id=user.id, points=points))
+        users.append(user)
+    db.session.commit()
+
+    registry = getLeaderboardRegistry()
+    assert registry.publishSharedLeaderboard()
+    registry.sharedLeaderboard = None
+
+    # None of these leave a ledger entry
+    users[0].name = "Renamed"
+    db.session.commit()
+    assert registry.publishSharedLeaderboard()
+    assert getLeaderboard().getUsersByPosition(1, 1)[0]["name"] == "Renamed"
+
+    db.session.delete(Points.query.filter_by(user_id=users[2].id).one())
+    db.session.commit()
+    assert registry.publishSharedLeaderboard()
+    with pytest.raises(UserDoesNotExistError):
+        getLeaderboard().getStandingByUser("shared2")
+
+    rebuildPointsTotals()     # shared1's 10 points were never awarded through the ledger
+    assert registry.publishSharedLeaderboard()
+    assert getLeaderboard().getStandingByUser("shared1")["points"] == 0
+    assert not registry.publishSharedLeaderboard()